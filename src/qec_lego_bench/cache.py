@@ -0,0 +1,78 @@
+"""
+Process-local caches shared by the decoders and the sample generation
+
+The in-process layer is a small LRU cache; artifacts that are expensive to rebuild can also be
+persisted in the cache directory, which defaults to `~/.cache/qec_lego_bench` and can be changed
+by setting the environment variable `QEC_LEGO_BENCH_CACHE_DIR` (set it to an empty string to
+disable the on-disk layer).
+"""
+
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+import hashlib
+import os
+import stim
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+CACHE_DIR_ENV = "QEC_LEGO_BENCH_CACHE_DIR"
+
+
+class LRUCache(Generic[K, V]):
+    def __init__(self, maxsize: int = 128):
+        assert maxsize > 0
+        self.maxsize = maxsize
+        self.entries: OrderedDict[K, V] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self.entries
+
+    def get(self, key: K) -> Optional[V]:
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key: K, value: V) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def get_or_create(self, key: K, factory: Callable[[], V]) -> V:
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+def cache_dir(*subdirs: str) -> Optional[str]:
+    """return the on-disk cache directory (created if missing), or None if it is disabled"""
+    root = os.environ.get(
+        CACHE_DIR_ENV, os.path.join(os.path.expanduser("~"), ".cache", "qec_lego_bench")
+    )
+    if root == "":
+        return None
+    directory = os.path.join(root, *subdirs)
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return None  # e.g. read-only file system; simply run without the disk layer
+    return directory
+
+
+def dem_hash(dem: stim.DetectorErrorModel) -> str:
+    """content hash of a detector error model; repeat blocks are hashed without unrolling"""
+    return hashlib.sha256(str(dem).encode("utf8")).hexdigest()
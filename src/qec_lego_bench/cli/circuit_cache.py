@@ -0,0 +1,184 @@
+"""
+Cache of the noisy circuits, DEMs and compiled detector samplers used by the sample generation
+
+Building a code, applying the noise models and computing the detector error model only depend on
+(code, noise, noise2, noise3) and the decompose flag, not on the number of shots or the seed.
+They are memoized in bounded in-process LRU caches; the circuit and the DEM are also persisted in
+the on-disk cache directory (see `qec_lego_bench.cache`), keyed by a hash of the sources that
+build the circuits as well, so that an edit of the code constructions or noise models (which does
+not change the package version in a development install) never returns a stale circuit.
+
+A seeded sampler cannot be shared because its random state advances with every call, so a seeded
+sampler is always compiled from the (cached) circuit; only the unseeded sampler is reused.
+"""
+
+from typing import Optional
+import hashlib
+import os
+import stim
+from qec_lego_bench.cache import LRUCache, cache_dir
+from qec_lego_bench.misc.telemetry import phase
+from .codes import CodeCli
+from .noises import NoiseCli
+
+CircuitKey = tuple[str, str, str, str]
+
+noisy_circuit_cache: LRUCache[CircuitKey, stim.Circuit] = LRUCache(maxsize=32)
+dem_cache: LRUCache[tuple[CircuitKey, bool], stim.DetectorErrorModel] = LRUCache(
+    maxsize=32
+)
+detector_sampler_cache: LRUCache[CircuitKey, stim.CompiledDetectorSampler] = LRUCache(
+    maxsize=8
+)
+
+
+def circuit_key_of(
+    code: CodeCli | str,
+    noise: NoiseCli | str = "NoNoise",
+    noise2: NoiseCli | str = "NoNoise",
+    noise3: NoiseCli | str = "NoNoise",
+) -> CircuitKey:
+    return (str(code), str(noise), str(noise2), str(noise3))
+
+
+def noisy_circuit_of(
+    code: CodeCli | str,
+    noise: NoiseCli | str = "NoNoise",
+    noise2: NoiseCli | str = "NoNoise",
+    noise3: NoiseCli | str = "NoNoise",
+) -> stim.Circuit:
+    code_instance = CodeCli(code)()
+    noise_instance = NoiseCli(noise)()
+    noise2_instance = NoiseCli(noise2)()
+    noise3_instance = NoiseCli(noise3)()
+
+    ideal_circuit = code_instance.circuit
+    return noise3_instance(noise2_instance(noise_instance(ideal_circuit)))
+
+
+# the sources that the noisy circuits and the DEMs depend on, relative to the package root
+_CIRCUIT_SOURCES = [
+    "codes",
+    "noises",
+    "cli/codes.py",
+    "cli/noises.py",
+    "cli/util.py",
+    "cli/circuit_cache.py",
+]
+_circuit_sources_hash: Optional[str] = None
+
+
+def _circuit_sources_hash_of() -> str:
+    global _circuit_sources_hash
+    if _circuit_sources_hash is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        paths: list[str] = []
+        for source in _CIRCUIT_SOURCES:
+            path = os.path.join(root, source)
+            if os.path.isdir(path):
+                for directory, _, filenames in os.walk(path):
+                    paths.extend(
+                        os.path.join(directory, filename)
+                        for filename in filenames
+                        if filename.endswith(".py")
+                    )
+            else:
+                paths.append(path)
+        digest = hashlib.sha256()
+        for path in sorted(paths):
+            digest.update(os.path.relpath(path, root).encode("utf8"))
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        _circuit_sources_hash = digest.hexdigest()
+    return _circuit_sources_hash
+
+
+def _disk_path_of(key: CircuitKey, suffix: str) -> Optional[str]:
+    directory = cache_dir("circuits")
+    if directory is None:
+        return None
+    from qec_lego_bench import __version__
+
+    digest = hashlib.sha256(
+        repr((__version__, _circuit_sources_hash_of()) + key).encode("utf8")
+    ).hexdigest()
+    return os.path.join(directory, digest + suffix)
+
+
+def _save_atomic(obj: stim.Circuit | stim.DetectorErrorModel, path: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        obj.to_file(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # the disk layer is best effort
+
+
+def cached_noisy_circuit(
+    code: CodeCli | str,
+    noise: NoiseCli | str = "NoNoise",
+    noise2: NoiseCli | str = "NoNoise",
+    noise3: NoiseCli | str = "NoNoise",
+) -> stim.Circuit:
+    """the noisy circuit of the code; do not modify the returned circuit in place"""
+    key = circuit_key_of(code, noise, noise2, noise3)
+    circuit = noisy_circuit_cache.get(key)
+    if circuit is not None:
+        return circuit
+    path = _disk_path_of(key, ".stim")
+    if path is not None and os.path.exists(path):
+        circuit = stim.Circuit.from_file(path)
+    else:
+        with phase("circuit"):
+            circuit = noisy_circuit_of(code, noise, noise2, noise3)
+        if path is not None:
+            _save_atomic(circuit, path)
+    noisy_circuit_cache.put(key, circuit)
+    return circuit
+
+
+def cached_detector_error_model(
+    code: CodeCli | str,
+    noise: NoiseCli | str = "NoNoise",
+    noise2: NoiseCli | str = "NoNoise",
+    noise3: NoiseCli | str = "NoNoise",
+    *,
+    decompose_errors: bool = False,
+) -> stim.DetectorErrorModel:
+    """the DEM used by `generate_samples`; do not modify the returned DEM in place"""
+    key = circuit_key_of(code, noise, noise2, noise3)
+    dem = dem_cache.get((key, decompose_errors))
+    if dem is not None:
+        return dem
+    path = _disk_path_of(key, f".{int(decompose_errors)}.dem")
+    if path is not None and os.path.exists(path):
+        dem = stim.DetectorErrorModel.from_file(path)
+    else:
+        circuit = cached_noisy_circuit(code, noise, noise2, noise3)
+        with phase("dem"):
+            dem = circuit.detector_error_model(
+                decompose_errors=decompose_errors,
+                approximate_disjoint_errors=True,
+            )
+        if path is not None:
+            _save_atomic(dem, path)
+    dem_cache.put((key, decompose_errors), dem)
+    return dem
+
+
+def cached_detector_sampler(
+    code: CodeCli | str,
+    noise: NoiseCli | str = "NoNoise",
+    noise2: NoiseCli | str = "NoNoise",
+    noise3: NoiseCli | str = "NoNoise",
+    *,
+    seed: int | None = None,
+) -> stim.CompiledDetectorSampler:
+    circuit = cached_noisy_circuit(code, noise, noise2, noise3)
+    with phase("sampling"):
+        if seed is not None:
+            return circuit.compile_detector_sampler(seed=seed)
+        key = circuit_key_of(code, noise, noise2, noise3)
+        return detector_sampler_cache.get_or_create(
+            key, lambda: circuit.compile_detector_sampler()
+        )
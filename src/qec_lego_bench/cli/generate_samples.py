@@ -1,7 +1,24 @@
 import arguably
+from typing import Any, Callable, Iterator, Optional
 from qec_lego_bench.decoders.profiling_decoder import ProfilingDecoder
+from qec_lego_bench.cli.circuit_cache import (
+    cached_detector_error_model,
+    cached_detector_sampler,
+    cached_noisy_circuit,
+)
+from qec_lego_bench.misc.telemetry import phase, record_phase
+from qec_lego_bench.misc.logical_errors import (
+    count_b8_file_errors,
+    count_bit_packed_errors,
+)
+from qec_lego_bench.decoders.decoder_pool import (
+    decoder_pool,
+    decode_b8_file,
+    decode_bit_packed,
+)
 from dataclasses import dataclass
 from dataclasses_json import dataclass_json
+import sinter
 import stim
 import tempfile
 from .util import *
@@ -9,7 +26,11 @@ from .codes import *
 from .noises import *
 from .decoders import *
 import tempfile
+import atexit
 import hashlib
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import os
 import numpy as np
 from pathlib import Path
@@ -39,14 +60,15 @@ def generate_samples(
     decoder: DecoderCli = "mwpf",  # type: ignore
     seed: int | None = None,
     no_print: bool = False,
+    workers: int = 1,  # sample shards in parallel processes; deterministic given the seed and the number of workers
+    shard_manifest: bool = False,  # keep the shards and write a .shards.json manifest instead of concatenating them
 ):
-    code_instance = CodeCli(code)()
-    noise_instance = NoiseCli(noise)()
-    noise2_instance = NoiseCli(noise2)()
-    noise3_instance = NoiseCli(noise3)()
-
-    ideal_circuit = code_instance.circuit
-    noisy_circuit = noise3_instance(noise2_instance(noise_instance(ideal_circuit)))
+    assert workers >= 1
+    assert not (
+        shard_manifest and mwpf_benchmark_suite
+    ), "benchmark suite requires concatenated samples"
+    # the circuit, the DEM and the unseeded sampler are cached, so repeated calls only pay for sampling
+    noisy_circuit = cached_noisy_circuit(code, noise, noise2, noise3)
 
     circuit = noisy_circuit
 
@@ -60,9 +82,12 @@ def generate_samples(
         dem_filename = filename + ".dem"
         if not no_print:
             print("Writing DEM file to", dem_filename)
-        dem = noisy_circuit.detector_error_model(
+        dem = cached_detector_error_model(
+            code,
+            noise,
+            noise2,
+            noise3,
             decompose_errors=DecoderCli(decoder).decompose_errors,
-            approximate_disjoint_errors=True,
         )
         dem.to_file(dem_filename)
         num_dets = dem.num_detectors
@@ -75,16 +100,31 @@ def generate_samples(
             print(
                 "Writing detectors to", det_filename, "and observables to", obs_filename
             )
-        sampler: stim.CompiledDetectorSampler = circuit.compile_detector_sampler(
-            seed=seed
-        )
-        sampler.sample_write(
-            shots=shots,
-            filepath=det_filename,
-            format="b8",
-            obs_out_filepath=obs_filename,
-            obs_out_format="b8",
-        )
+        if workers == 1:
+            # the sampler records its own compilation in the "sampling" phase
+            sampler = cached_detector_sampler(code, noise, noise2, noise3, seed=seed)
+            with phase("sampling"):
+                sampler.sample_write(
+                    shots=shots,
+                    filepath=det_filename,
+                    format="b8",
+                    obs_out_filepath=obs_filename,
+                    obs_out_format="b8",
+                )
+        else:
+            # the shards are sampled in other processes, whose phases are not recorded here
+            with phase("sampling"):
+                generate_sample_shards(
+                    code=code,
+                    filename=filename,
+                    noise=noise,
+                    noise2=noise2,
+                    noise3=noise3,
+                    shots=shots,
+                    seed=seed,
+                    workers=workers,
+                    shard_manifest=shard_manifest,
+                )
 
     if mwpf_benchmark_suite:
         cbor_filename = filename + ".cbor"
@@ -108,12 +148,138 @@ def generate_samples(
             )
 
 
+@dataclass_json(undefined="RAISE")
+@dataclass
+class SampleShard:
+    shots: int
+    seed: int
+    # the filenames are relative to the directory of the manifest
+    det_filename: str
+    obs_filename: str
+
+
+@dataclass_json(undefined="RAISE")
+@dataclass
+class SampleShardManifest:
+    shots: int
+    seed: int | None
+    workers: int
+    shards: list[SampleShard]
+
+
+def shard_shots_of(shots: int, workers: int) -> list[int]:
+    """split the shots as evenly as possible, the first shards taking the remainder"""
+    return [
+        shots // workers + (1 if i < shots % workers else 0) for i in range(workers)
+    ]
+
+
+def shard_seeds_of(seed: int | None, workers: int) -> list[int]:
+    """independent seeds for the shards derived from the global seed"""
+    return [
+        int(child.generate_state(1, dtype=np.uint64)[0])
+        for child in np.random.SeedSequence(seed).spawn(workers)
+    ]
+
+
+def _sample_shard(
+    code: str,
+    noise: str,
+    noise2: str,
+    noise3: str,
+    shots: int,
+    seed: int,
+    det_filename: str,
+    obs_filename: str,
+):
+    sampler = cached_detector_sampler(code, noise, noise2, noise3, seed=seed)
+    sampler.sample_write(
+        shots=shots,
+        filepath=det_filename,
+        format="b8",
+        obs_out_filepath=obs_filename,
+        obs_out_format="b8",
+    )
+
+
+def generate_sample_shards(
+    code: CodeCli | str,
+    filename: str,
+    *,
+    noise: NoiseCli | str,
+    noise2: NoiseCli | str,
+    noise3: NoiseCli | str,
+    shots: int,
+    seed: int | None,
+    workers: int,
+    shard_manifest: bool = False,
+) -> SampleShardManifest:
+    """
+    Sample the shots in `workers` processes, each with a seed derived from `seed`.
+    The shards are concatenated into `filename.det.b8` and `filename.obs.b8` unless `shard_manifest` is set,
+    in which case they are kept and listed in `filename.shards.json`.
+    """
+    shards = [
+        SampleShard(
+            shots=shard_shots,
+            seed=shard_seed,
+            det_filename=os.path.basename(f"{filename}.shard{i}.det.b8"),
+            obs_filename=os.path.basename(f"{filename}.shard{i}.obs.b8"),
+        )
+        for i, (shard_shots, shard_seed) in enumerate(
+            zip(shard_shots_of(shots, workers), shard_seeds_of(seed, workers))
+        )
+    ]
+    manifest = SampleShardManifest(
+        shots=shots, seed=seed, workers=workers, shards=shards
+    )
+    directory = os.path.dirname(filename)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _sample_shard,
+                str(code),
+                str(noise),
+                str(noise2),
+                str(noise3),
+                shard.shots,
+                shard.seed,
+                os.path.join(directory, shard.det_filename),
+                os.path.join(directory, shard.obs_filename),
+            )
+            for shard in shards
+        ]
+        for future in futures:
+            future.result()
+    if shard_manifest:
+        with open(filename + ".shards.json", "w") as f:
+            f.write(manifest.to_json(indent=2))  # type: ignore
+        return manifest
+    for extension, shard_filenames in [
+        (".det.b8", [shard.det_filename for shard in shards]),
+        (".obs.b8", [shard.obs_filename for shard in shards]),
+    ]:
+        # b8 rows are byte aligned, so the shards can be concatenated directly
+        with open(filename + extension, "wb") as out_f:
+            for shard_filename in shard_filenames:
+                shard_path = os.path.join(directory, shard_filename)
+                with open(shard_path, "rb") as in_f:
+                    shutil.copyfileobj(in_f, out_f, 16 * 1024 * 1024)
+                os.remove(shard_path)
+    return manifest
+
+
 @dataclass_json(undefined="RAISE")  # avoid accidentally override other types
 @dataclass
 class BenchmarkSamplesResult:
     elapsed: float
     shots: int
     errors: int
+    # the number of errors of each observable
+    observable_errors: list[int] | None = None
+    # only in the sharded mode: the wall time of the whole run and the decoding time of each shard
+    wall_elapsed: float | None = None
+    shard_elapsed: list[float] | None = None
 
 
 @arguably.command
@@ -126,6 +292,8 @@ def benchmark_samples(
     compact_print: bool = False,
     no_print: bool = False,
     remove_initialization_time: bool = False,
+    no_decoder_pool: bool = False,  # always build a fresh decoder and decode via files
+    workers: int = 1,  # decode shot-aligned shards of the file in parallel processes
 ) -> BenchmarkSamplesResult:
     circuit_filename = filename + ".stim"
     dem_filename = filename + ".dem"
@@ -133,13 +301,8 @@ def benchmark_samples(
     obs_filename = filename + ".obs.b8"
 
     code = CircuitCode(filepath=circuit_filename)
-    decoder_instance = DecoderCli(decoder)()
-
     circuit = code.circuit
 
-    if hasattr(decoder_instance, "pass_circuit") and decoder_instance.pass_circuit:
-        decoder_instance = decoder_instance.with_circuit(circuit)
-
     num_dets = circuit.num_detectors
     num_obs = circuit.num_observables
     det_bytes_per_shot = (num_dets + 7) // 8
@@ -150,8 +313,37 @@ def benchmark_samples(
     obs_bytes = os.path.getsize(obs_filename)
     assert obs_bytes % obs_bytes_per_shot == 0, "inconsistent byte size"
     assert shots * obs_bytes_per_shot == obs_bytes, "obs doesn't match det size"
+    num_shots = shots if max_shots is None else min(shots, max_shots)
+
+    if workers > 1:
+        with phase("decoding"):
+            return benchmark_sample_shards(
+                filename,
+                num_shots=num_shots,
+                decoder=str(decoder),
+                workers=workers,
+                predict_filename=predict_filename,
+                compact_print=compact_print,
+                no_print=no_print,
+                remove_initialization_time=remove_initialization_time,
+                no_decoder_pool=no_decoder_pool,
+            )
+
+    decoding_start = time.perf_counter()
+    decoder_instance, pass_circuit = decoder_with_circuit(decoder, circuit)
+
+    # reuse a warm decoder if the same decoder has been compiled for the same DEM before, so that
+    # only the decoding is timed; the compile time of a pool miss counts as initialization time
+    compiled_decoder, compile_time = None, 0.0
+    if not no_decoder_pool:
+        compiled_decoder, compile_time = decoder_pool.compiled_decoder_with_time(
+            str(decoder),
+            decoder_instance,
+            stim.DetectorErrorModel.from_file(dem_filename),
+            circuit=circuit if pass_circuit else None,
+        )
 
-    if remove_initialization_time:
+    if remove_initialization_time and compiled_decoder is None:
         # to avoid cold start, run multiple initializations to get the average initialization time
         def get_initialization_time() -> float:
             init_profiling_decoder = ProfilingDecoder(decoder_instance)
@@ -173,30 +365,40 @@ def benchmark_samples(
         initialization_time = sum(init_times) / len(init_times)
 
     profiling_decoder = ProfilingDecoder(decoder_instance)
-    num_shots = shots if max_shots is None else min(shots, max_shots)
     with tempfile.TemporaryDirectory() as tmp_dir:
         predicts_path = Path(predict_filename or (tmp_dir + "/predicted.b8"))
-        profiling_decoder.decode_via_files(
-            num_shots=num_shots,
-            num_dets=num_dets,
-            num_obs=num_obs,
-            dem_path=Path(dem_filename),
-            dets_b8_in_path=Path(det_filename),
-            obs_predictions_b8_out_path=predicts_path,
-            tmp_dir=Path(tmp_dir),
-        )
+        if compiled_decoder is not None:
+            start = time.perf_counter()
+            decode_b8_file(
+                compiled_decoder,
+                num_shots=num_shots,
+                num_dets=num_dets,
+                dets_b8_in_path=det_filename,
+                obs_predictions_b8_out_path=predicts_path,
+            )
+            profiling_decoder.elapsed = time.perf_counter() - start
+            if not remove_initialization_time:
+                # a decoder compiled on a pool miss is timed with its construction, like via files
+                profiling_decoder.elapsed += compile_time
+        else:
+            profiling_decoder.decode_via_files(
+                num_shots=num_shots,
+                num_dets=num_dets,
+                num_obs=num_obs,
+                dem_path=Path(dem_filename),
+                dets_b8_in_path=Path(det_filename),
+                obs_predictions_b8_out_path=predicts_path,
+                tmp_dir=Path(tmp_dir),
+            )
         # compare with the ground truth to get number of logical errors
-        obs = np.fromfile(obs_filename, dtype=np.uint8).reshape(
-            (shots, obs_bytes_per_shot)
+        counter = count_b8_file_errors(
+            obs_filename, str(predicts_path), num_shots, num_obs
         )
-        predicts = np.fromfile(predicts_path, dtype=np.uint8).reshape(
-            (num_shots, obs_bytes_per_shot)
-        )
-        success = np.count_nonzero((obs == predicts).all(axis=1))
-        errors = num_shots - success
+        errors = counter.errors
+    record_phase("decoding", time.perf_counter() - decoding_start)
 
     elapsed = profiling_decoder.elapsed
-    if remove_initialization_time and num_shots > 1:
+    if remove_initialization_time and compiled_decoder is None and num_shots > 1:
         if elapsed > initialization_time:
             elapsed -= initialization_time
             # scale up because the initialization time includes the decoding time of 1 sample
@@ -213,7 +415,360 @@ def benchmark_samples(
         )
         print(f"logical error rate: {errors}/{num_shots} = {errors/num_shots:.3e}")
 
-    return BenchmarkSamplesResult(elapsed=elapsed, shots=num_shots, errors=errors)
+    return BenchmarkSamplesResult(
+        elapsed=elapsed,
+        shots=num_shots,
+        errors=errors,
+        observable_errors=counter.observable_errors.tolist(),
+    )
+
+
+def decoder_with_circuit(
+    decoder: DecoderCli | str, circuit: stim.Circuit
+) -> tuple[Any, bool]:
+    """construct the decoder, passing the circuit to it if the decoder requires"""
+    decoder_instance = DecoderCli(decoder)()
+    pass_circuit = (
+        hasattr(decoder_instance, "pass_circuit") and decoder_instance.pass_circuit
+    )
+    if pass_circuit:
+        decoder_instance = decoder_instance.with_circuit(circuit)
+    return decoder_instance, pass_circuit
+
+
+_benchmark_executors: dict[int, ProcessPoolExecutor] = {}
+
+
+def benchmark_executor_of(workers: int) -> ProcessPoolExecutor:
+    """the worker processes are kept alive so that their pooled decoders stay warm across calls"""
+    if workers not in _benchmark_executors:
+        if len(_benchmark_executors) == 0:
+            atexit.register(shutdown_benchmark_executors)
+        _benchmark_executors[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _benchmark_executors[workers]
+
+
+def shutdown_benchmark_executors() -> None:
+    """stop the worker processes, dropping the tasks that have not started yet"""
+    for executor in _benchmark_executors.values():
+        executor.shutdown(wait=True, cancel_futures=True)
+    _benchmark_executors.clear()
+
+
+def _benchmark_shard(
+    filename: str,
+    decoder: str,
+    start: int,
+    stop: int,
+    remove_initialization_time: bool,
+    no_decoder_pool: bool,
+) -> tuple[float, np.ndarray]:
+    """decode the shots [start, stop) of the sample file, returning the decoding time and the bit packed predictions"""
+    circuit = stim.Circuit.from_file(filename + ".stim")
+    det_bytes_per_shot = (circuit.num_detectors + 7) // 8
+    obs_bytes_per_shot = (circuit.num_observables + 7) // 8
+    dets = np.fromfile(
+        filename + ".det.b8",
+        dtype=np.uint8,
+        count=(stop - start) * det_bytes_per_shot,
+        offset=start * det_bytes_per_shot,
+    ).reshape((stop - start, det_bytes_per_shot))
+    compiled_decoder, compile_time = None, 0.0
+    if not no_decoder_pool:
+        decoder_instance, pass_circuit = decoder_with_circuit(decoder, circuit)
+        compiled_decoder, compile_time = decoder_pool.compiled_decoder_with_time(
+            decoder,
+            decoder_instance,
+            stim.DetectorErrorModel.from_file(filename + ".dem"),
+            circuit=circuit if pass_circuit else None,
+        )
+    if compiled_decoder is not None:
+        start_time = time.perf_counter()
+        predicts = decode_bit_packed(compiled_decoder, dets, circuit.num_observables)
+        elapsed = time.perf_counter() - start_time
+        if not remove_initialization_time:
+            # the same as `benchmark_samples`: a pool miss is timed with its construction
+            elapsed += compile_time
+        return elapsed, predicts
+    # decoders without a compiled decoder need a file holding only this shard
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        shard_filename = os.path.join(tmp_dir, "shard")
+        shutil.copyfile(filename + ".stim", shard_filename + ".stim")
+        shutil.copyfile(filename + ".dem", shard_filename + ".dem")
+        dets.tofile(shard_filename + ".det.b8")
+        np.fromfile(
+            filename + ".obs.b8",
+            dtype=np.uint8,
+            count=(stop - start) * obs_bytes_per_shot,
+            offset=start * obs_bytes_per_shot,
+        ).tofile(shard_filename + ".obs.b8")
+        result = benchmark_samples(
+            shard_filename,
+            decoder=decoder,  # type: ignore
+            predict_filename=shard_filename + ".predict.b8",
+            no_print=True,
+            remove_initialization_time=remove_initialization_time,
+            no_decoder_pool=True,
+        )
+        predicts = np.fromfile(shard_filename + ".predict.b8", dtype=np.uint8)
+        return result.elapsed, predicts.reshape((stop - start, obs_bytes_per_shot))
+
+
+def benchmark_sample_shards(
+    filename: str,
+    *,
+    num_shots: int,
+    decoder: str,
+    workers: int,
+    predict_filename: str | None = None,
+    compact_print: bool = False,
+    no_print: bool = False,
+    remove_initialization_time: bool = False,
+    no_decoder_pool: bool = False,
+) -> BenchmarkSamplesResult:
+    """
+    Decode the first `num_shots` shots of the sample file in `workers` shot-aligned shards concurrently.
+    `elapsed` is the sum of the decoding time of the shards, i.e. the time a single core would take,
+    while `wall_elapsed` measures the aggregate throughput.
+    """
+    bounds = np.cumsum([0] + shard_shots_of(num_shots, workers)).tolist()
+    executor = benchmark_executor_of(workers)
+    start_time = time.perf_counter()
+    futures = [
+        executor.submit(
+            _benchmark_shard,
+            filename,
+            decoder,
+            start,
+            stop,
+            remove_initialization_time,
+            no_decoder_pool,
+        )
+        for start, stop in zip(bounds[:-1], bounds[1:])
+        if stop > start
+    ]
+    shard_results = [future.result() for future in futures]
+    wall_elapsed = time.perf_counter() - start_time
+
+    num_obs = stim.Circuit.from_file(filename + ".stim").num_observables
+    if len(shard_results) == 0:  # no shots
+        predicts = np.zeros((0, (num_obs + 7) // 8), dtype=np.uint8)
+        obs = predicts
+    else:
+        predicts = np.concatenate(
+            [shard_predicts for _, shard_predicts in shard_results]
+        )
+        obs = np.memmap(
+            filename + ".obs.b8", dtype=np.uint8, mode="r", shape=predicts.shape
+        )
+    if predict_filename is not None:
+        predicts.tofile(predict_filename)
+    counter = count_bit_packed_errors(obs, predicts, num_obs)
+    errors = counter.errors
+
+    shard_elapsed = [elapsed for elapsed, _ in shard_results]
+    elapsed = sum(shard_elapsed)
+    if compact_print and not no_print:
+        print("# <elapsed> <shots> <errors> <wall_elapsed>")
+        print(elapsed, num_shots, errors, wall_elapsed)
+    elif not no_print:
+        per_shot = max(num_shots, 1)
+        print(
+            f"decoding time: {elapsed / per_shot:.3e}s per core, elapsed: {elapsed:.3e}s, shots: {num_shots}"
+        )
+        print(
+            f"throughput: {num_shots / wall_elapsed:.3e} shots/s with {workers} workers, wall time: {wall_elapsed:.3e}s"
+        )
+        print(f"logical error rate: {errors}/{num_shots} = {errors/per_shot:.3e}")
+
+    return BenchmarkSamplesResult(
+        elapsed=elapsed,
+        shots=num_shots,
+        errors=errors,
+        observable_errors=counter.observable_errors.tolist(),
+        wall_elapsed=wall_elapsed,
+        shard_elapsed=shard_elapsed,
+    )
+
+
+class InMemorySamples:
+    """
+    Samples kept in memory and shared by all the decoders, avoiding the round trip through the file system.
+    Decoders that support `compile_decoder_for_dem` decode the bit packed arrays directly;
+    the other decoders fall back to `benchmark_samples` on files that are written only once, on demand.
+    """
+
+    def __init__(
+        self,
+        circuit: stim.Circuit,
+        dem: stim.DetectorErrorModel,
+        dets: np.ndarray,
+        obs: np.ndarray,
+    ):
+        self.circuit = circuit
+        self.dem = dem
+        # bit packed detection events, shape (shots, (num_dets + 7) // 8)
+        self.dets = dets
+        self.obs = obs  # bit packed observable flips, shape (shots, (num_obs + 7) // 8)
+        self.tmp_dir: tempfile.TemporaryDirectory | None = None
+
+    @property
+    def shots(self) -> int:
+        return self.dets.shape[0]
+
+    def files(self) -> str:
+        """write the samples to a temporary directory (only once) and return the filename prefix"""
+        if self.tmp_dir is None:
+            self.tmp_dir = tempfile.TemporaryDirectory()
+        filename = os.path.join(self.tmp_dir.name, "tmp")
+        if not os.path.exists(filename + ".stim"):
+            self.dem.to_file(filename + ".dem")
+            self.dets.tofile(filename + ".det.b8")
+            self.obs.tofile(filename + ".obs.b8")
+            self.circuit.to_file(
+                filename + ".stim"
+            )  # written last: marks the files complete
+        return filename
+
+    def close(self):
+        if self.tmp_dir is not None:
+            self.tmp_dir.cleanup()
+            self.tmp_dir = None
+
+    def __enter__(self) -> "InMemorySamples":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def compiled_decoder_of(
+        self, decoder: DecoderCli | str
+    ) -> Optional[sinter.CompiledDecoder]:
+        """the warm compiled decoder from the decoder pool, or None if it cannot be compiled"""
+        compiled_decoder, _ = self.compiled_decoder_with_time(decoder)
+        return compiled_decoder
+
+    def compiled_decoder_with_time(
+        self, decoder: DecoderCli | str
+    ) -> tuple[Optional[sinter.CompiledDecoder], float]:
+        decoder_instance, pass_circuit = decoder_with_circuit(decoder, self.circuit)
+        return decoder_pool.compiled_decoder_with_time(
+            str(decoder),
+            decoder_instance,
+            self.dem,
+            circuit=self.circuit if pass_circuit else None,
+        )
+
+    def decode(
+        self,
+        compiled_decoder: sinter.CompiledDecoder,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> BenchmarkSamplesResult:
+        start = clock()
+        predicts = decode_bit_packed(
+            compiled_decoder, self.dets, self.circuit.num_observables
+        )
+        elapsed = clock() - start
+        counter = count_bit_packed_errors(
+            self.obs, predicts, self.circuit.num_observables
+        )
+        return BenchmarkSamplesResult(
+            elapsed=elapsed,
+            shots=self.shots,
+            errors=counter.errors,
+            observable_errors=counter.observable_errors.tolist(),
+        )
+
+    def benchmark(
+        self,
+        decoder: DecoderCli | str,
+        remove_initialization_time: bool = False,
+    ) -> BenchmarkSamplesResult:
+        decoding_start = time.perf_counter()
+        compiled_decoder, compile_time = self.compiled_decoder_with_time(decoder)
+        if compiled_decoder is None:
+            return benchmark_samples(
+                filename=self.files(),
+                decoder=decoder,
+                no_print=True,
+                remove_initialization_time=remove_initialization_time,
+                no_decoder_pool=True,
+            )
+        result = self.decode(compiled_decoder)
+        if not remove_initialization_time:
+            result.elapsed += compile_time
+        record_phase("decoding", time.perf_counter() - decoding_start)
+        return result
+
+    def benchmark_decoders(
+        self,
+        decoders: list[str],
+        max_workers: int = 1,
+        remove_initialization_time: bool = False,
+    ) -> Iterator[tuple[str, BenchmarkSamplesResult]]:
+        """
+        Decode the same samples with all the decoders, yielding the results as they complete.
+        The decoders are compiled (or taken warm from the decoder pool) up front; with more than one
+        worker, the compiled decoders run concurrently in a thread pool and the elapsed time of each
+        is the CPU time of its own thread, so that it is measured as if it ran in isolation.
+        The thread time does not include the work of the native threads (e.g. OpenMP with
+        `omp_thread_count > 1`) or the subprocesses that a decoder spawns, so benchmark such decoders
+        with `max_workers=1`, which uses the wall clock.
+        The compile time on a pool miss is added unless `remove_initialization_time` is set.
+        The decoders that cannot be compiled or that write output files (see `writes_output_files`)
+        are benchmarked one by one in this thread.
+        """
+        if max_workers <= 1:
+            for decoder in decoders:
+                yield decoder, self.benchmark(decoder, remove_initialization_time)
+            return
+        decoding_start = time.perf_counter()
+        compiled_decoders = {
+            decoder: self.compiled_decoder_with_time(decoder) for decoder in decoders
+        }
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    self.decode, compiled_decoder, time.thread_time
+                ): decoder
+                for decoder, (compiled_decoder, _) in compiled_decoders.items()
+                if compiled_decoder is not None
+            }
+            for future in as_completed(futures):
+                decoder = futures[future]
+                result = future.result()
+                if not remove_initialization_time:
+                    result.elapsed += compiled_decoders[decoder][1]
+                yield decoder, result
+        record_phase("decoding", time.perf_counter() - decoding_start)
+        for decoder, (compiled_decoder, _) in compiled_decoders.items():
+            if compiled_decoder is None:
+                yield decoder, self.benchmark(decoder, remove_initialization_time)
+
+
+def sample_in_memory(
+    code: CodeCli | str,
+    *,
+    noise: NoiseCli | str = "NoNoise",
+    shots: int = 10000,
+    noise2: NoiseCli | str = "NoNoise",
+    noise3: NoiseCli | str = "NoNoise",
+    decoder: DecoderCli | str = "mwpf",
+    seed: int | None = None,
+) -> InMemorySamples:
+    """the in-memory counterpart of `generate_samples`"""
+    circuit = cached_noisy_circuit(code, noise, noise2, noise3)
+    dem = cached_detector_error_model(
+        code,
+        noise,
+        noise2,
+        noise3,
+        decompose_errors=DecoderCli(decoder).decompose_errors,
+    )
+    sampler = cached_detector_sampler(code, noise, noise2, noise3, seed=seed)
+    with phase("sampling"):
+        dets, obs = sampler.sample(shots, bit_packed=True, separate_observables=True)
+    return InMemorySamples(circuit=circuit, dem=dem, dets=dets, obs=obs)
 
 
 @arguably.command
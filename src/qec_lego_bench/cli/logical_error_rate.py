@@ -1,13 +1,15 @@
 import arguably
 import sinter
 from typing import Optional
-from sinter._decoding import sample_decode
 
 from .util import *
 from .codes import *
 from .noises import *
 from .decoders import *
 from qec_lego_bench.stats import Stats
+from .circuit_cache import cached_detector_error_model, cached_noisy_circuit
+from .generate_samples import decoder_with_circuit
+from .sequential_collect import SequentialCollector, sequential_collect
 
 
 @arguably.command
@@ -26,67 +28,60 @@ def logical_error_rate(
     noise2: NoiseCli = "NoNoise",  # type: ignore
     noise3: NoiseCli = "NoNoise",  # type: ignore
     print_circuit: bool = False,
+    target_relative_uncertainty: Optional[float] = None,
+    seed: Optional[int] = None,
 ) -> Stats:
-    code_instance = CodeCli(code)()
-    noise_instance = NoiseCli(noise)()
-    noise2_instance = NoiseCli(noise2)()
-    noise3_instance = NoiseCli(noise3)()
-    decoder_instance = DecoderCli(decoder)()
-
-    ideal_circuit = code_instance.circuit
-    noisy_circuit = noise3_instance(noise2_instance(noise_instance(ideal_circuit)))
+    noisy_circuit = cached_noisy_circuit(code, noise, noise2, noise3)
 
     if print_circuit:
         print(noisy_circuit)
         exit(0)
 
-    if hasattr(decoder_instance, "pass_circuit") and decoder_instance.pass_circuit:
-        decoder_instance = decoder_instance.with_circuit(noisy_circuit)
-
-    dem = noisy_circuit.detector_error_model(
-        decompose_errors=decoder.decompose_errors, approximate_disjoint_errors=True
-    )
-    task = sinter.Task(
-        circuit=noisy_circuit,
-        detector_error_model=dem,
-        decoder=str(decoder),
-        collection_options=sinter.CollectionOptions(
-            max_shots=max_shots, max_errors=max_errors
-        ),
-    )
-    strong_id = task.strong_id()
-
-    progress_callback = None
-    if not no_progress:
-        progress_callback = SinterProgressBar(
-            name=str(decoder), max_shots=max_shots, max_errors=max_errors
-        )
-    if (
-        no_progress
-        and num_workers == 1
-        and max_shots == max_errors
-        and progress_callback is None
-        and save_resume_filepath is None
-    ):
-        # run single thread instead of sinter.collect, so that the panic information can be collected
-        single_result = sample_decode(
-            circuit_obj=task.circuit,
-            circuit_path=None,
-            dem_obj=dem,
-            dem_path=None,
-            num_shots=max_shots,
-            decoder=str(decoder),
-            custom_decoders={str(decoder): decoder_instance},
+    if save_resume_filepath is None:
+        # the native collector stops early and collects the panic information of the decoder
+        progress = (
+            None if no_progress else SequentialProgressBar(str(decoder), max_shots)
         )
-        stats = Stats(single_result)
-        if hasattr(decoder_instance, "panic_cases"):
-            if len(decoder_instance.panic_cases) > 0:
-                for panic_case in decoder_instance.panic_cases:
-                    stats.report_panic(panic_case)
+        try:
+            stats = sequential_collect(
+                str(code),
+                decoder=str(decoder),
+                noise=str(noise),
+                noise2=str(noise2),
+                noise3=str(noise3),
+                max_shots=max_shots,
+                max_errors=max_errors,
+                target_relative_uncertainty=target_relative_uncertainty,
+                num_workers=num_workers,
+                seed=seed,
+                progress_callback=progress,
+            )
+        finally:
+            if progress is not None:
+                progress.close()
         if not no_print:
             print(stats)
         return stats
     else:
+        # sinter keeps the resume file; it does not support the target relative uncertainty
+        decoder_instance, _ = decoder_with_circuit(decoder, noisy_circuit)
+        dem = cached_detector_error_model(
+            code, noise, noise2, noise3, decompose_errors=decoder.decompose_errors
+        )
+        task = sinter.Task(
+            circuit=noisy_circuit,
+            detector_error_model=dem,
+            decoder=str(decoder),
+            collection_options=sinter.CollectionOptions(
+                max_shots=max_shots, max_errors=max_errors
+            ),
+        )
+        strong_id = task.strong_id()
+        progress_callback = None
+        if not no_progress:
+            progress_callback = SinterProgressBar(
+                name=str(decoder), max_shots=max_shots, max_errors=max_errors
+            )
         results = sinter.collect(
             num_workers=num_workers,
             tasks=[task],
@@ -107,6 +102,24 @@ def logical_error_rate(
         raise ValueError("No result found for the given strong_id")
 
 
+class SequentialProgressBar:
+    def __init__(self, name: str, max_shots: int):
+        from tqdm.autonotebook import tqdm  # type: ignore
+
+        self.name = name
+        self.pbar = tqdm(total=max_shots, desc=f"shots ({name})")
+
+    def __call__(self, collector: SequentialCollector):
+        stats = collector.stats
+        self.pbar.set_postfix_str(
+            f"errors = {stats.errors}, pL = {stats.failure_rate:.1uS}"
+        )
+        self.pbar.update(stats.shots - self.pbar.n)
+
+    def close(self):
+        self.pbar.close()
+
+
 class SinterProgressBar:
     def __init__(self, name: str, max_shots: int, max_errors: int):
         from tqdm.autonotebook import tqdm  # type: ignore
@@ -5,15 +5,13 @@ from qec_lego_bench.decoders.profiling_decoder import ProfilingDecoder
 from dataclasses_json import dataclass_json
 from dataclasses import dataclass, field
 from qec_lego_bench.cli.decoding_speed import DecodingSpeedResult
-from qec_lego_bench.cli.generate_samples import generate_samples, benchmark_samples
+from qec_lego_bench.cli.generate_samples import sample_in_memory
 from qec_lego_bench.hpc.monte_carlo import LogicalErrorResult
 from qec_lego_bench.notebooks.common import MultiDecoderLogicalErrorRates
 from .util import *
 from .codes import *
 from .noises import *
 from .decoders import *
-import tempfile
-import os
 import time
 
 """
@@ -22,7 +20,8 @@ Measure the actual decoding speed
 Since some of the decoders don't implement sinter.CompiledDecoder and can suffer from slow start because of initialization,
 we measure the time of the initialization and then remove that time from the evaluation.
 
-All decoders will be forced to use the same `decode_via_files` method, as it is provided for every decoder.
+Decoders that implement `compile_decoder_for_dem` are compiled once per DEM and kept warm in the process-local decoder pool,
+so each batch only pays for decoding; the others are forced to use the same `decode_via_files` method, as it is provided for every decoder.
 
 When evaluating decoding speed, it is better to reduce the interference from the OS schedular.
 ```sh
@@ -59,34 +58,26 @@ def multi_decoding_speed(
 
         start_time = time.time()
 
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            filename = os.path.join(tmp_dir, "tmp")
-
-            # check if any decoder requires decomposing errors, if so, use that decoder
-            representative_decoder: DecoderCli = DecoderCli("none")
-            for decoder in decoders:
-                if decoder.decompose_errors:
-                    representative_decoder = decoder
-                    break
-
-            generate_samples(
-                code=code,
-                filename=filename,
-                noise=noise,
-                noise2=noise2,
-                noise3=noise3,
-                shots=shots,
-                decoder=representative_decoder,
-                no_print=True,
-            )
-
+        # check if any decoder requires decomposing errors, if so, use that decoder
+        representative_decoder: DecoderCli = DecoderCli("none")
+        for decoder in decoders:
+            if decoder.decompose_errors:
+                representative_decoder = decoder
+                break
+
+        # sample once in memory and share the arrays among all the decoders
+        with sample_in_memory(
+            code=code,
+            noise=noise,
+            noise2=noise2,
+            noise3=noise3,
+            shots=shots,
+            decoder=representative_decoder,
+        ) as samples:
             results: dict[str, LogicalErrorResult] = {}
             for decoder in decoders:
-                result = benchmark_samples(
-                    filename=filename,
-                    decoder=decoder,
-                    no_print=True,
-                    remove_initialization_time=True,
+                result = samples.benchmark(
+                    decoder=decoder, remove_initialization_time=True
                 )
                 assert result.shots == shots
                 results[str(decoder)] = LogicalErrorResult(
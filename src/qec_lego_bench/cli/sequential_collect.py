@@ -0,0 +1,273 @@
+"""
+Sequential-stopping Monte Carlo collection of the logical error rate
+
+The shots are sampled and decoded in batches of growing size, and the collection stops as soon
+as `max_shots` shots or `max_errors` errors are reached, or the relative uncertainty of the
+logical error rate (see `Stats.relative_uncertainty`) drops below the target. Unlike
+`sinter.collect`, the panic cases reported by the decoder are collected into the `Stats`.
+
+With multiple workers, the batches are decoded in a persistent process pool whose workers keep
+their circuits and compiled decoders warm across batches and calls; the batches still in flight
+when the collection stops are discarded (the running ones are waited for, at most one per worker).
+Each batch decoder compiles a single detector sampler, seeded once from the global seed, and the
+batches continue its random stream; the decoders without a compiled decoder decode the same
+samples via files. Thus a single-worker collection is deterministic given the seed. The batch
+decoders of the workers are seeded when they are created and then reused across calls, so that
+the calls draw independent samples.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+import pathlib
+import tempfile
+import time
+import numpy as np
+import sinter
+import stim
+from qec_lego_bench.cache import LRUCache
+from qec_lego_bench.decoders.decoder_pool import decode_bit_packed
+from qec_lego_bench.misc.logical_errors import LogicalErrorCounter
+from qec_lego_bench.stats import Stats
+from .circuit_cache import cached_detector_error_model, cached_noisy_circuit
+from .decoders import DecoderCli
+from .generate_samples import benchmark_executor_of, decoder_with_circuit
+
+MIN_BATCH_SHOTS = 100
+MAX_BATCH_SHOTS = 2**16
+
+
+@dataclass
+class BatchResult:
+    shots: int
+    errors: int
+    seconds: float
+    panic_cases: list[Any] = field(default_factory=list)
+
+
+class BatchDecoder:
+    """sample and decode batches of a circuit, recording the new panic cases of the decoder"""
+
+    def __init__(
+        self,
+        circuit: stim.Circuit,
+        dem: stim.DetectorErrorModel,
+        decoder: str,
+        seed: Optional[int] = None,
+    ):
+        self.circuit = circuit
+        self.dem = dem
+        self.decoder = decoder
+        self.sampler = circuit.compile_detector_sampler(seed=seed)
+        self.decoder_instance, _ = decoder_with_circuit(decoder, circuit)
+        # the decoder keeps its own panic cases, so it is not shared via the decoder pool
+        self.compiled: Optional[sinter.CompiledDecoder] = None
+        try:
+            self.compiled = self.decoder_instance.compile_decoder_for_dem(dem=dem)
+        except NotImplementedError:
+            pass
+
+    def new_panic_cases(self, before: int) -> list[Any]:
+        panic_cases = getattr(self.decoder_instance, "panic_cases", None)
+        if panic_cases is None:
+            return []
+        return list(panic_cases[before:])
+
+    def num_panic_cases(self) -> int:
+        return len(getattr(self.decoder_instance, "panic_cases", None) or [])
+
+    def decode_via_files(self, dets: np.ndarray) -> np.ndarray:
+        num_obs = self.circuit.num_observables
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            directory = pathlib.Path(tmp_dir)
+            self.dem.to_file(directory / "dem.dem")
+            dets.tofile(directory / "dets.b8")
+            self.decoder_instance.decode_via_files(
+                num_shots=len(dets),
+                num_dets=self.circuit.num_detectors,
+                num_obs=num_obs,
+                dem_path=directory / "dem.dem",
+                dets_b8_in_path=directory / "dets.b8",
+                obs_predictions_b8_out_path=directory / "predicts.b8",
+                tmp_dir=directory,
+            )
+            predicts = np.fromfile(directory / "predicts.b8", dtype=np.uint8)
+        return predicts.reshape((len(dets), (num_obs + 7) // 8))
+
+    def run(self, shots: int) -> BatchResult:
+        panic_before = self.num_panic_cases()
+        start = time.perf_counter()
+        dets, obs = self.sampler.sample(
+            shots, bit_packed=True, separate_observables=True
+        )
+        if self.compiled is None:
+            predicts = self.decode_via_files(dets)
+        else:
+            predicts = decode_bit_packed(
+                self.compiled, dets, self.circuit.num_observables
+            )
+        counter = LogicalErrorCounter(num_obs=self.circuit.num_observables)
+        counter.add_bit_packed(obs, predicts)
+        return BatchResult(
+            shots=shots,
+            errors=counter.errors,
+            seconds=time.perf_counter() - start,
+            panic_cases=self.new_panic_cases(panic_before),
+        )
+
+
+# the batch decoders of the worker processes, kept warm across the batches
+_worker_batch_decoders: LRUCache[tuple[str, ...], BatchDecoder] = LRUCache(maxsize=8)
+
+
+def _run_batch(
+    code: str,
+    noise: str,
+    noise2: str,
+    noise3: str,
+    decoder: str,
+    shots: int,
+    seed: int,
+) -> BatchResult:
+    def create() -> BatchDecoder:
+        return BatchDecoder(
+            cached_noisy_circuit(code, noise, noise2, noise3),
+            cached_detector_error_model(
+                code,
+                noise,
+                noise2,
+                noise3,
+                decompose_errors=DecoderCli(decoder).decompose_errors,
+            ),
+            decoder,
+            seed,
+        )
+
+    # the seed only seeds a new batch decoder, the others continue their own random stream
+    key = (code, noise, noise2, noise3, decoder)
+    return _worker_batch_decoders.get_or_create(key, create).run(shots)
+
+
+@dataclass
+class SequentialCollector:
+    max_shots: int
+    max_errors: int
+    # stop once the relative uncertainty of the logical error rate is at most this value
+    target_relative_uncertainty: Optional[float] = None
+    min_batch_shots: int = MIN_BATCH_SHOTS
+    max_batch_shots: int = MAX_BATCH_SHOTS
+
+    shots: int = 0
+    errors: int = 0
+    seconds: float = 0
+    panic_cases: list[Any] = field(default_factory=list)
+
+    def add(self, result: BatchResult) -> None:
+        self.shots += result.shots
+        self.errors += result.errors
+        self.seconds += result.seconds
+        self.panic_cases.extend(result.panic_cases)
+
+    @property
+    def stats(self) -> Stats:
+        return Stats(
+            sinter.AnonTaskStats(
+                shots=self.shots, errors=self.errors, seconds=self.seconds
+            ),
+            panic_cases=self.panic_cases if len(self.panic_cases) > 0 else None,
+        )
+
+    def finished(self) -> bool:
+        if self.shots >= self.max_shots or self.errors >= self.max_errors:
+            return True
+        if self.target_relative_uncertainty is None or self.errors == 0:
+            return False
+        return self.stats.relative_uncertainty <= self.target_relative_uncertainty
+
+    def next_batch_shots(self, in_flight: int = 0) -> int:
+        """double the batch size but do not overshoot the expected number of shots to stop"""
+        remaining = self.max_shots - self.shots - in_flight
+        shots = min(max(self.min_batch_shots, 2 * self.shots), self.max_batch_shots)
+        if self.errors > 0:
+            rate = self.errors / self.shots
+            expected = (self.max_errors - self.errors) / rate
+            if self.target_relative_uncertainty is not None:
+                # relative uncertainty ~= 2.58 * sqrt((1 - p) / (p * N))
+                target_shots = (
+                    (2.58 / self.target_relative_uncertainty) ** 2 * (1 - rate) / rate
+                )
+                expected = min(expected, target_shots - self.shots)
+            shots = min(shots, max(self.min_batch_shots, int(expected) + 1))
+        return max(0, min(shots, remaining))
+
+
+def sequential_collect(
+    code: str,
+    *,
+    decoder: str,
+    noise: str = "NoNoise",
+    noise2: str = "NoNoise",
+    noise3: str = "NoNoise",
+    max_shots: int = 10_000_000,
+    max_errors: int = 10_000,
+    target_relative_uncertainty: Optional[float] = None,
+    num_workers: int = 1,
+    seed: Optional[int] = None,
+    progress_callback: Optional[Callable[[SequentialCollector], None]] = None,
+) -> Stats:
+    collector = SequentialCollector(
+        max_shots=max_shots,
+        max_errors=max_errors,
+        target_relative_uncertainty=target_relative_uncertainty,
+    )
+    seeds = np.random.SeedSequence(seed)
+
+    def next_seed() -> int:
+        return int(seeds.spawn(1)[0].generate_state(1, dtype=np.uint64)[0])
+
+    arguments = (str(code), str(noise), str(noise2), str(noise3), str(decoder))
+    if num_workers == 1:
+        batch_decoder = BatchDecoder(
+            cached_noisy_circuit(*arguments[:4]),
+            cached_detector_error_model(
+                *arguments[:4], decompose_errors=DecoderCli(decoder).decompose_errors
+            ),
+            str(decoder),
+            next_seed(),
+        )
+        while not collector.finished():
+            shots = collector.next_batch_shots()
+            if shots == 0:
+                break
+            collector.add(batch_decoder.run(shots))
+            if progress_callback is not None:
+                progress_callback(collector)
+        return collector.stats
+
+    executor = benchmark_executor_of(num_workers)
+    in_flight: dict[Future, int] = {}
+    try:
+        while True:
+            while len(in_flight) < num_workers and not collector.finished():
+                shots = collector.next_batch_shots(sum(in_flight.values()))
+                if shots == 0:
+                    break
+                future = executor.submit(_run_batch, *arguments, shots, next_seed())
+                in_flight[future] = shots
+            if len(in_flight) == 0:
+                break
+            done, _ = wait(in_flight.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+                collector.add(future.result())
+            if progress_callback is not None:
+                progress_callback(collector)
+            if collector.finished():
+                break
+    finally:
+        for future in in_flight:
+            future.cancel()
+        # the batches already running cannot be cancelled; wait for them so that they do not keep
+        # the shared workers busy after the collection returns
+        wait(in_flight.keys())
+    return collector.stats
@@ -3,7 +3,12 @@ from typing import Optional
 from dataclasses import dataclass
 import pathlib
 import sinter
+import stim
 from ldpc.sinter_decoders import SinterLsdDecoder
+from qec_lego_bench.decoders.ldpc_compiled import (
+    LdpcCompiledDecoder,
+    check_matrices_of,
+)
 
 
 @decoder_cli("BPLSD", "BP_LSD")
@@ -30,6 +35,27 @@ class BPLSD(sinter.Decoder):
 
     lsd_order: int = 0
 
+    def compile_decoder_for_dem(
+        self, *, dem: stim.DetectorErrorModel
+    ) -> sinter.CompiledDecoder:
+        from ldpc.bplsd_decoder import BpLsdDecoder
+
+        matrices = check_matrices_of(dem)
+        decoder = BpLsdDecoder(
+            matrices.check_matrix,
+            error_channel=list(matrices.priors),
+            max_iter=self.max_iter,
+            bp_method=self.bp_method,
+            ms_scaling_factor=self.ms_scaling_factor,
+            schedule=self.schedule,
+            omp_thread_count=self.omp_thread_count,
+            serial_schedule_order=self.serial_schedule_order,
+            lsd_order=self.lsd_order,
+        )
+        return LdpcCompiledDecoder(
+            decoder, matrices.observables_matrix, dem.num_detectors, dem.num_observables
+        )
+
     def decode_via_files(
         self,
         *,
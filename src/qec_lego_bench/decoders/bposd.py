@@ -3,7 +3,12 @@ from typing import Optional
 from dataclasses import dataclass
 import pathlib
 import sinter
+import stim
 from ldpc.sinter_decoders import SinterBpOsdDecoder
+from qec_lego_bench.decoders.ldpc_compiled import (
+    LdpcCompiledDecoder,
+    check_matrices_of,
+)
 
 
 @decoder_cli("BPOSD", "BP_OSD")
@@ -41,6 +46,31 @@ class BPOSD(sinter.Decoder):
     # format: 4 f32s for each iteration: elapsed, posterior_weight, prior_weight
     trace_filename: Optional[str] = None
 
+    def compile_decoder_for_dem(
+        self, *, dem: stim.DetectorErrorModel
+    ) -> sinter.CompiledDecoder:
+        if self.trace_filename is not None or not self.bp_converge:
+            # these options need the customized ldpc package and are only wired through files
+            raise NotImplementedError()
+        from ldpc.bposd_decoder import BpOsdDecoder
+
+        matrices = check_matrices_of(dem)
+        decoder = BpOsdDecoder(
+            matrices.check_matrix,
+            error_channel=list(matrices.priors),
+            max_iter=self.max_iter,
+            bp_method=self.bp_method,
+            ms_scaling_factor=self.ms_scaling_factor,
+            schedule=self.schedule,
+            omp_thread_count=self.omp_thread_count,
+            serial_schedule_order=self.serial_schedule_order,
+            osd_method=self.osd_method,
+            osd_order=self.osd_order,
+        )
+        return LdpcCompiledDecoder(
+            decoder, matrices.observables_matrix, dem.num_detectors, dem.num_observables
+        )
+
     def decode_via_files(
         self,
         *,
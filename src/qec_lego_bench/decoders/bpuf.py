@@ -3,7 +3,12 @@ from typing import Optional
 from dataclasses import dataclass
 import pathlib
 import sinter
+import stim
 from ldpc.sinter_decoders import SinterBeliefFindDecoder
+from qec_lego_bench.decoders.ldpc_compiled import (
+    LdpcCompiledDecoder,
+    check_matrices_of,
+)
 
 
 @decoder_cli("BPUF", "BP_UF")
@@ -40,6 +45,31 @@ class BPUF(sinter.Decoder):
     # format: 4 f32s for each iteration: elapsed, posterior_weight, prior_weight
     trace_filename: Optional[str] = None
 
+    def compile_decoder_for_dem(
+        self, *, dem: stim.DetectorErrorModel
+    ) -> sinter.CompiledDecoder:
+        if self.trace_filename is not None:
+            # this option needs the customized ldpc package and is only wired through files
+            raise NotImplementedError()
+        from ldpc.belief_find_decoder import BeliefFindDecoder
+
+        matrices = check_matrices_of(dem)
+        decoder = BeliefFindDecoder(
+            matrices.check_matrix,
+            error_channel=list(matrices.priors),
+            max_iter=self.max_iter,
+            bp_method=self.bp_method,
+            ms_scaling_factor=self.ms_scaling_factor,
+            schedule=self.schedule,
+            omp_thread_count=self.omp_thread_count,
+            serial_schedule_order=self.serial_schedule_order,
+            uf_method=self.uf_method,
+            bits_per_step=self.bits_per_step,
+        )
+        return LdpcCompiledDecoder(
+            decoder, matrices.observables_matrix, dem.num_detectors, dem.num_observables
+        )
+
     def decode_via_files(
         self,
         *,
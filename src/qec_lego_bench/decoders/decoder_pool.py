@@ -0,0 +1,198 @@
+"""
+Process-local pool of warm (compiled) decoders
+
+Building a decoder for a DEM (parsing the DEM, constructing the parity check matrices or the
+matching graph, allocating the solver) is often much more expensive than decoding a batch of
+shots. The pool keeps the compiled decoders keyed by (decoder string, DEM hash) so that repeated
+benchmarks on the same DEM only pay for decoding. Entries are evicted in LRU order when either
+the number of entries or the estimated memory usage exceeds the limit.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Optional
+import hashlib
+import pathlib
+import time
+import numpy as np
+import sinter
+import stim
+from qec_lego_bench.cache import dem_hash
+
+DEFAULT_POOL_MAX_DECODERS = 16
+DEFAULT_POOL_MAX_BYTES = 4 * 1024**3
+DEFAULT_DECODE_CHUNK_SHOTS = 2**16
+
+
+@dataclass
+class PooledDecoder:
+    compiled: sinter.CompiledDecoder
+    # estimated from the increase of the resident memory while compiling the decoder
+    num_bytes: int
+
+
+class DecoderPool:
+    def __init__(
+        self,
+        max_decoders: int = DEFAULT_POOL_MAX_DECODERS,
+        max_bytes: int = DEFAULT_POOL_MAX_BYTES,
+    ):
+        assert max_decoders > 0
+        self.max_decoders = max_decoders
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[tuple[str, ...], PooledDecoder] = OrderedDict()
+        # decoders that do not implement `compile_decoder_for_dem`
+        self.not_compilable: set[str] = set()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def num_bytes(self) -> int:
+        return sum(entry.num_bytes for entry in self.entries.values())
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.not_compilable.clear()
+
+    def reserve(self, max_decoders: int) -> None:
+        """
+        keep at least `max_decoders` decoders; a task that cycles through more decoders than the
+        pool holds would otherwise evict each of them right before it is used again
+        """
+        self.max_decoders = max(self.max_decoders, max_decoders)
+
+    def compiled_decoder_for(
+        self,
+        decoder_str: str,
+        decoder: sinter.Decoder,
+        dem: stim.DetectorErrorModel,
+        circuit: Optional[stim.Circuit] = None,
+    ) -> Optional[sinter.CompiledDecoder]:
+        """
+        Return the warm compiled decoder, or None if the decoder does not support compilation or
+        writes output files (see `writes_output_files`).
+        `circuit` must be given if the decoder instance was built with `with_circuit`.
+        """
+        compiled, _ = self.compiled_decoder_with_time(
+            decoder_str, decoder, dem, circuit
+        )
+        return compiled
+
+    def compiled_decoder_with_time(
+        self,
+        decoder_str: str,
+        decoder: sinter.Decoder,
+        dem: stim.DetectorErrorModel,
+        circuit: Optional[stim.Circuit] = None,
+    ) -> tuple[Optional[sinter.CompiledDecoder], float]:
+        """the same as `compiled_decoder_for`, also returning the compile time (0 if it was warm)"""
+        if decoder_str in self.not_compilable or writes_output_files(decoder):
+            return None, 0.0
+        key: tuple[str, ...] = (decoder_str, dem_hash(dem))
+        if circuit is not None:
+            key += (hashlib.sha256(str(circuit).encode("utf8")).hexdigest(),)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry.compiled, 0.0
+        self.misses += 1
+        rss_before = resident_memory()
+        start = time.perf_counter()
+        try:
+            compiled = decoder.compile_decoder_for_dem(dem=dem)
+        except NotImplementedError:
+            self.not_compilable.add(decoder_str)
+            return None, 0.0
+        compile_time = time.perf_counter() - start
+        entry = PooledDecoder(
+            compiled=compiled, num_bytes=max(0, resident_memory() - rss_before)
+        )
+        self.entries[key] = entry
+        self.evict()
+        return compiled, compile_time
+
+    def evict(self) -> None:
+        # always keep the most recently used decoder even if it alone exceeds the memory limit
+        while len(self.entries) > 1 and (
+            len(self.entries) > self.max_decoders or self.num_bytes > self.max_bytes
+        ):
+            self.entries.popitem(last=False)
+
+
+decoder_pool = DecoderPool()
+
+# options of the decoders that write output files; a compiled decoder reopens these files on every
+# call (e.g. once per chunk of shots), so such decoders must decode all the shots in a single call
+# via files instead, and they are never pooled
+OUTPUT_FILE_OPTIONS = ("trace_filename", "benchmark_suite_filename")
+
+
+def writes_output_files(decoder: Any) -> bool:
+    return any(
+        getattr(decoder, option, None) is not None for option in OUTPUT_FILE_OPTIONS
+    )
+
+
+def resident_memory() -> int:
+    import psutil
+
+    return psutil.Process().memory_info().rss
+
+
+def read_into(f: BinaryIO, buffer: np.ndarray) -> int:
+    """Fill a contiguous buffer from the file, tolerating partial reads (e.g. from named pipes)."""
+    view = memoryview(buffer).cast("B")
+    filled = 0
+    while filled < len(view):
+        count = f.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def decode_b8_file(
+    compiled_decoder: sinter.CompiledDecoder,
+    *,
+    num_shots: int,
+    num_dets: int,
+    dets_b8_in_path: pathlib.Path | str,
+    obs_predictions_b8_out_path: pathlib.Path | str,
+    chunk_shots: int = DEFAULT_DECODE_CHUNK_SHOTS,
+) -> None:
+    """decode a b8 detection event file with a compiled decoder, streaming the shots in large chunks"""
+    num_det_bytes = (num_dets + 7) // 8
+    chunk_shots = max(1, min(chunk_shots, num_shots))
+    dets_buffer = np.empty((chunk_shots, num_det_bytes), dtype=np.uint8)
+    with open(dets_b8_in_path, "rb") as dets_in_f:
+        with open(obs_predictions_b8_out_path, "wb") as obs_out_f:
+            for start in range(0, num_shots, chunk_shots):
+                shots = min(chunk_shots, num_shots - start)
+                dets_bit_packed = dets_buffer[:shots]
+                if read_into(dets_in_f, dets_bit_packed) != dets_bit_packed.nbytes:
+                    raise IOError("Missing dets data.")
+                predictions = compiled_decoder.decode_shots_bit_packed(
+                    bit_packed_detection_event_data=dets_bit_packed
+                )
+                obs_out_f.write(np.ascontiguousarray(predictions).tobytes())
+
+
+def decode_bit_packed(
+    compiled_decoder: sinter.CompiledDecoder,
+    dets_bit_packed: np.ndarray,
+    num_obs: int,
+    chunk_shots: int = DEFAULT_DECODE_CHUNK_SHOTS,
+) -> np.ndarray:
+    """decode bit packed detection events already in memory, in chunks to bound the temporary memory"""
+    num_shots = dets_bit_packed.shape[0]
+    predictions = np.empty((num_shots, (num_obs + 7) // 8), dtype=np.uint8)
+    for start in range(0, num_shots, max(1, chunk_shots)):
+        end = min(start + chunk_shots, num_shots)
+        predictions[start:end] = compiled_decoder.decode_shots_bit_packed(
+            bit_packed_detection_event_data=dets_bit_packed[start:end]
+        )
+    return predictions
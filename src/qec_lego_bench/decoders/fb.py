@@ -8,10 +8,14 @@ Fusion Blossom Decoder
 
 """
 
-import math
+import os
+import sys
 import pathlib
-from typing import Callable, List, TYPE_CHECKING, Tuple
+from typing import List, TYPE_CHECKING, Tuple
 from qec_lego_bench.cli.decoders import decoder_cli
+from qec_lego_bench.cache import LRUCache, cache_dir, dem_hash
+from qec_lego_bench.decoders.flatten_dem import flatten_dem
+from qec_lego_bench.decoders.decoder_pool import decode_b8_file
 from dataclasses import dataclass
 
 
@@ -42,37 +46,65 @@ class FusionBlossomCompiledDecoder(CompiledDecoder):
         *,
         bit_packed_detection_event_data: "np.ndarray",
     ) -> "np.ndarray":
-        num_shots = bit_packed_detection_event_data.shape[0]
-        predictions = np.zeros(
-            shape=(num_shots, (self.num_obs + 7) // 8), dtype=np.uint8
-        )
         import fusion_blossom
 
-        for shot in range(num_shots):
-            dets_sparse = np.flatnonzero(
-                np.unpackbits(
-                    bit_packed_detection_event_data[shot],
-                    count=self.num_dets,
-                    bitorder="little",
-                )
-            )
-            syndrome = fusion_blossom.SyndromePattern(syndrome_vertices=dets_sparse)  # type: ignore
-            self.solver.solve(syndrome)
-            prediction = int(
-                np.bitwise_xor.reduce(self.fault_masks[self.solver.subgraph()])
-            )
-            predictions[shot] = np.packbits(
-                np.array(
-                    list(np.binary_repr(prediction, width=self.num_obs))[::-1],
-                    dtype=np.uint8,
-                ),
+        num_shots = bit_packed_detection_event_data.shape[0]
+        # unpack the whole batch at once and split the sparse defects by shot;
+        # `np.nonzero` returns the indices in row-major order, so each shot is a contiguous range
+        shot_indices, dets_sparse = np.nonzero(
+            np.unpackbits(
+                bit_packed_detection_event_data,
+                axis=1,
+                count=self.num_dets,
                 bitorder="little",
             )
+        )
+        boundaries = np.searchsorted(shot_indices, np.arange(num_shots + 1))
+        subgraphs: List[List[int]] = []
+        for shot in range(num_shots):
+            start, end = boundaries[shot], boundaries[shot + 1]
+            if start == end:
+                subgraphs.append([])  # trivial syndrome, no need to call the solver
+                continue
+            syndrome = fusion_blossom.SyndromePattern(syndrome_vertices=dets_sparse[start:end])  # type: ignore
+            self.solver.solve(syndrome)
+            subgraphs.append(self.solver.subgraph())
             self.solver.clear()
-        return predictions
+        return pack_observable_masks(
+            xor_reduce_fault_masks(self.fault_masks, subgraphs), self.num_obs
+        )
+
+
+def xor_reduce_fault_masks(
+    fault_masks: np.ndarray, subgraphs: List[List[int]]
+) -> np.ndarray:
+    """XOR the fault masks of the matched edges of every shot in a single vectorized pass."""
+    lengths = np.fromiter((len(subgraph) for subgraph in subgraphs), dtype=np.int64)
+    edges = np.fromiter(
+        (edge for subgraph in subgraphs for edge in subgraph),
+        dtype=np.int64,
+        count=int(lengths.sum()),
+    )
+    masks = np.zeros(len(subgraphs), dtype=np.uint64)
+    np.bitwise_xor.at(
+        masks, np.repeat(np.arange(len(subgraphs)), lengths), fault_masks[edges]
+    )
+    return masks
+
+
+def pack_observable_masks(masks: np.ndarray, num_obs: int) -> np.ndarray:
+    """Convert integer observable masks into bit packed (little endian) predictions."""
+    assert num_obs <= 64, "fault masks only support up to 64 observables"
+    return (
+        masks.astype("<u8")
+        .view(np.uint8)
+        .reshape((len(masks), 8))[:, : (num_obs + 7) // 8]
+        .copy()
+    )
 
 
 DEFAULT_MAX_HALF_WEIGHT = 2**10
+DEFAULT_CHUNK_SHOTS = 2**16
 
 
 @decoder_cli("FusionBlossomDecoder", "fusion_blossom", "fb", decompose_errors=True)
@@ -82,6 +114,8 @@ class FusionBlossomDecoder(Decoder):
 
     max_tree_size: int | None = None
     max_half_weight: int = DEFAULT_MAX_HALF_WEIGHT
+    # number of shots read from the file and decoded together in `decode_via_files`
+    chunk_shots: int = DEFAULT_CHUNK_SHOTS
 
     def compile_decoder_for_dem(
         self, *, dem: "stim.DetectorErrorModel"
@@ -117,102 +151,122 @@ class FusionBlossomDecoder(Decoder):
         obs_predictions_b8_out_path: pathlib.Path,
         tmp_dir: pathlib.Path,
     ) -> None:
-        try:
-            import fusion_blossom
-        except ImportError as ex:
-            raise ImportError(
-                "The decoder 'fusion_blossom' isn't installed\n"
-                "To fix this, install the python package 'fusion-blossom' into your environment.\n"
-                "For example, if you are using pip, run `pip install fusion-blossom~=0.1.4`.\n"
-            ) from ex
+        compiled_decoder = self.compile_decoder_for_dem(
+            dem=stim.DetectorErrorModel.from_file(dem_path)
+        )
+        # stream the shots in large chunks to avoid a pair of tiny syscalls per shot
+        decode_b8_file(
+            compiled_decoder,
+            num_shots=num_shots,
+            num_dets=num_dets,
+            dets_b8_in_path=dets_b8_in_path,
+            obs_predictions_b8_out_path=obs_predictions_b8_out_path,
+            chunk_shots=self.chunk_shots,
+        )
 
-        error_model = stim.DetectorErrorModel.from_file(dem_path)
-        solver, fault_masks = (
-            detector_error_model_to_fusion_blossom_solver_and_fault_masks(
-                error_model,
-                max_tree_size=self.max_tree_size,
-                max_half_weight=self.max_half_weight,
+
+@dataclass
+class FusionBlossomGraph:
+    num_detectors: int
+    edges: np.ndarray  # shape (num_edges, 2); the boundary vertex is `num_detectors`
+    weights: np.ndarray  # rescaled even integer weights
+    fault_masks: np.ndarray
+
+    def save(self, path: str) -> None:
+        # write to a temporary file first so that concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                num_detectors=self.num_detectors,
+                edges=self.edges,
+                weights=self.weights,
+                fault_masks=self.fault_masks,
             )
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str) -> "FusionBlossomGraph":
+        with np.load(path) as data:
+            return FusionBlossomGraph(
+                num_detectors=int(data["num_detectors"]),
+                edges=data["edges"],
+                weights=data["weights"],
+                fault_masks=data["fault_masks"],
+            )
+
+
+# compiled graphs keyed by (DEM hash, max_half_weight)
+fusion_blossom_graph_cache: LRUCache[Tuple[str, int], FusionBlossomGraph] = LRUCache(
+    maxsize=16
+)
+
+
+def fusion_blossom_graph_of(
+    model: stim.DetectorErrorModel, max_half_weight: int = DEFAULT_MAX_HALF_WEIGHT
+) -> FusionBlossomGraph:
+    """Get the matching graph of a DEM, looking up the in-process and on-disk caches first."""
+    key = (dem_hash(model), max_half_weight)
+    graph = fusion_blossom_graph_cache.get(key)
+    if graph is not None:
+        return graph
+    directory = cache_dir("fusion_blossom")
+    path = (
+        None
+        if directory is None
+        else os.path.join(directory, f"{key[0]}.{max_half_weight}.npz")
+    )
+    if path is not None and os.path.exists(path):
+        try:
+            graph = FusionBlossomGraph.load(path)
+        except Exception as e:
+            print(f"[warning] failed to load cached graph {path}: {e}", file=sys.stderr)
+    if graph is None:
+        graph = build_fusion_blossom_graph(model, max_half_weight)
+        if path is not None:
+            try:
+                graph.save(path)
+            except OSError as e:
+                print(f"[warning] failed to cache graph {path}: {e}", file=sys.stderr)
+    for array in (graph.edges, graph.weights, graph.fault_masks):
+        array.setflags(write=False)  # shared by all the compiled decoders
+    fusion_blossom_graph_cache.put(key, graph)
+    return graph
+
+
+def build_fusion_blossom_graph(
+    model: stim.DetectorErrorModel, max_half_weight: int = DEFAULT_MAX_HALF_WEIGHT
+) -> FusionBlossomGraph:
+    num_detectors = model.num_detectors
+    flattened = flatten_dem(model, split_components=True)
+    counts = flattened.detector_counts
+    # Errors with zero probability are skipped. Errors without symptoms are also skipped:
+    # code probably has distance 1; accept it and keep going, though of course decoding will
+    # probably perform terribly.
+    keep = (flattened.probabilities != 0) & (counts > 0)
+    if np.any(keep & (counts > 2)):
+        row = int(np.flatnonzero(keep & (counts > 2))[0])
+        raise NotImplementedError(
+            f"Error with more than 2 symptoms can't become an edge or boundary edge: {flattened.detectors_of(row).tolist()!r}."
         )
-        num_det_bytes = math.ceil(num_dets / 8)
-        with open(dets_b8_in_path, "rb") as dets_in_f:
-            with open(obs_predictions_b8_out_path, "wb") as obs_out_f:
-                for _ in range(num_shots):
-                    dets_bit_packed = np.fromfile(
-                        dets_in_f, dtype=np.uint8, count=num_det_bytes
-                    )
-                    if dets_bit_packed.shape != (num_det_bytes,):
-                        raise IOError("Missing dets data.")
-                    dets_sparse = np.flatnonzero(
-                        np.unpackbits(
-                            dets_bit_packed, count=num_dets, bitorder="little"
-                        )
-                    )
-                    syndrome = fusion_blossom.SyndromePattern(  # type: ignore
-                        syndrome_vertices=dets_sparse
-                    )
-                    solver.solve(syndrome)
-                    prediction = int(
-                        np.bitwise_xor.reduce(fault_masks[solver.subgraph()])
-                    )
-                    obs_out_f.write(
-                        prediction.to_bytes((num_obs + 7) // 8, byteorder="little")
-                    )
-                    solver.clear()
-
-
-def iter_flatten_model(
-    model: stim.DetectorErrorModel,
-    handle_error: Callable[[float, List[int], List[int]], None],
-    handle_detector_coords: Callable[[int, np.ndarray], None],
-):
-    det_offset = 0
-    coords_offset = np.zeros(100, dtype=np.float64)
-
-    def _helper(m: stim.DetectorErrorModel, reps: int):
-        nonlocal det_offset
-        nonlocal coords_offset
-        for _ in range(reps):
-            for instruction in m:
-                if isinstance(instruction, stim.DemRepeatBlock):
-                    _helper(instruction.body_copy(), instruction.repeat_count)
-                elif isinstance(instruction, stim.DemInstruction):
-                    if instruction.type == "error":
-                        dets: List[int] = []
-                        frames: List[int] = []
-                        t: stim.DemTarget
-                        p = instruction.args_copy()[0]
-                        for t in instruction.targets_copy():
-                            if t.is_relative_detector_id():
-                                dets.append(t.val + det_offset)
-                            elif t.is_logical_observable_id():
-                                frames.append(t.val)
-                            elif t.is_separator():
-                                # Treat each component of a decomposed error as an independent error.
-                                # (Ideally we could configure some sort of correlated analysis; oh well.)
-                                handle_error(p, dets, frames)
-                                frames = []
-                                dets = []
-                        # Handle last component.
-                        handle_error(p, dets, frames)
-                    elif instruction.type == "shift_detectors":
-                        det_offset += instruction.targets_copy()[0]
-                        a = np.array(instruction.args_copy())
-                        coords_offset[: len(a)] += a
-                    elif instruction.type == "detector":
-                        a = np.array(instruction.args_copy())
-                        for t in instruction.targets_copy():
-                            handle_detector_coords(
-                                t.val + det_offset, a + coords_offset[: len(a)]
-                            )
-                    elif instruction.type == "logical_observable":
-                        pass
-                    else:
-                        raise NotImplementedError()
-                else:
-                    raise NotImplementedError()
-
-    _helper(model, 1)
+    starts = flattened.detector_indptr[:-1][keep]
+    counts = counts[keep]
+    first = flattened.detector_indices[starts]
+    # single-symptom errors become boundary edges to the virtual vertex `num_detectors`
+    second_index = np.minimum(starts + 1, len(flattened.detector_indices) - 1)
+    second = np.where(
+        counts == 2, flattened.detector_indices[second_index], num_detectors
+    )
+    # fusion_blossom doesn't support negative edge weights; approximate them as weight 0.
+    p = np.minimum(flattened.probabilities[keep], 0.5)
+    weights = np.log((1 - p) / p)
+    max_weight = max(1e-4, weights.max() if len(weights) else 1)
+    return FusionBlossomGraph(
+        num_detectors=num_detectors,
+        edges=np.stack([first, second], axis=1).astype(np.int64).reshape((-1, 2)),
+        weights=np.round(weights * max_half_weight / max_weight).astype(np.int64) * 2,
+        fault_masks=flattened.observable_masks[keep],
+    )
 
 
 def detector_error_model_to_fusion_blossom_solver_and_fault_masks(
@@ -220,52 +274,23 @@ def detector_error_model_to_fusion_blossom_solver_and_fault_masks(
     max_tree_size: int | None = None,
     max_half_weight: int = DEFAULT_MAX_HALF_WEIGHT,
 ) -> Tuple["fusion_blossom.SolverSerial", np.ndarray]:  # type: ignore
-    """Convert a stim error model into a NetworkX graph."""
+    """Convert a stim error model into a fusion blossom solver."""
 
     import fusion_blossom
 
-    def handle_error(p: float, dets: List[int], frame_changes: List[int]):
-        if p == 0:
-            return
-        if len(dets) == 0:
-            # No symptoms for this error.
-            # Code probably has distance 1.
-            # Accept it and keep going, though of course decoding will probably perform terribly.
-            return
-        if len(dets) == 1:
-            dets = [dets[0], num_detectors]
-        if len(dets) > 2:
-            raise NotImplementedError(
-                f"Error with more than 2 symptoms can't become an edge or boundary edge: {dets!r}."
-            )
-        if p > 0.5:
-            # fusion_blossom doesn't support negative edge weights.
-            # approximate them as weight 0.
-            p = 0.5
-        weight = math.log((1 - p) / p)
-        mask = sum(1 << k for k in frame_changes)
-        edges.append((dets[0], dets[1], weight, mask))
-
-    def handle_detector_coords(detector: int, coords: np.ndarray):
-        pass
-
-    num_detectors = model.num_detectors
-    edges: List[Tuple[int, int, float, int]] = []
-    iter_flatten_model(
-        model,
-        handle_error=handle_error,
-        handle_detector_coords=handle_detector_coords,
+    graph = fusion_blossom_graph_of(model, max_half_weight=max_half_weight)
+    rescaled_edges = list(
+        zip(
+            graph.edges[:, 0].tolist(),
+            graph.edges[:, 1].tolist(),
+            graph.weights.tolist(),
+        )
     )
-    max_weight = max(1e-4, max((w for _, _, w, _ in edges), default=1))
-    rescaled_edges = [
-        (a, b, round(w * max_half_weight / max_weight) * 2) for a, b, w, _ in edges
-    ]
-    fault_masks = np.array([e[3] for e in edges], dtype=np.uint64)
 
     initializer = fusion_blossom.SolverInitializer(  # type: ignore
-        num_detectors + 1,  # Total number of nodes.
+        graph.num_detectors + 1,  # Total number of nodes.
         rescaled_edges,  # Weighted edges.
-        [num_detectors],  # Boundary node.
+        [graph.num_detectors],  # Boundary node.
     )
 
-    return fusion_blossom.SolverSerial(initializer, max_tree_size=max_tree_size), fault_masks  # type: ignore
+    return fusion_blossom.SolverSerial(initializer, max_tree_size=max_tree_size), graph.fault_masks  # type: ignore
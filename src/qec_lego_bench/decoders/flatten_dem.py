@@ -0,0 +1,194 @@
+"""
+Vectorized flattening of a detector error model
+
+A `stim.DetectorErrorModel` is converted into CSR arrays: one row per error (or per component of a
+decomposed error), with its probability, the absolute detector indices and the observable mask.
+The body of every repeat block is parsed only once and then expanded by array offset arithmetic,
+so the cost is linear in the size of the output instead of walking the body for every repetition.
+Graph-based decoders (e.g. fusion blossom) and matrix-based decoders can build their inputs from
+these arrays directly.
+"""
+
+from dataclasses import dataclass
+import numpy as np
+import stim
+
+
+@dataclass
+class FlattenedDem:
+    probabilities: np.ndarray  # float64, one entry per row
+    detector_indptr: np.ndarray  # int64, row i has detectors[indptr[i]:indptr[i+1]]
+    detector_indices: np.ndarray  # int64, absolute detector indices
+    observable_masks: np.ndarray  # uint64, bit k is set if the row flips observable k
+    # int64, the index of the DEM error (in the order sampled by stim) of each row
+    error_indices: np.ndarray
+    num_detectors: int = 0
+    num_observables: int = 0
+    # the number of error instructions after unrolling the repeat blocks
+    num_errors: int = 0
+
+    def __len__(self) -> int:
+        return len(self.probabilities)
+
+    @property
+    def detector_counts(self) -> np.ndarray:
+        return np.diff(self.detector_indptr)
+
+    def detectors_of(self, row: int) -> np.ndarray:
+        return self.detector_indices[
+            self.detector_indptr[row] : self.detector_indptr[row + 1]
+        ]
+
+    def repeat(
+        self, repeat_count: int, detector_shift: int, error_shift: int
+    ) -> "FlattenedDem":
+        """unroll `repeat_count` copies, each shifted by the detectors and errors of one iteration"""
+        num_rows = len(self)
+        num_indices = len(self.detector_indices)
+        iterations = np.arange(repeat_count, dtype=np.int64)
+        return FlattenedDem(
+            probabilities=np.tile(self.probabilities, repeat_count),
+            detector_indptr=_indptr_of(np.tile(self.detector_counts, repeat_count)),
+            detector_indices=np.tile(self.detector_indices, repeat_count)
+            + np.repeat(iterations * detector_shift, num_indices),
+            observable_masks=np.tile(self.observable_masks, repeat_count),
+            error_indices=np.tile(self.error_indices, repeat_count)
+            + np.repeat(iterations * error_shift, num_rows),
+        )
+
+    def shifted(self, detector_shift: int, error_shift: int) -> "FlattenedDem":
+        return FlattenedDem(
+            probabilities=self.probabilities,
+            detector_indptr=self.detector_indptr,
+            detector_indices=self.detector_indices + detector_shift,
+            observable_masks=self.observable_masks,
+            error_indices=self.error_indices + error_shift,
+        )
+
+    @staticmethod
+    def concatenate(parts: list["FlattenedDem"]) -> "FlattenedDem":
+        if len(parts) == 0:
+            return FlattenedDem(
+                probabilities=np.zeros(0, dtype=np.float64),
+                detector_indptr=np.zeros(1, dtype=np.int64),
+                detector_indices=np.zeros(0, dtype=np.int64),
+                observable_masks=np.zeros(0, dtype=np.uint64),
+                error_indices=np.zeros(0, dtype=np.int64),
+            )
+        if len(parts) == 1:
+            return parts[0]
+        return FlattenedDem(
+            probabilities=np.concatenate([part.probabilities for part in parts]),
+            detector_indptr=_indptr_of(
+                np.concatenate([part.detector_counts for part in parts])
+            ),
+            detector_indices=np.concatenate([part.detector_indices for part in parts]),
+            observable_masks=np.concatenate([part.observable_masks for part in parts]),
+            error_indices=np.concatenate([part.error_indices for part in parts]),
+        )
+
+
+def _indptr_of(counts: np.ndarray) -> np.ndarray:
+    indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr
+
+
+class _ErrorAccumulator:
+    """collect consecutive error instructions in python lists before converting them to arrays"""
+
+    def __init__(self):
+        self.probabilities: list[float] = []
+        self.counts: list[int] = []
+        self.detectors: list[int] = []
+        self.masks: list[int] = []
+        self.error_indices: list[int] = []
+
+    def add(self, p: float, dets: list[int], mask: int, error_index: int):
+        self.probabilities.append(p)
+        self.counts.append(len(dets))
+        self.detectors.extend(dets)
+        self.masks.append(mask)
+        self.error_indices.append(error_index)
+
+    def flush(self, parts: list[FlattenedDem]):
+        if len(self.probabilities) == 0:
+            return
+        parts.append(
+            FlattenedDem(
+                probabilities=np.array(self.probabilities, dtype=np.float64),
+                detector_indptr=_indptr_of(np.array(self.counts, dtype=np.int64)),
+                detector_indices=np.array(self.detectors, dtype=np.int64),
+                observable_masks=np.array(self.masks, dtype=np.uint64),
+                error_indices=np.array(self.error_indices, dtype=np.int64),
+            )
+        )
+        self.__init__()
+
+
+def _flatten_block(
+    block: stim.DetectorErrorModel, split_components: bool
+) -> tuple[FlattenedDem, int, int]:
+    """flatten one block (relative to its start); returns the arrays, the detector shift and the number of errors"""
+    parts: list[FlattenedDem] = []
+    accumulator = _ErrorAccumulator()
+    det_offset = 0
+    num_errors = 0
+    for instruction in block:
+        if isinstance(instruction, stim.DemRepeatBlock):
+            accumulator.flush(parts)
+            body, body_shift, body_errors = _flatten_block(
+                instruction.body_copy(), split_components
+            )
+            repeat_count = instruction.repeat_count
+            parts.append(
+                body.repeat(repeat_count, body_shift, body_errors).shifted(
+                    det_offset, num_errors
+                )
+            )
+            det_offset += body_shift * repeat_count
+            num_errors += body_errors * repeat_count
+        elif isinstance(instruction, stim.DemInstruction):
+            if instruction.type == "error":
+                p = instruction.args_copy()[0]
+                dets: list[int] = []
+                mask = 0
+                for t in instruction.targets_copy():
+                    if t.is_relative_detector_id():
+                        dets.append(t.val + det_offset)
+                    elif t.is_logical_observable_id():
+                        assert t.val < 64, "only support up to 64 observables"
+                        mask ^= 1 << t.val
+                    elif t.is_separator() and split_components:
+                        # Treat each component of a decomposed error as an independent error.
+                        accumulator.add(p, dets, mask, num_errors)
+                        dets = []
+                        mask = 0
+                accumulator.add(p, dets, mask, num_errors)
+                num_errors += 1
+            elif instruction.type == "shift_detectors":
+                det_offset += instruction.targets_copy()[0]
+            elif instruction.type in ("detector", "logical_observable"):
+                pass
+            else:
+                raise NotImplementedError(instruction.type)
+        else:
+            raise NotImplementedError()
+    accumulator.flush(parts)
+    return FlattenedDem.concatenate(parts), det_offset, num_errors
+
+
+def flatten_dem(
+    dem: stim.DetectorErrorModel, split_components: bool = True
+) -> FlattenedDem:
+    """
+    Flatten the DEM into CSR arrays.
+    When `split_components` is True, each component of a decomposed error (separated by `^`) is a
+    separate row sharing the probability of the error; otherwise each error is exactly one row
+    and the rows are in the same order as the errors sampled by stim.
+    """
+    flattened, _, num_errors = _flatten_block(dem, split_components)
+    flattened.num_detectors = dem.num_detectors
+    flattened.num_observables = dem.num_observables
+    flattened.num_errors = num_errors
+    return flattened
@@ -0,0 +1,128 @@
+"""
+Compiled decoders for the BP-based decoders of the `ldpc` package
+
+The sinter wrappers in `ldpc.sinter_decoders` only implement `decode_via_files`, which rebuilds
+the parity check matrices and the decoder on every call. These helpers build them once per DEM
+so that the decoder can be kept warm, e.g. in the decoder pool. The matrices of a DEM are shared
+by all the decoders built for it, e.g. the parametrized decoders of a parameter sweep.
+
+`BpParameterSweep` decodes the same shots under every (max_iter, ms_scaling_factor) combination
+with a single `ldpc` decoder whose parameters are changed in place. BP stops at the first
+iteration where its hard decision satisfies the syndrome, so a shot that converges within t
+iterations has the same result for every max_iter >= t. Each scaling factor is thus decoded once
+with the largest max_iter, and only the shots that did not converge within a smaller candidate are
+decoded again with it (their post-processing depends on the BP state at that iteration).
+"""
+
+from typing import Any
+import numpy as np
+import sinter
+import stim
+from qec_lego_bench.cache import LRUCache, dem_hash
+
+check_matrices_cache: LRUCache[str, Any] = LRUCache(maxsize=8)
+
+
+def check_matrices_of(dem: stim.DetectorErrorModel):
+    """the check matrices, the priors and the observables matrix; do not modify them in place"""
+    from ldpc.ckt_noise.dem_matrices import detector_error_model_to_check_matrices
+
+    return check_matrices_cache.get_or_create(
+        dem_hash(dem),
+        lambda: detector_error_model_to_check_matrices(
+            dem, allow_undecomposed_hyperedges=True
+        ),
+    )
+
+
+class LdpcCompiledDecoder(sinter.CompiledDecoder):
+    """wrap any `ldpc` decoder with a `decode(syndrome) -> correction` method"""
+
+    def __init__(self, decoder, observables_matrix, num_dets: int, num_obs: int):
+        self.decoder = decoder
+        self.observables_matrix = observables_matrix
+        self.num_dets = num_dets
+        self.num_obs = num_obs
+
+    def decode_shots_bit_packed(
+        self,
+        *,
+        bit_packed_detection_event_data: np.ndarray,
+    ) -> np.ndarray:
+        dets = np.unpackbits(
+            bit_packed_detection_event_data,
+            axis=1,
+            count=self.num_dets,
+            bitorder="little",
+        )
+        predictions = np.zeros((dets.shape[0], self.num_obs), dtype=np.uint8)
+        for shot in range(dets.shape[0]):
+            correction = self.decoder.decode(dets[shot])
+            predictions[shot] = (self.observables_matrix @ correction) % 2
+        return np.packbits(predictions, axis=1, bitorder="little")
+
+
+class BpParameterSweep:
+    """decode the same shots with the BP-based decoder under every parameter combination"""
+
+    def __init__(
+        self,
+        compiled: LdpcCompiledDecoder,
+        max_iter_choices: list[int],
+        ms_scaling_factor_choices: list[float],
+    ):
+        self.compiled = compiled
+        self.max_iter_choices = max_iter_choices
+        self.ms_scaling_factor_choices = ms_scaling_factor_choices
+
+    def effective_max_iter(self, max_iter: int) -> int:
+        # `ldpc` runs as many iterations as the number of bits if max_iter is 0
+        return max_iter if max_iter > 0 else self.compiled.decoder.bit_count
+
+    def decode_shots_bit_packed(
+        self, *, bit_packed_detection_event_data: np.ndarray
+    ) -> dict[tuple[int, float], np.ndarray]:
+        """the bit packed predictions of each (max_iter, ms_scaling_factor)"""
+        decoder = self.compiled.decoder
+        dets = np.unpackbits(
+            bit_packed_detection_event_data,
+            axis=1,
+            count=self.compiled.num_dets,
+            bitorder="little",
+        )
+        num_shots = dets.shape[0]
+        max_iter_choices = sorted(
+            set(self.max_iter_choices), key=self.effective_max_iter, reverse=True
+        )
+        original = (decoder.max_iter, decoder.ms_scaling_factor)
+        results: dict[tuple[int, float], np.ndarray] = {}
+        try:
+            for ms_scaling_factor in self.ms_scaling_factor_choices:
+                decoder.ms_scaling_factor = ms_scaling_factor
+                predictions = np.zeros(
+                    (num_shots, self.compiled.num_obs), dtype=np.uint8
+                )
+                iterations = np.zeros(num_shots, dtype=np.int64)
+                converged = np.zeros(num_shots, dtype=bool)
+                for index, max_iter in enumerate(max_iter_choices):
+                    decoder.max_iter = max_iter
+                    if index == 0:
+                        shots = np.arange(num_shots)
+                    else:
+                        shots = np.flatnonzero(
+                            ~converged
+                            | (iterations > self.effective_max_iter(max_iter))
+                        )
+                    for shot in shots:
+                        correction = decoder.decode(dets[shot])
+                        predictions[shot] = (
+                            self.compiled.observables_matrix @ correction
+                        ) % 2
+                        iterations[shot] = decoder.iter
+                        converged[shot] = decoder.converge
+                    results[(max_iter, ms_scaling_factor)] = np.packbits(
+                        predictions, axis=1, bitorder="little"
+                    )
+        finally:
+            decoder.max_iter, decoder.ms_scaling_factor = original
+        return results
@@ -3,6 +3,7 @@ from typing import Optional
 from dataclasses import dataclass
 import pathlib
 import sinter
+import stim
 from relay_bp.stim import SinterDecoder_RelayBP
 import numpy as np
 
@@ -27,18 +28,8 @@ class RelayBP(sinter.Decoder):
     prune_decided_errors: bool = True
     threshold: float = 0.0
 
-    def decode_via_files(
-        self,
-        *,
-        num_shots: int,
-        num_dets: int,
-        num_obs: int,
-        dem_path: pathlib.Path,
-        dets_b8_in_path: pathlib.Path,
-        obs_predictions_b8_out_path: pathlib.Path,
-        tmp_dir: pathlib.Path,
-    ) -> None:
-        decoder = SinterDecoder_RelayBP(
+    def sinter_decoder(self) -> sinter.Decoder:
+        return SinterDecoder_RelayBP(
             alpha=self.alpha,
             gamma0=self.gamma0,
             pre_iter=self.pre_iter,
@@ -57,6 +48,24 @@ class RelayBP(sinter.Decoder):
             prune_decided_errors=self.prune_decided_errors,
             threshold=self.threshold,
         )
+
+    def compile_decoder_for_dem(
+        self, *, dem: stim.DetectorErrorModel
+    ) -> sinter.CompiledDecoder:
+        return self.sinter_decoder().compile_decoder_for_dem(dem=dem)
+
+    def decode_via_files(
+        self,
+        *,
+        num_shots: int,
+        num_dets: int,
+        num_obs: int,
+        dem_path: pathlib.Path,
+        dets_b8_in_path: pathlib.Path,
+        obs_predictions_b8_out_path: pathlib.Path,
+        tmp_dir: pathlib.Path,
+    ) -> None:
+        decoder = self.sinter_decoder()
         return decoder.decode_via_files(
             num_shots=num_shots,
             num_dets=num_dets,
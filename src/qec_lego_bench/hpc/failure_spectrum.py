@@ -0,0 +1,330 @@
+"""
+Failure spectrum: the Monte Carlo result and function of the stratified sampling by fault weight
+
+Instead of sampling the noise model directly, which takes O(1/pL) shots at low p, each job samples
+shots with exactly w faults (see `qec_lego_bench.misc.failure_spectrum`) and estimates the
+conditional failure rate f(w) of the decoder. The logical error rate of any p in the sweep is then
+rebuilt by `FailureSpectrumResult.logical_error_rate`, weighting f(w) by the probability of w
+faults at that p. The weights beyond the sampled ones are not estimated; their total probability
+is added to the uncertainty as an upper bound of the missing contribution.
+
+Each result also keeps the weight distribution of the reference noise model, so that it reports
+the rebuilt pL at the reference p to the generic consumers: `stats_of` gives the binomial estimate
+with the same value and uncertainty, and `errors` the equivalent number of errors, so that the
+precision-based submitters stop once the rebuilt pL reaches the target precision (rather than
+once the high-weight strata, which fail almost always, have accumulated enough failures). Note
+that the probability of the weights that are not sampled is a floor of the uncertainty that more
+shots do not reduce, so choose the weights such that it is below the target precision.
+
+`ReweightingMonteCarloFunction` samples the noise model itself at a reference p but records the
+number of faults of each shot, so that a single run gives pL with error bars at the neighboring p
+values as well; its `MultiDecoderFailureSpectra` result is compatible with the multi-decoder
+plotters.
+"""
+
+from dataclasses import dataclass, field
+from dataclasses_json import dataclass_json
+from typing import Optional, Sequence
+import numpy as np
+import sinter
+import stim
+from uncertainties import ufloat
+from qec_lego_bench.cache import LRUCache
+from qec_lego_bench.cli.circuit_cache import (
+    cached_detector_error_model,
+    cached_noisy_circuit,
+)
+from qec_lego_bench.cli.decoders import DecoderCli
+from qec_lego_bench.cli.generate_samples import InMemorySamples
+from qec_lego_bench.decoders.decoder_pool import decoder_pool
+from qec_lego_bench.misc.failure_spectrum import FaultWeightSampler
+from qec_lego_bench.misc.telemetry import phase
+from qec_lego_bench.stats import Stats
+from .monte_carlo import MonteCarloJob
+
+
+@dataclass_json(undefined="RAISE")  # avoid accidentally override other types
+@dataclass
+class FailureSpectrumResult:  # MonteCarloResult
+    # the number of shots and of logical errors among the shots with exactly w faults, keyed by w
+    shots: dict[int, int] = field(default_factory=dict)
+    failures: dict[int, int] = field(default_factory=dict)
+    elapsed: float = 0
+    # P(W = w) of the reference noise model for w = 0..the largest sampled weight
+    reference_weight_probabilities: list[float] = field(default_factory=list)
+
+    def __add__(self, other: "FailureSpectrumResult") -> "FailureSpectrumResult":
+        shots = self.shots.copy()
+        failures = self.failures.copy()
+        for weight, value in other.shots.items():
+            shots[weight] = shots.get(weight, 0) + value
+        for weight, value in other.failures.items():
+            failures[weight] = failures.get(weight, 0) + value
+        # the same reference distribution, possibly truncated at different weights
+        reference_weight_probabilities = max(
+            self.reference_weight_probabilities,
+            other.reference_weight_probabilities,
+            key=len,
+        )
+        return FailureSpectrumResult(
+            shots=shots,
+            failures=failures,
+            elapsed=self.elapsed + other.elapsed,
+            reference_weight_probabilities=list(reference_weight_probabilities),
+        )
+
+    def equivalent_binomial(self) -> tuple[int, int]:
+        """
+        (shots, errors) of the binomial estimate with the same value and uncertainty as the rebuilt
+        pL at the reference noise model
+        """
+        pL = self.logical_error_rate(self.reference_weight_probabilities)
+        if pL.n <= 0 or pL.s <= 0:
+            return sum(self.shots.values()), 0
+        # uncertainty = 2.58 * sqrt(pL * (1 - pL) / shots), see `Stats.failure_rate_uncertainty`
+        shots = max(1, round((2.58 / pL.s) ** 2 * pL.n * (1 - pL.n)))
+        return shots, round(pL.n * shots)
+
+    @property
+    def errors(self) -> int:
+        # used by the submitter: the number of errors of a direct estimate as precise as the rebuilt pL
+        return self.equivalent_binomial()[1]
+
+    @property
+    def discards(self) -> int:
+        return 0
+
+    @property
+    def panics(self) -> int:
+        return 0
+
+    def stats_of(self, job: "MonteCarloJob") -> Stats:
+        """the rebuilt pL at the reference noise model, see `equivalent_binomial`"""
+        shots, errors = self.equivalent_binomial()
+        return Stats(
+            stats=sinter.AnonTaskStats(
+                shots=shots,
+                errors=errors,
+                seconds=job.duration,
+            ),
+        )
+
+    def conditional_stats(self, weight: int) -> Stats:
+        """the estimate of the conditional failure rate f(w)"""
+        return Stats(
+            stats=sinter.AnonTaskStats(
+                shots=self.shots.get(weight, 0),
+                errors=self.failures.get(weight, 0),
+            )
+        )
+
+    def logical_error_rate(self, weight_probabilities: Sequence[float]):
+        """
+        rebuild pL from P(W = w) for w = 0..len - 1 (see `FaultWeightSampler.weight_probabilities`);
+        f(0) = 0 if not sampled, and the probability of the other weights that have not been
+        sampled, as well as of the truncated tail, is added to the uncertainty
+        """
+        value = 0.0
+        variance = 0.0
+        unknown = max(0.0, 1.0 - float(np.sum(weight_probabilities)))
+        for weight, probability in enumerate(weight_probabilities):
+            shots = self.shots.get(weight, 0)
+            if shots == 0:
+                if weight != 0:
+                    unknown += probability
+                continue
+            rate = self.failures.get(weight, 0) / shots
+            value += probability * rate
+            variance += probability**2 * rate * (1 - rate) / shots
+        # 99% confidence interval, the same as `Stats.failure_rate_uncertainty`
+        return ufloat(value, 2.58 * np.sqrt(variance) + unknown)
+
+
+@dataclass_json(undefined="RAISE")  # avoid accidentally override other types
+@dataclass
+class MultiDecoderFailureSpectra:  # MonteCarloResult
+    results: dict[str, FailureSpectrumResult] = field(default_factory=dict)
+
+    def __add__(
+        self, other: "MultiDecoderFailureSpectra"
+    ) -> "MultiDecoderFailureSpectra":
+        results = self.results.copy()
+        for decoder, result in other.results.items():
+            if decoder in results:
+                results[decoder] += result
+            else:
+                results[decoder] = result
+        return MultiDecoderFailureSpectra(results=results)
+
+    @property
+    def errors(self) -> int:
+        # used by the submitter, return the smallest number of errors
+        errors = None
+        for result in self.results.values():
+            if errors is None or result.errors < errors:
+                errors = result.errors
+        return errors or 0
+
+    @property
+    def discards(self) -> int:
+        return 0
+
+    @property
+    def panics(self) -> int:
+        return 0
+
+    def stats_of(self, job: "MonteCarloJob") -> Stats:
+        # the least precise decoder, the same as `errors`
+        if len(self.results) == 0:
+            return Stats(stats=sinter.AnonTaskStats(seconds=job.duration))
+        result = min(self.results.values(), key=lambda result: result.errors)
+        return result.stats_of(job)
+
+
+# the samplers of the worker processes, keeping the tables of the weights across the tasks
+fault_weight_sampler_cache: LRUCache[tuple[str, str, bool], FaultWeightSampler] = (
+    LRUCache(maxsize=8)
+)
+
+
+def fault_weight_sampler_of(
+    code: str, noise: str, decoder: str = "none"
+) -> FaultWeightSampler:
+    decompose_errors = DecoderCli(decoder).decompose_errors
+    return fault_weight_sampler_cache.get_or_create(
+        (str(code), str(noise), decompose_errors),
+        lambda: FaultWeightSampler.from_dem(
+            cached_detector_error_model(code, noise, decompose_errors=decompose_errors)
+        ),
+    )
+
+
+def failure_spectrum_sweep(
+    result: FailureSpectrumResult,
+    code: str,
+    noise: str,
+    scales: Sequence[float],
+    decoder: str = "none",
+) -> list:
+    """pL at each scale of the odds of the reference noise model (approximately p / p_ref)"""
+    sampler = fault_weight_sampler_of(code, noise, decoder)
+    max_weight = max(result.shots.keys(), default=0)
+    return [
+        result.logical_error_rate(sampler.weight_probabilities(max_weight, scale))
+        for scale in scales
+    ]
+
+
+def representative_decoder_of(decoders: Sequence[str]) -> str:
+    """
+    the decoder whose DEM is sampled by `ReweightingMonteCarloFunction` for all the decoders: if any
+    decoder requires decomposing errors, the decomposed DEM is used for all of them; pass it to
+    `failure_spectrum_sweep` so that the weight distribution matches the sampled one
+    """
+    for decoder in decoders:
+        if DecoderCli(decoder).decompose_errors:
+            return decoder
+    return "none"
+
+
+def decode_by_weight(
+    circuit: stim.Circuit,
+    dem: stim.DetectorErrorModel,
+    samples_by_weight: dict[int, tuple[np.ndarray, np.ndarray]],
+    decoder: str,
+) -> FailureSpectrumResult:
+    result = FailureSpectrumResult()
+    for weight, (dets, obs) in samples_by_weight.items():
+        with InMemorySamples(circuit=circuit, dem=dem, dets=dets, obs=obs) as samples:
+            benchmark = samples.benchmark(
+                decoder=decoder, remove_initialization_time=True
+            )
+        result.elapsed += benchmark.elapsed
+        result.shots[weight] = benchmark.shots
+        result.failures[weight] = benchmark.errors
+    return result
+
+
+@dataclass
+class FailureSpectrumMonteCarloFunction:
+    # the fault weights to sample; the shots of each task are split evenly among them
+    weights: list[int]
+
+    def __call__(
+        self,
+        shots: int,
+        code: str,
+        noise: str,
+        decoder: str,
+        rng: Optional[np.random.Generator] = None,
+    ) -> tuple[int, FailureSpectrumResult]:
+        circuit = cached_noisy_circuit(code, noise)
+        dem = cached_detector_error_model(
+            code, noise, decompose_errors=DecoderCli(decoder).decompose_errors
+        )
+        sampler = fault_weight_sampler_of(code, noise, decoder)
+        if rng is None:  # every task draws independent samples
+            rng = np.random.default_rng()
+        samples_by_weight: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+        for index, weight in enumerate(self.weights):
+            weight_shots = shots // len(self.weights) + (
+                1 if index < shots % len(self.weights) else 0
+            )
+            if weight_shots == 0:
+                continue
+            with phase("sampling"):
+                samples_by_weight[weight] = sampler.sample(weight, weight_shots, rng)
+        result = decode_by_weight(circuit, dem, samples_by_weight, decoder)
+        result.reference_weight_probabilities = sampler.weight_probabilities(
+            max(self.weights)
+        ).tolist()
+        return shots, result
+
+
+@dataclass
+class ReweightingMonteCarloFunction:
+    """
+    Sample the DEM at the reference noise, recording the number of faults of each shot, and decode
+    the same shots with all the decoders. Unlike `FailureSpectrumMonteCarloFunction`, the shots
+    follow the noise model itself, so each result is also a direct estimate of pL at the reference
+    p; `failure_spectrum_sweep` reweights it to the neighboring p values.
+    """
+
+    decoders: list[str]
+
+    def __call__(
+        self,
+        shots: int,
+        code: str,
+        noise: str,
+        rng: Optional[np.random.Generator] = None,
+    ) -> tuple[int, MultiDecoderFailureSpectra]:
+        representative_decoder = representative_decoder_of(self.decoders)
+        circuit = cached_noisy_circuit(code, noise)
+        dem = cached_detector_error_model(
+            code,
+            noise,
+            decompose_errors=DecoderCli(representative_decoder).decompose_errors,
+        )
+        sampler = fault_weight_sampler_of(code, noise, representative_decoder)
+        # keep all the decoders warm in the worker process across the tasks
+        decoder_pool.reserve(len(self.decoders))
+        if rng is None:  # every task draws independent samples
+            rng = np.random.default_rng()
+        with phase("sampling"):
+            weights = sampler.sample_weights(shots, rng)
+            samples_by_weight = {
+                int(weight): sampler.sample(int(weight), int(count), rng)
+                for weight, count in enumerate(np.bincount(weights))
+                if count > 0
+            }
+        reference_weight_probabilities = sampler.weight_probabilities(
+            max(samples_by_weight.keys(), default=0)
+        ).tolist()
+        results = {
+            decoder: decode_by_weight(circuit, dem, samples_by_weight, decoder)
+            for decoder in self.decoders
+        }
+        for result in results.values():
+            result.reference_weight_probabilities = reference_weight_probabilities
+        return shots, MultiDecoderFailureSpectra(results=results)
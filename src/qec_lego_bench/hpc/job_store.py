@@ -2,9 +2,21 @@ from dataclasses import dataclass
 from dataclasses_json import dataclass_json
 import functools
 from stablehash import stablehash
-from typing import Sequence, Optional, Iterator, Any, Protocol, TypeVar, Type, Callable
+from typing import (
+    Sequence,
+    Optional,
+    Iterator,
+    Any,
+    Hashable,
+    Protocol,
+    TypeVar,
+    Type,
+    Callable,
+)
 import os
-import portalocker
+import struct
+from qec_lego_bench.cache import LRUCache
+from .result_store import ResultStore, result_store_of
 import json
 import time
 import sys
@@ -21,22 +33,78 @@ class JobParameters:
 
     @functools.cached_property
     def hash(self) -> str:
-        _kwargs_ordered = tuple((k, self.kwargs[k]) for k in sorted(self.kwargs.keys()))
-        for arg in self.args:
+        return job_hash_of(self.args, self.kwargs)
+
+
+# the stable hash of the job parameters memoized by their frozen key, such that looking up the same
+# (e.g. DotMap) parameters again and again does not recompute the stable hash
+job_hash_cache: LRUCache[Hashable, str] = LRUCache(maxsize=4096)
+
+_SCALAR_TYPES = frozenset([type(None), bool, int, str, bytes])
+
+
+class _Unfreezable(Exception):
+    pass
+
+
+def _freeze(value: Any) -> Hashable:
+    value_type = type(value)
+    if value_type in _SCALAR_TYPES:
+        return (value_type, value)
+    if value_type is float:
+        return (float, struct.pack("<d", value))
+    if value_type is tuple or value_type is list:
+        return (value_type, tuple([_freeze(item) for item in value]))
+    if value_type is set or value_type is frozenset:
+        return (value_type, frozenset([_freeze(item) for item in value]))
+    if isinstance(value, dict):  # including DotMap
+        return (
+            value_type,
+            frozenset([(_freeze(key), _freeze(item)) for key, item in value.items()]),
+        )
+    raise _Unfreezable()
+
+
+def frozen_key_of(value: Any) -> Optional[Hashable]:
+    """
+    a hashable key that is equal only if `stablehash` gives the same value, or None if the value
+    is not supported; the dict items are unordered because `stablehash` sorts them as well
+    """
+    try:
+        return _freeze(value)
+    except _Unfreezable:
+        return None
+
+
+def job_hash_of(args: tuple, kwargs: dict) -> str:
+    _kwargs_ordered = tuple((k, kwargs[k]) for k in sorted(kwargs.keys()))
+    assert "shots" not in kwargs, "`shots` is a reserved keyword argument"
+    frozen_key = frozen_key_of((args, _kwargs_ordered))
+    if frozen_key is not None:
+        hash_value = job_hash_cache.get(frozen_key)
+        if hash_value is not None:
+            return hash_value
+    try:
+        hash_value = stablehash((args, _kwargs_ordered)).hexdigest()
+    except Exception:
+        # find out which argument is not hashable
+        for arg in args:
             try:
                 stablehash(arg)
             except Exception as e:
                 print(f"Error hashing positional argument {arg}: {e}")
                 raise e
         for key, value in _kwargs_ordered:
-            assert key != "shots", "`shots` is a reserved keyword argument"
             try:
                 stablehash(key)
                 stablehash(value)
             except Exception as e:
                 print(f"Error hashing keyword argument {key}={value}: {e}")
                 raise e
-        return stablehash((self.args, _kwargs_ordered)).hexdigest()
+        raise
+    if frozen_key is not None:
+        job_hash_cache.put(frozen_key, hash_value)
+    return hash_value
 
 
 class JobResult(Protocol):
@@ -80,6 +148,15 @@ class Job:
 JobFunc = Callable[..., JobResult]
 
 
+def check_entry(entry: dict, job: Any) -> None:
+    """the sanity check of a persisted entry against a `Job` or a `MonteCarloJob` of the same hash"""
+    for entry_arg, arg in zip(entry["args"], job.args):
+        assert entry_arg == str(arg), "Hash conflict"
+    assert entry["kwargs"].keys() == job.kwargs.keys(), "Hash conflict"
+    for key in job.kwargs.keys():
+        assert entry["kwargs"][key] == str(job.kwargs[key]), "Hash conflict"
+
+
 class JobStore:
     def __init__(
         self,
@@ -89,6 +166,8 @@ class JobStore:
         # used when reading from file
         result_type: Type[JobResult],
         filename: Optional[str] = None,
+        # the journal mode of the SQLite result store, see `SqliteResultStore`
+        journal_mode: str = "DELETE",
     ) -> None:
         assert callable(func)
         self.func = func
@@ -107,6 +186,17 @@ class JobStore:
                     )
         self.result_type = result_type
         self.filename = filename
+        self.journal_mode = journal_mode
+        # the hashes of the jobs whose result is already persisted
+        self.persisted: set[str] = set()
+        # the hashes of the jobs whose entry in the file has passed the hash conflict check
+        self.checked: set[str] = set()
+        # the storage backend is chosen by the extension of the filename, see `result_store_of`
+        self.store: Optional[ResultStore] = (
+            None
+            if filename is None
+            else result_store_of(filename, journal_mode=journal_mode)
+        )
         if filename is not None:
             self.load_from_file(filename)  # load from file on initialization
 
@@ -135,60 +225,60 @@ class JobStore:
         assert job is not None, f"Job not found: {args}, {kwargs}"
         return job
 
+    def store_of(self, filename: str) -> ResultStore:
+        if filename == self.filename and self.store is not None:
+            return self.store
+        return result_store_of(filename, journal_mode=self.journal_mode)
+
     def load_from_file(self, filename: str, target_job: Optional[Job] = None) -> None:
-        if not os.path.exists(filename):
-            return
-        with portalocker.Lock(filename, "r") as f:
-            persist = json.load(f)
-            jobs = self.jobs.values() if target_job is None else [target_job]
-            for job in jobs:
-                if job.hash not in persist:
-                    continue
-                entry = persist[job.hash]
-                # sanity check
-                for entry_arg, arg in zip(entry["args"], job.args):
-                    assert entry_arg == str(arg), "Hash conflict"
-                assert entry["kwargs"].keys() == job.kwargs.keys(), "Hash conflict"
-                for key in job.kwargs.keys():
-                    assert entry["kwargs"][key] == str(job.kwargs[key]), "Hash conflict"
-                # add to current value
-                if "result" in entry and entry["result"] is not None:
-                    job.result = self.result_type.from_dict(entry["result"])
+        jobs = self.jobs.values() if target_job is None else [target_job]
+        persist = self.store_of(filename).load(
+            None if target_job is None else [target_job.hash]
+        )
+        for job in jobs:
+            if job.hash not in persist:
+                continue
+            entry = persist[job.hash]
+            check_entry(entry, job)
+            if filename == self.filename:
+                self.checked.add(job.hash)
+            # add to current value
+            if "result" in entry and entry["result"] is not None:
+                job.result = self.result_type.from_dict(entry["result"])
+                if filename == self.filename:
+                    self.persisted.add(job.hash)
 
     def update_file(self, filename: str) -> None:
-        with portalocker.Lock(
-            filename, "r+" if os.path.exists(filename) else "w+"
-        ) as f:
-            content = f.read()
-            if content == "":
-                persist = {}
-            else:
-                persist = json.loads(content)
-            f.seek(0)
-            for job in self.jobs.values():
-                if job.hash not in persist:
-                    persist[job.hash] = {
-                        "args": [str(arg) for arg in job.args],
-                        "kwargs": {
-                            key: str(value) for key, value in job.kwargs.items()
-                        },
-                    }
-                    entry = persist[job.hash]
-                else:
-                    entry = persist[job.hash]
-                    # sanity check
-                    for entry_arg, arg in zip(entry["args"], job.args):
-                        assert entry_arg == str(arg), "Hash conflict"
-                    assert entry["kwargs"].keys() == job.kwargs.keys(), "Hash conflict"
-                    for key in job.kwargs.keys():
-                        assert entry["kwargs"][key] == str(
-                            job.kwargs[key]
-                        ), "Hash conflict"
-                # update value only if I have more information than the storage file
-                if job.result is not None:
-                    entry["result"] = job.result.to_dict()
-            json.dump(persist, f, indent=2)
-            f.truncate()
+        """write the jobs that are new to the file, and the results that are not persisted yet"""
+        own = filename == self.filename
+        entries: dict[str, dict] = {}
+        for job in self.jobs.values():
+            if own and job.hash in self.persisted:
+                continue
+            # update value only if I have more information than the storage file
+            if own and job.hash in self.checked and job.result is None:
+                continue
+            entries[job.hash] = {
+                "args": [str(arg) for arg in job.args],
+                "kwargs": {key: str(value) for key, value in job.kwargs.items()},
+            }
+            if job.result is not None:
+                entries[job.hash]["result"] = job.result.to_dict()
+        # sanity check against the entries already in the file
+        unchecked = [
+            hash_value
+            for hash_value in entries.keys()
+            if not (own and hash_value in self.checked)
+        ]
+        if len(unchecked) > 0:
+            for hash_value, entry in self.store_of(filename).load(unchecked).items():
+                check_entry(entry, self.jobs[hash_value])
+        self.store_of(filename).update(entries)
+        if own:
+            self.checked.update(entries.keys())
+            self.persisted.update(
+                hash_value for hash_value, entry in entries.items() if "result" in entry
+            )
 
     def execute(
         self,
@@ -29,11 +29,12 @@ import sys
 import math
 import sinter
 from qec_lego_bench.stats import Stats
+from qec_lego_bench.misc.telemetry import TaskTelemetry, measured_task
 import json
-import portalocker
 import os
-from .job_store import JobParameters
+from .job_store import JobParameters, check_entry
 from .panic_store import PanicStore, JobPanic
+from .result_store import ResultStore, result_store_of
 import traceback
 import multiprocessing
 import gc
@@ -144,6 +145,8 @@ class MonteCarloJob:
         self.result: Optional[MonteCarloResult] = None
         self.min_time: Optional[float] = None  # an estimation of the init time
         self.finished_tasks: int = 0  # each task may have multiple shots
+        # the aggregated resource usage of the finished tasks
+        self.telemetry: Optional[TaskTelemetry] = None
 
     def __repr__(self):
         args = [str(arg) for arg in self.args]
@@ -198,6 +201,41 @@ class MonteCarloExecutorConfig:
     max_submitted_job: int = 1000
     # iteratively call the submitter function until no job is submitted
     iterative_submitter: bool = True
+    # persist the changed jobs at most once per this many seconds while executing ...
+    flush_interval: float = 10
+    # ... unless this many jobs have changed since the last flush
+    max_dirty_jobs: int = 100
+    # after the first future completes, keep waiting for up to this many seconds until
+    # `harvest_batch_size` futures complete, to handle many short tasks in one loop iteration
+    harvest_batch_size: int = 1
+    harvest_timeout: float = 0.0
+    # run the garbage collection at most once per this many seconds
+    gc_interval: float = 10
+    # pack the tasks that are estimated to finish within this many seconds (0 to disable packing)
+    # into one worker task that runs them sequentially, with at most `max_pack_size` tasks and an
+    # estimated time of at most `target_job_time`; jobs without an estimation yet are packable
+    pack_time: float = 0
+    max_pack_size: int = 16
+    # route the tasks to the workers with enough memory using the Dask worker resource of this name,
+    # e.g. `MEMORY_RESOURCE` advertised by `SlurmClientConnector.worker_groups`; the memory of a job
+    # is the peak resident memory of the worker process measured in its finished tasks (including
+    # the warm caches, see `TaskTelemetry.peak_memory`) times `memory_margin`
+    memory_resource: Optional[str] = None
+    memory_margin: float = 1.5
+    # the journal mode of the SQLite result store, see `SqliteResultStore`
+    journal_mode: str = "DELETE"
+
+    def per_shot_time(self, job: MonteCarloJob) -> float:
+        assert job.min_time is not None
+        return (job.duration - job.min_time * job.finished_tasks) / max(
+            1, job.finished_shots - job.finished_tasks
+        )
+
+    # the estimated time of a task, or 0 if there is no estimation yet
+    def estimated_time(self, job: MonteCarloJob, shots: int) -> float:
+        if job.min_time is None:
+            return 0
+        return job.min_time + shots * max(0, self.per_shot_time(job))
 
     # return the split of the shots and how many threads
     def warmed_up_split(self, job: MonteCarloJob, shots: int) -> Tuple[int, int]:
@@ -205,9 +243,7 @@ class MonteCarloExecutorConfig:
             return 1, 1  # submit one shot as an estimation of the initialization time
         if job.finished_shots < self.min_shots_before_estimation:
             return job.finished_shots, 1  # double the finished jobs and see
-        per_shot_time = (job.duration - job.min_time * job.finished_tasks) / max(
-            1, job.finished_shots - job.finished_tasks
-        )
+        per_shot_time = self.per_shot_time(job)
         if per_shot_time < 1e-6:
             # which doesn't make sense, maybe something wrong with min_time; fall back
             per_shot_time = job.duration / job.finished_shots
@@ -236,6 +272,7 @@ class MonitoredResult:
     actual_shots: int = 0
     duration: float = 0
     panic_info: Optional[str] = None
+    telemetry: Optional[TaskTelemetry] = None
 
 
 def monitored_job(
@@ -243,12 +280,30 @@ def monitored_job(
 ) -> MonitoredResult:
     start = time.thread_time()
     actual_shots, result, panic_info = 0, None, None
-    try:
-        actual_shots, result = func(shots, *args, **kwargs)
-    except BaseException as e:
-        panic_info = traceback.format_exc()
+    with measured_task() as telemetry:
+        try:
+            actual_shots, result = func(shots, *args, **kwargs)
+        except BaseException as e:
+            panic_info = traceback.format_exc()
     duration = time.thread_time() - start
-    return MonitoredResult(result, shots, actual_shots, duration, panic_info=panic_info)
+    return MonitoredResult(
+        result,
+        shots,
+        actual_shots,
+        duration,
+        panic_info=panic_info,
+        telemetry=telemetry,
+    )
+
+
+def monitored_jobs(
+    func: MonteCarloFunc, tasks: list[tuple[int, int, tuple, dict]]
+) -> list[MonitoredResult]:
+    """run the packed (shots, job_id, args, kwargs) tasks sequentially"""
+    return [
+        monitored_job(func, shots, job_id, args, kwargs)
+        for shots, job_id, args, kwargs in tasks
+    ]
 
 
 class DefaultSlurmExtra:
@@ -279,6 +334,21 @@ class DefaultSlurmExtra:
         )
 
 
+# the Dask worker resource that advertises the memory of each worker in bytes
+MEMORY_RESOURCE = "MEMORY"
+
+
+@dataclass
+class SlurmWorkerGroup:
+    # the memory of each worker process in GB
+    mem_per_job: int
+    # the number of worker processes in this group, the same as `slurm_maximum_jobs`
+    maximum_jobs: int
+
+    def resource_args(self) -> list[str]:
+        return ["--resources", f"{MEMORY_RESOURCE}={self.mem_per_job * 1024**3}"]
+
+
 @dataclass
 class SlurmClientConnector:
     # (slurm_maximum_jobs // slurm_cores_per_node) should not exceed 200 (Yale HPC limit)
@@ -292,12 +362,26 @@ class SlurmClientConnector:
     use_adaptive_scaling: bool = False  # not well tested
     slurm_minimum_jobs: int = 1  # only affect when `use_adaptive_scaling` is True
 
+    # several groups of workers with different memory sizes (overriding `slurm_mem_per_job` and
+    # `slurm_maximum_jobs`); each worker advertises its memory as the `MEMORY_RESOURCE` resource,
+    # so that the executor can route heavy jobs with `MonteCarloExecutorConfig.memory_resource`
+    worker_groups: list[SlurmWorkerGroup] = field(default_factory=list)
+
     def __call__(self):
+        groups = self.worker_groups
         try:
             from dask_jobqueue import SLURMCluster
             from dask.distributed import Client
 
-            n_workers = self.slurm_maximum_jobs // self.slurm_cores_per_node
+            assert not (
+                groups and self.use_adaptive_scaling
+            ), "adaptive scaling does not support worker groups"
+            maximum_jobs = (
+                sum(group.maximum_jobs for group in groups)
+                if groups
+                else self.slurm_maximum_jobs
+            )
+            n_workers = maximum_jobs // self.slurm_cores_per_node
             assert (
                 n_workers <= 200
             ), "Yale HPC forbids submitting more than 200 jobs per hour"
@@ -310,16 +394,41 @@ class SlurmClientConnector:
             if "job_extra_directives" in slurm_extra:
                 job_extra_directives += slurm_extra["job_extra_directives"]
                 del slurm_extra["job_extra_directives"]
+            mem_per_job = groups[0].mem_per_job if groups else self.slurm_mem_per_job
+            if groups:
+                slurm_extra["worker_extra_args"] = [
+                    *slurm_extra.get("worker_extra_args", []),
+                    *groups[0].resource_args(),
+                ]
             cluster = SLURMCluster(
                 cores=self.slurm_cores_per_node,
                 processes=self.slurm_cores_per_node,
-                memory=f"{self.slurm_mem_per_job * self.slurm_cores_per_node} GB",
+                memory=f"{mem_per_job * self.slurm_cores_per_node} GB",
                 job_extra_directives=job_extra_directives,
                 **slurm_extra,
             )
             if self.print_job_script:
                 print(cluster.job_script())
-            if not self.use_adaptive_scaling:
+            if groups:
+                cluster.scale(groups[0].maximum_jobs)
+                # the other groups are added as SLURM jobs with their own memory and resources
+                for group_index, group in enumerate(groups[1:], start=1):
+                    options = {
+                        **cluster.new_spec["options"],
+                        "memory": f"{group.mem_per_job * self.slurm_cores_per_node} GB",
+                        "worker_extra_args": [
+                            *self.slurm_extra.get("worker_extra_args", []),
+                            *group.resource_args(),
+                        ],
+                    }
+                    for job_index in range(
+                        group.maximum_jobs // self.slurm_cores_per_node
+                    ):
+                        cluster.worker_spec[f"group{group_index}-{job_index}"] = dict(
+                            cls=cluster.new_spec["cls"], options=options
+                        )
+                cluster.scale(jobs=len(cluster.worker_spec))
+            elif not self.use_adaptive_scaling:
                 cluster.scale(self.slurm_maximum_jobs)
             else:
                 cluster.adapt(
@@ -337,6 +446,12 @@ class SlurmClientConnector:
                 n_workers=n_workers,
                 threads_per_worker=1,
                 memory_limit=f"{int(math.floor(total_memory_gb))}GB",
+                # let the memory-routed tasks run on the local workers as well
+                resources=(
+                    {MEMORY_RESOURCE: total_memory_gb * 1024**3 / n_workers}
+                    if groups
+                    else None
+                ),
             )
         print("cluster dashboard link:", cluster.dashboard_link)
         client = Client(cluster)
@@ -363,8 +478,14 @@ class MonteCarloJobExecutor:
         for job in jobs:
             assert isinstance(job, MonteCarloJob)
         self.jobs: dict[str, MonteCarloJob] = {job.hash: job for job in jobs}
+        # secondary index of the jobs by the hash of the parameters other than `p` and then by `p`
+        self.p_index: dict[str, dict[Any, MonteCarloJob]] = {}
+        for job in jobs:
+            self._index_job(job)
         self.pending_futures: list[Future] = []
         self.future_info: dict[Future, MonteCarloJob] = {}
+        # the jobs of each packed task, see `MonteCarloExecutorConfig.pack_time`
+        self.packed_info: dict[Future, list[MonteCarloJob]] = {}
         # the remaining shots due to insufficient number of samples for estimation runtime
         self.pending_submit: dict[MonteCarloJob, tuple[int, Future]] = {}
         self.filename = filename
@@ -376,6 +497,19 @@ class MonteCarloJobExecutor:
         self.panics = PanicStore(panic_filename)
         self.result_type = result_type
         self.num_jobs = 0  # used to uniquely set job ID to avoid caching
+        # the persisted (shots, duration, min_time, finished_tasks) of each job, to only write changed jobs
+        self.persisted: dict[str, tuple] = {}
+        # the hashes of the jobs whose entry in the file has passed the hash conflict check
+        self.checked: set[str] = set()
+        # the hashes of the jobs that changed since the last flush
+        self.dirty: set[str] = set()
+        self.last_flush = time.time()
+        # the storage backend is chosen by the extension of the filename, see `result_store_of`
+        self.store: Optional[ResultStore] = (
+            None
+            if filename is None
+            else result_store_of(filename, journal_mode=config.journal_mode)
+        )
         if filename is not None:
             self.load_from_file(filename)  # load from file on initialization
 
@@ -393,9 +527,21 @@ class MonteCarloJobExecutor:
             return
         assert job.hash not in self.jobs, "Job already exists"
         self.jobs[job.hash] = job
+        self._index_job(job)
         if load_from_file and self.filename is not None:
             self.load_from_file(self.filename, job)
 
+    def _index_job(self, job: MonteCarloJob) -> None:
+        if "p" not in job.kwargs:
+            return
+        kwargs = {key: value for key, value in job.kwargs.items() if key != "p"}
+        hash_value = JobParameters(job.args, kwargs).hash
+        self.p_index.setdefault(hash_value, {})[job.kwargs["p"]] = job
+
+    def jobs_of_p(self, *args, **kwargs) -> dict[Any, MonteCarloJob]:
+        """the jobs with the given parameters (other than `p`) keyed by `p`; do not modify the dict"""
+        return self.p_index.get(JobParameters(args, kwargs).hash, {})
+
     def get_job(self, *args, **kwargs) -> Optional[MonteCarloJob]:
         hash_value = JobParameters(args, kwargs).hash
         if hash_value not in self.jobs:
@@ -422,6 +568,7 @@ class MonteCarloJobExecutor:
         if loop_callback is not None:
             loop_callback(self)
         start = time.time()
+        last_gc = start
         try:
             while True:
                 if client is not None:
@@ -429,11 +576,7 @@ class MonteCarloJobExecutor:
                     if remaining_time <= 0:
                         raise TimeoutError()
                     try:
-                        futures: DoneAndNotDoneFutures = wait(
-                            self.pending_futures,
-                            return_when=FIRST_COMPLETED,
-                            timeout=timeout - (time.time() - start),
-                        )
+                        futures = self._wait_batch(remaining_time)
                     except DaskTimeoutError as e:
                         raise TimeoutError()
                     assert len(futures.done) + len(futures.not_done) == len(
@@ -444,43 +587,28 @@ class MonteCarloJobExecutor:
                         futures.done, with_results=True, raise_errors=False
                     ):
                         assert isinstance(done, Future)
-                        job = self.future_info[done]
                         if done.status == "error":
                             # 2025.2.10: slurmstepd: error: *** JOB 15338504 ON r815u15n07 CANCELLED AT 2025-02-10T11:56:44 DUE TO PREEMPTION ***
                             # The schedular thinks it is the job itself that causes the failure
                             # but it is actually the slurm that kills the job in scavenge partition
                             # try to catch this case and just retry the future instead of killing the schedular
-                            print(f"job status error: {job}, retry")
+                            print(
+                                f"job status error: {self.jobs_of_future(done)}, retry"
+                            )
                             done.retry()
                             self.pending_futures.append(done)
                             continue
-                        job_result = cast(MonitoredResult, job_result)
-                        if job_result.panic_info is not None:
-                            # job panics, record it
-                            job_panic = JobPanic(
-                                parameters=job.parameters,
-                                latest=json.dumps(
-                                    dict(shots=job.shots, duration=job.duration)
-                                ),
-                            )
-                            job_panic.add_info(job_result.panic_info)
-                            self.panics.add_panic(job_panic)
+                        if done in self.packed_info:
+                            packed_results = cast(list[MonitoredResult], job_result)
+                            for job, result in zip(
+                                self.packed_info.pop(done), packed_results
+                            ):
+                                self._merge(job, result)
                         else:
-                            result = job_result.result
-                            assert result is not None
-                            if job.result is None:
-                                job.result = result
-                            else:
-                                job.result += result
-                            job.duration += job_result.duration
-                            job.finished_shots += job_result.actual_shots
-                            job.pending_shots -= job_result.shots
-                            job.finished_tasks += 1
-                            if job.min_time is None:
-                                job.min_time = job_result.duration
-                            else:
-                                job.min_time = min(job.min_time, job_result.duration)
-                        del self.future_info[done]
+                            self._merge(
+                                self.future_info.pop(done),
+                                cast(MonitoredResult, job_result),
+                            )
                         client.cancel(done)
                         del done
                 # get the next job to run
@@ -513,9 +641,12 @@ class MonteCarloJobExecutor:
                 # fair submission
                 while (
                     not force_finished
-                    and len(self.future_info) < self.config.max_submitted_job
+                    and len(self.future_info) + len(self.packed_info)
+                    < self.config.max_submitted_job
                 ):
                     has_any_submission = False
+                    # (job, shots_per_thread, remaining shots, threads, done_future)
+                    batch: list[tuple[MonteCarloJob, int, int, int, Future]] = []
                     for job in list(self.pending_submit.keys()):
                         if job.parameters in self.panics:
                             continue  # do not submit any job that has panicked before
@@ -527,21 +658,24 @@ class MonteCarloJobExecutor:
                             job, shots
                         )
                         has_any_submission = True
-                        if client is None:
-                            assert client_connector is not None
-                            print("winding up a new client")
-                            client = client_connector()
-                        future = client.submit(
-                            monitored_job,
-                            self.func,
-                            shots_per_thread,
-                            self.num_jobs,
-                            job.args,
-                            job.kwargs,
+                        batch.append(
+                            (job, shots_per_thread, shots, threads, done_future)
                         )
-                        self.num_jobs += 1
-                        self.pending_futures.append(future)
-                        self.future_info[future] = job
+                    if not has_any_submission:
+                        break  # search next round
+                    if client is None:
+                        assert client_connector is not None
+                        print("winding up a new client")
+                        client = client_connector()
+                    # each job appears at most once per round, so the whole round is submitted at once
+                    futures_of_batch = self._submit_batch(client, batch)
+                    for future, (
+                        job,
+                        shots_per_thread,
+                        shots,
+                        threads,
+                        done_future,
+                    ) in zip(futures_of_batch, batch):
                         actual_shots = shots_per_thread
                         if actual_shots < shots:
                             self.pending_submit[job] = shots - actual_shots, (
@@ -550,15 +684,15 @@ class MonteCarloJobExecutor:
                         else:
                             # adjust actual pending shots
                             job.pending_shots += actual_shots - shots
-                    if not has_any_submission:
-                        break  # search next round
                 # save to file
-                if client is not None and self.filename is not None:
-                    self.update_file(self.filename)
+                if client is not None:
+                    self.flush()
                 # call user callback such that they can do some plotting of the intermediate results
                 if loop_callback is not None:
                     loop_callback(self)
-                gc.collect()  # manually collect the garbage
+                if time.time() - last_gc >= self.config.gc_interval:
+                    gc.collect()  # manually collect the garbage
+                    last_gc = time.time()
                 if not self._loop_again():
                     break
                 if len(self.pending_futures) == 0 and len(self.pending_submit) == 0:
@@ -566,6 +700,7 @@ class MonteCarloJobExecutor:
                 if client is None:
                     break
         finally:
+            self.flush(force=True)
             # cancel all pending futures
             for future in self.pending_futures:
                 try:
@@ -574,6 +709,7 @@ class MonteCarloJobExecutor:
                     print("cancel failed", e)
             self.pending_futures = []
             self.future_info.clear()
+            self.packed_info.clear()
             self.pending_submit.clear()
             for job in self:
                 job.pending_shots = 0
@@ -583,6 +719,193 @@ class MonteCarloJobExecutor:
                 )
                 client.shutdown()
 
+    def _merge(self, job: MonteCarloJob, job_result: MonitoredResult) -> None:
+        if job_result.panic_info is not None:
+            # job panics, record it
+            job_panic = JobPanic(
+                parameters=job.parameters,
+                latest=json.dumps(dict(shots=job.shots, duration=job.duration)),
+            )
+            job_panic.add_info(job_result.panic_info)
+            self.panics.add_panic(job_panic)
+        else:
+            result = job_result.result
+            assert result is not None
+            if job.result is None:
+                job.result = result
+            else:
+                job.result += result
+            job.duration += job_result.duration
+            job.finished_shots += job_result.actual_shots
+            job.pending_shots -= job_result.shots
+            job.finished_tasks += 1
+            if job.min_time is None:
+                job.min_time = job_result.duration
+            else:
+                job.min_time = min(job.min_time, job_result.duration)
+            if job_result.telemetry is not None:
+                if job.telemetry is None:
+                    job.telemetry = job_result.telemetry
+                else:
+                    job.telemetry += job_result.telemetry
+            self.dirty.add(job.hash)
+
+    def _submit_batch(
+        self, client: Client, batch: list[tuple[MonteCarloJob, int, int, int, Future]]
+    ) -> list[Future]:
+        """submit the batch in as few calls as possible and return the future of each item"""
+        singles, packs = self._pack(batch)
+        job_ids = range(self.num_jobs, self.num_jobs + len(batch))
+        self.num_jobs += len(batch)
+        memory_levels = self._memory_levels(client)
+        # group the tasks by their memory requirement, because `client.map` takes one requirement
+        singles_of: dict[Optional[float], list[int]] = {}
+        for index in singles:
+            memory = self._memory_requirement(batch[index][0], memory_levels)
+            singles_of.setdefault(memory, []).append(index)
+        packs_of: dict[Optional[float], list[list[int]]] = {}
+        for pack in packs:
+            memories = [
+                self._memory_requirement(batch[index][0], memory_levels)
+                for index in pack
+            ]
+            known = [memory for memory in memories if memory is not None]
+            packs_of.setdefault(max(known, default=None), []).append(pack)
+        futures_of_batch: list[Future] = [None] * len(batch)  # type: ignore
+        for memory, indices in singles_of.items():
+            submitted = client.map(
+                monitored_job,
+                [self.func] * len(indices),
+                [batch[index][1] for index in indices],
+                [job_ids[index] for index in indices],
+                [batch[index][0].args for index in indices],
+                [batch[index][0].kwargs for index in indices],
+                pure=False,
+                resources=self._resources_of(memory),
+            )
+            for index, future in zip(indices, submitted):
+                self.pending_futures.append(future)
+                self.future_info[future] = batch[index][0]
+                futures_of_batch[index] = future
+        for memory, memory_packs in packs_of.items():
+            submitted = client.map(
+                monitored_jobs,
+                [self.func] * len(memory_packs),
+                [
+                    [
+                        (
+                            batch[index][1],
+                            job_ids[index],
+                            batch[index][0].args,
+                            batch[index][0].kwargs,
+                        )
+                        for index in pack
+                    ]
+                    for pack in memory_packs
+                ],
+                pure=False,
+                resources=self._resources_of(memory),
+            )
+            for pack, future in zip(memory_packs, submitted):
+                self.pending_futures.append(future)
+                self.packed_info[future] = [batch[index][0] for index in pack]
+                for index in pack:
+                    futures_of_batch[index] = future
+        return futures_of_batch
+
+    def _memory_levels(self, client: Client) -> list[float]:
+        """the distinct memory resources of the workers, in increasing order"""
+        if self.config.memory_resource is None:
+            return []
+        levels = set()
+        for worker in client.scheduler_info()["workers"].values():
+            memory = worker.get("resources", {}).get(self.config.memory_resource)
+            if memory is not None:
+                levels.add(memory)
+        return sorted(levels)
+
+    def _memory_requirement(
+        self, job: MonteCarloJob, memory_levels: list[float]
+    ) -> Optional[float]:
+        """
+        the smallest memory level that fits the job's tasks, or None if unknown (including when the
+        worker could not measure the peak memory of a task, see `TaskTelemetry.peak_rss`); the
+        requirement includes the resident memory of the worker at the start of the task, because
+        the warm caches (decoder pool, circuits, DEMs and samplers) only grow in the first tasks and
+        later tasks reuse them; it may thus overestimate a job that shares a worker with other jobs
+        """
+        if (
+            len(memory_levels) == 0
+            or job.telemetry is None
+            or job.telemetry.peak_memory == 0
+        ):
+            return None
+        memory = job.telemetry.peak_memory * self.config.memory_margin
+        for level in memory_levels:
+            if level >= memory:
+                return level
+        # no worker is large enough; let the largest workers try
+        return memory_levels[-1]
+
+    def _resources_of(self, memory: Optional[float]) -> Optional[dict[str, float]]:
+        if memory is None:
+            return None
+        assert self.config.memory_resource is not None
+        return {self.config.memory_resource: memory}
+
+    def _pack(
+        self, batch: list[tuple[MonteCarloJob, int, int, int, Future]]
+    ) -> tuple[list[int], list[list[int]]]:
+        """split the indices of the batch into the single tasks and the packs of short tasks"""
+        singles: list[int] = []
+        packs: list[list[int]] = []
+        pack: list[int] = []
+        pack_time = 0.0
+        for index, (job, shots_per_thread, *_) in enumerate(batch):
+            estimated_time = self.config.estimated_time(job, shots_per_thread)
+            if estimated_time >= self.config.pack_time:
+                singles.append(index)
+                continue
+            if len(pack) >= self.config.max_pack_size or (
+                pack_time + estimated_time > self.config.target_job_time
+            ):
+                packs.append(pack)
+                pack, pack_time = [], 0.0
+            pack.append(index)
+            pack_time += estimated_time
+        if len(pack) == 1:
+            singles.append(pack[0])  # do not pack a single task
+        elif len(pack) > 1:
+            packs.append(pack)
+        return singles, packs
+
+    def jobs_of_future(self, future: Future) -> list[MonteCarloJob]:
+        if future in self.packed_info:
+            return self.packed_info[future]
+        return [self.future_info[future]]
+
+    def _wait_batch(self, timeout: float) -> DoneAndNotDoneFutures:
+        """wait for the first completed future and then the batch, see `harvest_batch_size`"""
+        futures: DoneAndNotDoneFutures = wait(
+            self.pending_futures, return_when=FIRST_COMPLETED, timeout=timeout
+        )
+        batch_size = min(self.config.harvest_batch_size, len(self.pending_futures))
+        deadline = time.time() + min(self.config.harvest_timeout, timeout)
+        done, not_done = set(futures.done), set(futures.not_done)
+        while len(done) < batch_size:
+            remaining_time = deadline - time.time()
+            if remaining_time <= 0:
+                break
+            try:
+                more: DoneAndNotDoneFutures = wait(
+                    list(not_done), return_when=FIRST_COMPLETED, timeout=remaining_time
+                )
+            except DaskTimeoutError:
+                break
+            done |= more.done
+            not_done = set(more.not_done)
+        return DoneAndNotDoneFutures(done, not_done)
+
     def _loop_again(self) -> bool:
         if len(self.pending_futures) > 0:
             return True
@@ -600,73 +923,118 @@ class MonteCarloJobExecutor:
                 return False
         return True
 
+    def store_of(self, filename: str) -> ResultStore:
+        if filename == self.filename and self.store is not None:
+            return self.store
+        return result_store_of(filename, journal_mode=self.config.journal_mode)
+
+    def check_before_write(self, filename: str, hashes: Iterable[str]) -> None:
+        """check the hash conflict of the entries to write against the ones already in the file"""
+        own = filename == self.filename
+        unchecked = [
+            hash_value
+            for hash_value in hashes
+            if not (own and hash_value in self.checked)
+        ]
+        if len(unchecked) == 0:
+            return
+        for hash_value, entry in self.store_of(filename).load(unchecked).items():
+            check_entry(entry, self.jobs[hash_value])
+        if own:
+            self.checked.update(unchecked)
+
     def load_from_file(
         self, filename: str, target_job: Optional[MonteCarloJob] = None
     ) -> None:
-        if not os.path.exists(filename):
-            return
-        with portalocker.Lock(filename, "r") as f:
-            persist = json.load(f)
-            jobs = self.jobs.values() if target_job is None else [target_job]
-            for job in jobs:
-                if job.hash not in persist:
-                    continue
-                entry = persist[job.hash]
-                # sanity check
-                for entry_arg, arg in zip(entry["args"], job.args):
-                    assert entry_arg == str(arg), "Hash conflict"
-                assert entry["kwargs"].keys() == job.kwargs.keys(), "Hash conflict"
-                for key in job.kwargs.keys():
-                    assert entry["kwargs"][key] == str(job.kwargs[key]), "Hash conflict"
-                # add to current value
-                job.result = (
-                    None
-                    if entry["result"] is None
-                    else self.result_type.from_dict(entry["result"])
-                )
-                job.finished_shots = entry["shots"]
-                job.duration = entry["duration"]
-                job.min_time = 0 if "min_time" not in entry else entry["min_time"]
-                job.finished_tasks = (
-                    0 if "finished_tasks" not in entry else entry["finished_tasks"]
-                )
+        jobs = self.jobs.values() if target_job is None else [target_job]
+        persist = self.store_of(filename).load(
+            None if target_job is None else [target_job.hash]
+        )
+        for job in jobs:
+            if job.hash not in persist:
+                continue
+            entry = persist[job.hash]
+            check_entry(entry, job)
+            # add to current value
+            job.result = (
+                None
+                if entry["result"] is None
+                else self.result_type.from_dict(entry["result"])
+            )
+            job.finished_shots = entry["shots"]
+            job.duration = entry["duration"]
+            job.min_time = 0 if "min_time" not in entry else entry["min_time"]
+            job.finished_tasks = (
+                0 if "finished_tasks" not in entry else entry["finished_tasks"]
+            )
+            job.telemetry = (
+                None
+                if entry.get("telemetry") is None
+                else TaskTelemetry.from_dict(entry["telemetry"])
+            )
+            if filename == self.filename:
+                self.persisted[job.hash] = persisted_state_of(job)
+                self.checked.add(job.hash)
 
     def update_file(self, filename: str) -> None:
-        with portalocker.Lock(
-            filename, "r+" if os.path.exists(filename) else "w+"
-        ) as f:
-            content = f.read()
-            if content == "":
-                persist = {}
-            else:
-                persist = json.loads(content)
-            f.seek(0)
-            for job in self.jobs.values():
-                if job.hash not in persist:
-                    persist[job.hash] = {
-                        "args": [str(arg) for arg in job.args],
-                        "kwargs": {
-                            key: str(value) for key, value in job.kwargs.items()
-                        },
-                    }
-                    entry = persist[job.hash]
-                else:
-                    entry = persist[job.hash]
-                    # sanity check
-                    for entry_arg, arg in zip(entry["args"], job.args):
-                        assert entry_arg == str(arg), "Hash conflict"
-                    assert entry["kwargs"].keys() == job.kwargs.keys(), "Hash conflict"
-                    for key in job.kwargs.keys():
-                        assert entry["kwargs"][key] == str(
-                            job.kwargs[key]
-                        ), "Hash conflict"
-                # update value
-                entry["result"] = (
-                    job.result.to_dict() if job.result is not None else None
-                )
-                entry["shots"] = job.finished_shots
-                entry["duration"] = job.duration
-                entry["min_time"] = job.min_time
-                entry["finished_tasks"] = job.finished_tasks
-            json.dump(persist, f, indent=2)
-            f.truncate()
+        """append the jobs that changed since the last update"""
+        entries: dict[str, dict] = {}
+        for job in self.jobs.values():
+            state = persisted_state_of(job)
+            if filename == self.filename and self.persisted.get(job.hash) == state:
+                continue
+            entries[job.hash] = entry_of(job)
+            if filename == self.filename:
+                self.persisted[job.hash] = state
+        if filename == self.filename:
+            self.dirty.clear()
+            self.last_flush = time.time()
+        self.check_before_write(filename, entries.keys())
+        self.store_of(filename).update(entries)
+
+    def flush(self, force: bool = False) -> bool:
+        """
+        persist the jobs changed by `execute` if the flush interval has elapsed or too many jobs are
+        dirty; unlike `update_file`, it does not scan the jobs. Return whether it writes the file.
+        """
+        if self.filename is None or len(self.dirty) == 0:
+            return False
+        if (
+            not force
+            and len(self.dirty) < self.config.max_dirty_jobs
+            and time.time() - self.last_flush < self.config.flush_interval
+        ):
+            return False
+        entries: dict[str, dict] = {}
+        for hash_value in self.dirty:
+            job = self.jobs[hash_value]
+            entries[hash_value] = entry_of(job)
+            self.persisted[hash_value] = persisted_state_of(job)
+        self.dirty.clear()
+        self.last_flush = time.time()
+        self.check_before_write(self.filename, entries.keys())
+        self.store_of(self.filename).update(entries)
+        return True
+
+    def export_json(self, filename: str) -> None:
+        """export all the persisted jobs in the JSON format (the same as the snapshot)"""
+        assert self.filename is not None
+        self.update_file(self.filename)
+        self.store_of(self.filename).export_json(filename)
+
+
+def persisted_state_of(job: MonteCarloJob) -> tuple:
+    return (job.finished_shots, job.duration, job.min_time, job.finished_tasks)
+
+
+def entry_of(job: MonteCarloJob) -> dict:
+    return {
+        "args": [str(arg) for arg in job.args],
+        "kwargs": {key: str(value) for key, value in job.kwargs.items()},
+        "result": job.result.to_dict() if job.result is not None else None,
+        "shots": job.finished_shots,
+        "duration": job.duration,
+        "min_time": job.min_time,
+        "finished_tasks": job.finished_tasks,
+        "telemetry": job.telemetry.to_dict() if job.telemetry is not None else None,
+    }
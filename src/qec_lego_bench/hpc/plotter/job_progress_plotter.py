@@ -34,8 +34,8 @@ class JobProgressPlotter:
             column_headers.extend(["Errors", "Discards", "Panics", "Error Rate"])
         job_pending_futures_count = {job: 0 for job in executor}
         for future in executor.pending_futures:
-            job = executor.future_info[future]
-            job_pending_futures_count[job] += 1
+            for job in executor.jobs_of_future(future):
+                job_pending_futures_count[job] += 1
         for job in executor:
             if job.expecting_shots == 0:
                 row = [
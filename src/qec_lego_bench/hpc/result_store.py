@@ -0,0 +1,211 @@
+"""
+Persistent storage of the job entries
+
+Each entry is a JSON-compatible dict keyed by the job hash, holding the stringified `args` and
+`kwargs` for sanity check and the fields of the job (e.g. `result`, `shots`, `duration`).
+Updating an entry only overwrites the given fields, the same as `dict.update`.
+
+The journal store keeps the original JSON file (`filename`) as a snapshot and appends the updated
+entries to `filename + ".journal"` as JSON lines, so that each update costs O(updated jobs)
+instead of rewriting the whole file. Once the journal grows larger than the snapshot, it is
+compacted into the snapshot. Loading replays the journal on top of the snapshot.
+
+The SQLite store keeps one row per job hash and upserts only the given fields, so that many
+executors can merge their results into the same database incrementally. It is selected by the
+`.db`, `.sqlite` or `.sqlite3` extension of the filename; its journal mode is given by the
+`journal_mode` option of the executor and the job store.
+"""
+
+from typing import Iterable, Optional, Protocol
+import json
+import os
+import sys
+import portalocker
+import sqlite3
+
+# do not compact small journals: rewriting the snapshot is then more expensive than replaying
+COMPACT_MIN_BYTES = 1024 * 1024
+
+
+class ResultStore(Protocol):
+    # load the given entries (or all of them if `hashes` is None); missing ones are absent in the dict
+    def load(self, hashes: Optional[Iterable[str]] = None) -> dict[str, dict]: ...
+
+    def update(self, entries: dict[str, dict]) -> None: ...
+
+    def export_json(self, filename: str) -> None: ...
+
+
+def read_json_entries(filename: str) -> dict[str, dict]:
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, "r") as f:
+        content = f.read()
+    if content == "":
+        return {}
+    return json.loads(content)
+
+
+def write_json_entries(filename: str, entries: dict[str, dict]) -> None:
+    """atomically replace the JSON file such that readers never see a partial file"""
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp_filename, filename)
+
+
+class JournalResultStore:
+    def __init__(self, filename: str, compact_min_bytes: int = COMPACT_MIN_BYTES):
+        self.filename = filename
+        self.journal_filename = filename + ".journal"
+        self.compact_min_bytes = compact_min_bytes
+
+    def _replay(self, journal) -> dict[str, dict]:
+        entries = read_json_entries(self.filename)
+        journal.seek(0)
+        for line in journal:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a partially written record of a killed process
+                print(
+                    f"[warning] skip corrupted record in {self.journal_filename}",
+                    file=sys.stderr,
+                )
+                continue
+            entries.setdefault(record.pop("hash"), {}).update(record)
+        return entries
+
+    def load(self, hashes: Optional[Iterable[str]] = None) -> dict[str, dict]:
+        if not os.path.exists(self.journal_filename):
+            entries = read_json_entries(self.filename)
+        else:
+            with portalocker.Lock(self.journal_filename, "r") as journal:
+                entries = self._replay(journal)
+        if hashes is None:
+            return entries
+        return {
+            hash_value: entries[hash_value]
+            for hash_value in hashes
+            if hash_value in entries
+        }
+
+    def update(self, entries: dict[str, dict]) -> None:
+        if len(entries) == 0:
+            return
+        content = "".join(
+            json.dumps({"hash": hash_value, **entry}) + "\n"
+            for hash_value, entry in entries.items()
+        )
+        with portalocker.Lock(self.journal_filename, "a") as journal:
+            journal.write(content)
+            journal.flush()
+            journal_bytes = journal.tell()
+        snapshot_bytes = (
+            os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+        )
+        if journal_bytes > max(self.compact_min_bytes, snapshot_bytes):
+            self.compact()
+
+    def compact(self) -> None:
+        """merge the journal into the snapshot"""
+        with portalocker.Lock(self.journal_filename, "a+") as journal:
+            write_json_entries(self.filename, self._replay(journal))
+            journal.truncate(0)
+
+    def export_json(self, filename: str) -> None:
+        write_json_entries(filename, self.load())
+
+
+class SqliteResultStore:
+    """
+    One row per job hash. The JSON-valued fields (`args`, `kwargs` and `result`) are stored as text.
+    The default rollback journal (`journal_mode="DELETE"`) works on network file systems; on a local
+    disk, `journal_mode="WAL"` lets readers proceed while another process writes, but it requires
+    shared memory between the processes and thus fails on network file systems that lack it.
+    """
+
+    JSON_COLUMNS = ("args", "kwargs", "result", "telemetry")
+    VALUE_COLUMNS = ("shots", "duration", "min_time", "finished_tasks")
+    COLUMNS = JSON_COLUMNS + VALUE_COLUMNS
+
+    def __init__(
+        self, filename: str, journal_mode: str = "DELETE", timeout: float = 60
+    ):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename, timeout=timeout)
+        self.connection.execute(f"PRAGMA journal_mode={journal_mode}")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (hash TEXT PRIMARY KEY, args TEXT, kwargs TEXT, "
+                + "result TEXT, shots INTEGER, duration REAL, min_time REAL, finished_tasks INTEGER, "
+                + "telemetry TEXT)"
+            )
+            # databases created by older versions lack the newer columns
+            existing = {
+                row[1] for row in self.connection.execute("PRAGMA table_info(entries)")
+            }
+            if "telemetry" not in existing:
+                self.connection.execute("ALTER TABLE entries ADD COLUMN telemetry TEXT")
+
+    def _entry_of(self, row: tuple) -> dict:
+        entry: dict = {}
+        for column, value in zip(self.COLUMNS, row):
+            if column in self.JSON_COLUMNS:
+                if value is not None or column == "result":
+                    entry[column] = None if value is None else json.loads(value)
+            elif value is not None:
+                entry[column] = value
+        return entry
+
+    def load(self, hashes: Optional[Iterable[str]] = None) -> dict[str, dict]:
+        query = f"SELECT hash, {', '.join(self.COLUMNS)} FROM entries"
+        if hashes is None:
+            rows = self.connection.execute(query).fetchall()
+        else:
+            rows = []
+            for hash_value in hashes:  # each lookup uses the primary key index
+                rows += self.connection.execute(
+                    query + " WHERE hash = ?", (hash_value,)
+                ).fetchall()
+        return {row[0]: self._entry_of(row[1:]) for row in rows}
+
+    def update(self, entries: dict[str, dict]) -> None:
+        with self.connection:  # a single transaction
+            for hash_value, entry in entries.items():
+                columns = list(entry.keys())
+                for column in columns:
+                    assert column in self.COLUMNS, f"unknown field {column}"
+                values = [
+                    (
+                        json.dumps(entry[column])
+                        if column in self.JSON_COLUMNS and entry[column] is not None
+                        else entry[column]
+                    )
+                    for column in columns
+                ]
+                assignments = ", ".join(
+                    f"{column} = excluded.{column}" for column in columns
+                )
+                self.connection.execute(
+                    f"INSERT INTO entries (hash, {', '.join(columns)}) "
+                    + f"VALUES ({', '.join('?' * (len(columns) + 1))}) "
+                    + f"ON CONFLICT(hash) DO UPDATE SET {assignments}",
+                    [hash_value] + values,
+                )
+
+    def export_json(self, filename: str) -> None:
+        write_json_entries(filename, self.load())
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+
+def result_store_of(filename: str, journal_mode: str = "DELETE") -> ResultStore:
+    """`journal_mode` only applies to the SQLite store"""
+    if filename.endswith(SQLITE_EXTENSIONS):
+        return SqliteResultStore(filename, journal_mode=journal_mode)
+    return JournalResultStore(filename)
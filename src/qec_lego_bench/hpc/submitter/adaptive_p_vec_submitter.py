@@ -83,16 +83,17 @@ class AdaptivePVecSubmitter:
                 p: float = job["p"]
                 job_config: DotMap = job["config"]
                 i = self.ap_vec.i(p)
+                job_of_p = executor.jobs_of_p(config=job_config)
                 # first of all, let's make sure we submit more jobs to the lower side and the upper side
                 for parallel_i in range(i - self.parallel_p_count, i + 2):  # also i+1
                     parallel_p = self.ap_vec.p(parallel_i)
                     if parallel_p > self.ap_vec.p_upper:
                         continue
-                    parallel_job = executor.get_job(config=job_config, p=parallel_p)
-                    if parallel_job is None:
+                    if parallel_p not in job_of_p:
                         # create this job according to the `parallel_p_range` parameter
                         parallel_job = MonteCarloJob(config=job_config, p=parallel_p)
                         executor.add_job(parallel_job)
+                        job_of_p = executor.jobs_of_p(config=job_config)
                 # then, let's try to make the trusted job to reach the target precision, if time permits
                 if job.duration >= self.time_limit:
                     # don't spend time on this anymore
@@ -129,43 +130,46 @@ class AdaptivePVec:
     def biased_p_center(self) -> float:
         return self.p(self.p_bias)
 
-    # find the index vector for a given config in an executor
+    # the jobs of a given config in an executor keyed by their index; a job is only indexed if its
+    # `p` is exactly the value given by `self.p`, the same as looking it up by `executor.get_job`
+    def job_of_i(
+        self, executor: MonteCarloJobExecutor, config: DotMap
+    ) -> dict[int, MonteCarloJob]:
+        job_of_i = {}
+        for p, job in executor.jobs_of_p(config=config).items():
+            i = self.i(p)
+            if self.p(i) == p:
+                job_of_i[i] = job
+        return job_of_i
+
+    # find the index vector for a given config in an executor: the indices are searched from the
+    # biased center towards both sides until there are `searching_for` consecutive missing indices
     def i_vec(
-        self, executor: MonteCarloJobExecutor, config: DotMap, searching_for: int = 20
+        self,
+        executor: MonteCarloJobExecutor,
+        config: DotMap,
+        searching_for: int = 20,
+        job_of_i: Optional[dict[int, MonteCarloJob]] = None,
     ) -> list[int]:
-        assert (
-            executor.get_job(p=self.biased_p_center, config=config) is not None
-        ), "biased_p_center should exist in the executor"
+        if job_of_i is None:
+            job_of_i = self.job_of_i(executor, config)
+        assert self.p_bias in job_of_i, "biased_p_center should exist in the executor"
         assert searching_for > 0
         i_vec = [self.p_bias]
         # first find the lower side
-        lower_i = self.p_bias - 1
-        while True:
-            found = False
-            for i in range(lower_i, lower_i - searching_for, -1):
-                p = self.p(i)
-                if executor.get_job(p=p, config=config) is not None:
-                    i_vec.append(i)
-                    lower_i = i - 1
-                    found = True
-                    break
-            if not found:
+        last_i = self.p_bias
+        for i in sorted((i for i in job_of_i if i < self.p_bias), reverse=True):
+            if last_i - i > searching_for:
                 break
+            i_vec.append(i)
+            last_i = i
         # then search the upper side
-        upper_i = self.p_bias + 1
-        while True:
-            found = False
-            for i in range(upper_i, upper_i + searching_for):
-                p = self.p(i)
-                if p > self.p_upper:
-                    break
-                if executor.get_job(p=p, config=config) is not None:
-                    i_vec.append(i)
-                    upper_i = i + 1
-                    found = True
-                    break
-            if not found:
+        last_i = self.p_bias
+        for i in sorted(i for i in job_of_i if i > self.p_bias):
+            if i - last_i > searching_for or self.p(i) > self.p_upper:
                 break
+            i_vec.append(i)
+            last_i = i
         i_vec.sort()
         return i_vec
 
@@ -179,7 +183,8 @@ class AdaptivePVec:
     def jobs(
         self, executor: MonteCarloJobExecutor, config: DotMap, searching_for: int = 20
     ) -> list[MonteCarloJob]:
+        job_of_i = self.job_of_i(executor, config)
         return [
-            executor.get_job_assert(p=p, config=config)
-            for p in self.p_vec(executor, config, searching_for)
+            job_of_i[i]
+            for i in self.i_vec(executor, config, searching_for, job_of_i=job_of_i)
         ]
@@ -1,6 +1,10 @@
 import arguably
 import sinter
+from itertools import zip_longest
+from typing import Iterator
 from qec_lego_bench.stats import Stats
+from qec_lego_bench.misc.logical_errors import LogicalErrorCounter
+import numpy as np
 import os
 
 
@@ -16,17 +20,36 @@ def read_01(filepath: str) -> list[tuple[int, ...]]:
     return result
 
 
+def iter_01_chunks(filepath: str, chunk_lines: int = 2**16) -> Iterator[np.ndarray]:
+    """read the same format as `read_01` but lazily, as arrays of at most `chunk_lines` rows"""
+    rows: list[list[int]] = []
+    with open(filepath) as f:
+        for line in f:
+            line = line.strip("\r\n ")
+            if line.startswith("#") or line == "":
+                continue
+            rows.append([int(e) for e in line.split(" ")])
+            if len(rows) == chunk_lines:
+                yield np.array(rows, dtype=np.int64)
+                rows = []
+    if len(rows) > 0:
+        yield np.array(rows, dtype=np.int64)
+
+
 @arguably.command
 def compare_01(file1: str, file2: str):
     assert os.path.exists(file1)
     assert os.path.exists(file2)
-    data1 = read_01(file1)
-    data2 = read_01(file2)
-    assert len(data1) == len(data2)
-    shots = len(data1)
-    errors = 0
-    for v1, v2 in zip(data1, data2):
-        if v1 != v2:
-            errors += 1
+    counter: LogicalErrorCounter | None = None
+    for chunk1, chunk2 in zip_longest(iter_01_chunks(file1), iter_01_chunks(file2)):
+        assert chunk1 is not None and chunk2 is not None
+        assert len(chunk1) == len(chunk2)
+        if counter is None:
+            counter = LogicalErrorCounter(num_obs=chunk1.shape[1])
+        counter.add_unpacked(chunk1, chunk2)
+    shots = 0 if counter is None else counter.shots
+    errors = 0 if counter is None else counter.errors
     stats = Stats(sinter.AnonTaskStats(shots=shots, errors=errors))
     print(stats)
+    if counter is not None and counter.num_obs > 1:
+        print("errors per observable:", counter.observable_errors.tolist())
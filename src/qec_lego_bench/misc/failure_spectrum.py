@@ -0,0 +1,179 @@
+"""
+Stratified sampling of a detector error model by fault weight
+
+The error mechanisms of a DEM fire independently, each with probability p_i. Given that exactly
+w of them fire, the probability of a particular set S of mechanisms is proportional to the product
+of the odds r_i = p_i / (1 - p_i) over S. This conditional distribution is invariant if all the
+odds are multiplied by the same factor, and thus the conditional failure rate f(w) of a decoder
+does not depend on that factor. When the noise model scales all the probabilities with p (so that
+the odds scale approximately as p / p_ref for small p), the logical error rate of the whole p
+sweep is rebuilt from a single set of f(w) estimates:
+
+    pL(p) = sum_w P_p(W = w) f(w)
+
+where P_p(W = w) is the Poisson binomial distribution of the number of faults. At low p only a
+few weights contribute, and each f(w) is large enough to be estimated with few shots.
+
+The conditional sampling walks the mechanisms in order, keeping each one with probability
+r_i e_{k-1}(r_{i+1..}) / e_k(r_{i..}), where e_k is the elementary symmetric polynomial of the
+remaining odds and k is the number of faults still to place. The walk is vectorized over shots.
+Drawing the number of faults of each shot from P(W = w) first and then the faults conditioned on
+it samples the DEM itself, while recording the number of faults of every shot; such samples at a
+reference p can be reweighted to the neighboring p values.
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional
+import numpy as np
+import stim
+
+
+@dataclass
+class FaultWeightSampler:
+    # the probability of each error mechanism
+    probabilities: np.ndarray
+    # the bit packed detectors and observables flipped by each error mechanism
+    dets: np.ndarray
+    obs: np.ndarray
+    num_detectors: int
+    num_observables: int
+    # the table of the elementary symmetric polynomials of each weight, computed once
+    tables: dict[int, np.ndarray] = field(default_factory=dict, repr=False)
+
+    @staticmethod
+    def from_dem(dem: stim.DetectorErrorModel) -> "FaultWeightSampler":
+        probabilities: list[float] = []
+        detector_rows: list[np.ndarray] = []
+        observable_rows: list[np.ndarray] = []
+        for instruction in dem.flattened():
+            if instruction.type != "error":
+                continue
+            detectors = np.zeros(dem.num_detectors, dtype=np.uint8)
+            observables = np.zeros(dem.num_observables, dtype=np.uint8)
+            for target in instruction.targets_copy():
+                # the decomposition separators do not change the symptom of the mechanism
+                if target.is_relative_detector_id():
+                    detectors[target.val] ^= 1
+                elif target.is_logical_observable_id():
+                    observables[target.val] ^= 1
+            probabilities.append(instruction.args_copy()[0])
+            detector_rows.append(detectors)
+            observable_rows.append(observables)
+        num_mechanisms = len(probabilities)
+
+        def packed(rows: list[np.ndarray], num_bits: int) -> np.ndarray:
+            if num_mechanisms == 0:
+                return np.zeros((0, (num_bits + 7) // 8), dtype=np.uint8)
+            return np.packbits(np.array(rows), axis=1, bitorder="little")
+
+        return FaultWeightSampler(
+            probabilities=np.array(probabilities, dtype=np.float64),
+            dets=packed(detector_rows, dem.num_detectors),
+            obs=packed(observable_rows, dem.num_observables),
+            num_detectors=dem.num_detectors,
+            num_observables=dem.num_observables,
+        )
+
+    @property
+    def num_mechanisms(self) -> int:
+        return len(self.probabilities)
+
+    @property
+    def odds(self) -> np.ndarray:
+        return self.probabilities / (1 - self.probabilities)
+
+    def weight_probabilities(self, max_weight: int, scale: float = 1.0) -> np.ndarray:
+        """
+        P(W = w) for w = 0..max_weight when the odds of every mechanism are multiplied by `scale`
+        (approximately p / p_ref); the remaining mass 1 - sum is the truncated tail
+        """
+        odds = self.odds * scale
+        probabilities = odds / (1 + odds)
+        distribution = np.zeros(max_weight + 1)
+        distribution[0] = 1
+        for probability in probabilities:
+            distribution[1:] = (
+                distribution[1:] * (1 - probability) + distribution[:-1] * probability
+            )
+            distribution[0] *= 1 - probability
+        return distribution
+
+    def max_weight(self, tail: float = 1e-12) -> int:
+        """a weight above which the total probability is negligible"""
+        mean = float(self.probabilities.sum())
+        std = float(np.sqrt(np.sum(self.probabilities * (1 - self.probabilities))))
+        max_weight = min(self.num_mechanisms, int(np.ceil(mean + 10 * std)) + 10)
+        while max_weight < self.num_mechanisms:
+            if 1 - self.weight_probabilities(max_weight).sum() <= tail:
+                break
+            max_weight = min(self.num_mechanisms, 2 * max_weight)
+        return max_weight
+
+    def sample_weights(
+        self, shots: int, rng: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+        """the number of faults of each shot when sampling the DEM itself"""
+        if rng is None:
+            rng = np.random.default_rng()
+        distribution = self.weight_probabilities(self.max_weight())
+        return rng.choice(
+            len(distribution), size=shots, p=distribution / distribution.sum()
+        )
+
+    def table_of(self, weight: int) -> np.ndarray:
+        """
+        table[k, i] = e_k(r_i, ..., r_{N-1}) for k = 0..weight, with the odds normalized to sum to
+        `weight` so that the table neither overflows nor underflows
+        """
+        if weight not in self.tables:
+            odds = self.odds
+            odds = odds * (weight / max(odds.sum(), np.finfo(np.float64).tiny))
+            table = np.zeros((weight + 1, self.num_mechanisms + 1))
+            table[0, :] = 1
+            for i in reversed(range(self.num_mechanisms)):
+                table[1:, i] = table[1:, i + 1] + odds[i] * table[:-1, i + 1]
+            self.tables[weight] = table
+        return self.tables[weight]
+
+    def sample_faults(
+        self, weight: int, shots: int, rng: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+        """the indices of the mechanisms that fire in each shot, of shape (shots, weight)"""
+        assert (
+            0 <= weight <= self.num_mechanisms
+        ), f"cannot place {weight} faults on {self.num_mechanisms} error mechanisms"
+        if rng is None:
+            rng = np.random.default_rng()
+        faults = np.zeros((shots, weight), dtype=np.int64)
+        if weight == 0 or shots == 0:
+            return faults
+        table = self.table_of(weight)
+        odds = self.odds * (weight / self.odds.sum())
+        remaining = np.full(shots, weight, dtype=np.int64)
+        for i in range(self.num_mechanisms):
+            # keep_probability[k] is the probability of keeping mechanism i with k faults to place
+            keep_probability = np.zeros(weight + 1)
+            np.divide(
+                odds[i] * table[:-1, i + 1],
+                table[1:, i],
+                out=keep_probability[1:],
+                where=table[1:, i] > 0,
+            )
+            keep = rng.random(shots) < keep_probability[remaining]
+            rows = np.flatnonzero(keep)
+            faults[rows, weight - remaining[rows]] = i
+            remaining[rows] -= 1
+        assert np.all(remaining == 0)
+        return faults
+
+    def sample(
+        self, weight: int, shots: int, rng: Optional[np.random.Generator] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """the bit packed detection events and observable flips of shots with exactly `weight` faults"""
+        faults = self.sample_faults(weight, shots, rng)
+        dets = np.zeros((shots, self.dets.shape[1]), dtype=np.uint8)
+        obs = np.zeros((shots, self.obs.shape[1]), dtype=np.uint8)
+        for j in range(weight):
+            dets ^= self.dets[faults[:, j]]
+            obs ^= self.obs[faults[:, j]]
+        return dets, obs
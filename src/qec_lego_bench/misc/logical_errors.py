@@ -0,0 +1,76 @@
+"""
+Chunked counting of logical errors
+
+The observables and the predictions are compared chunk by chunk (memory mapped when they are in
+files), so the peak memory is bounded by the chunk size regardless of the number of shots.
+Bit packed rows are XORed byte-wise and a shot is a logical error if any byte is nonzero; only
+the failed shots are unpacked to count the errors of each observable.
+"""
+
+from dataclasses import dataclass, field
+import numpy as np
+
+DEFAULT_COUNT_CHUNK_SHOTS = 2**20
+
+
+@dataclass
+class LogicalErrorCounter:
+    num_obs: int
+    shots: int = 0
+    errors: int = 0
+    # the number of shots in which each observable is mispredicted
+    observable_errors: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.observable_errors = np.zeros(self.num_obs, dtype=np.int64)
+
+    def add_bit_packed(self, obs: np.ndarray, predicts: np.ndarray):
+        """add a chunk of bit packed (little endian) shots, each of shape (shots, (num_obs + 7) // 8)"""
+        assert obs.shape == predicts.shape
+        diff = np.bitwise_xor(obs, predicts)
+        failed = diff[np.any(diff, axis=1)]
+        self.shots += obs.shape[0]
+        self.errors += failed.shape[0]
+        if failed.shape[0] > 0:
+            self.observable_errors += np.count_nonzero(
+                np.unpackbits(failed, axis=1, count=self.num_obs, bitorder="little"),
+                axis=0,
+            )
+
+    def add_unpacked(self, obs: np.ndarray, predicts: np.ndarray):
+        """add a chunk of shots with one value per observable, each of shape (shots, num_obs)"""
+        assert obs.shape == predicts.shape
+        diff = obs != predicts
+        self.shots += obs.shape[0]
+        self.errors += int(np.count_nonzero(np.any(diff, axis=1)))
+        self.observable_errors += np.count_nonzero(diff, axis=0)
+
+
+def count_bit_packed_errors(
+    obs: np.ndarray,
+    predicts: np.ndarray,
+    num_obs: int,
+    chunk_shots: int = DEFAULT_COUNT_CHUNK_SHOTS,
+) -> LogicalErrorCounter:
+    """count the errors of bit packed arrays (or memory maps) in chunks"""
+    counter = LogicalErrorCounter(num_obs=num_obs)
+    for start in range(0, predicts.shape[0], chunk_shots):
+        end = min(start + chunk_shots, predicts.shape[0])
+        counter.add_bit_packed(obs[start:end], predicts[start:end])
+    return counter
+
+
+def count_b8_file_errors(
+    obs_filename: str,
+    predicts_filename: str,
+    num_shots: int,
+    num_obs: int,
+    chunk_shots: int = DEFAULT_COUNT_CHUNK_SHOTS,
+) -> LogicalErrorCounter:
+    """count the errors of the first `num_shots` shots of two b8 files without loading them"""
+    if num_shots == 0:
+        return LogicalErrorCounter(num_obs=num_obs)
+    shape = (num_shots, (num_obs + 7) // 8)
+    obs = np.memmap(obs_filename, dtype=np.uint8, mode="r", shape=shape)
+    predicts = np.memmap(predicts_filename, dtype=np.uint8, mode="r", shape=shape)
+    return count_bit_packed_errors(obs, predicts, num_obs, chunk_shots)
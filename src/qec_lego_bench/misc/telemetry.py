@@ -0,0 +1,160 @@
+"""
+Per-task resource telemetry
+
+`measured_task` records the wall time, the peak memory growth and the page faults of a task,
+together with the time spent in each phase. The phases are reported by the library code through
+`phase` / `record_phase` (e.g. "circuit", "dem", "sampling" and "decoding"); they are only
+recorded inside `measured_task` and cost nothing otherwise. The phases are tracked per thread
+(context), so that tasks running in different threads of the same Dask worker do not mix. The peak
+memory, however, is process-wide: it is only reported for a task that ran alone in its process,
+and is 0 ("unknown") for the tasks that overlapped with another measured task.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from dataclasses_json import dataclass_json
+from typing import Iterator, Optional
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # e.g. on Windows
+    resource = None  # type: ignore
+
+_phases: ContextVar[Optional[dict[str, float]]] = ContextVar("phases", default=None)
+
+
+class _ActiveTask:
+    # whether another measured task ran in this process at the same time
+    concurrent: bool = False
+
+
+# the measured tasks that are running in this process
+_active_tasks: list[_ActiveTask] = []
+_active_tasks_lock = threading.Lock()
+
+
+@dataclass_json(undefined="RAISE")
+@dataclass
+class TaskTelemetry:
+    # the wall clock time, in contrast to the thread time recorded as the duration of the job
+    wall_time: float = 0
+    # the peak resident memory of the worker process during the task minus the resident memory at
+    # its start, in bytes; 0 if unknown because the peak cannot be reset (other than Linux), since
+    # the peak since the process started says nothing about the task, or because another task ran
+    # in the same process (e.g. a multi-threaded Dask worker) and shared the peak
+    peak_rss: int = 0
+    # the resident memory of the worker process at the start of the task in bytes, including the
+    # warm caches (e.g. the decoder pool) that the task reuses instead of growing them again
+    baseline_rss: int = 0
+    minor_page_faults: int = 0
+    major_page_faults: int = 0
+    # the time spent in each phase of the tasks
+    phases: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def peak_memory(self) -> int:
+        """the peak resident memory of the worker process during the task, or 0 if unknown"""
+        if self.peak_rss == 0:
+            return 0
+        return self.baseline_rss + self.peak_rss
+
+    def __add__(self, other: "TaskTelemetry") -> "TaskTelemetry":
+        phases = dict(self.phases)
+        for name, seconds in other.phases.items():
+            phases[name] = phases.get(name, 0.0) + seconds
+        # keep the measurement of the task with the largest peak memory
+        peak = max(self, other, key=lambda telemetry: telemetry.peak_memory)
+        return TaskTelemetry(
+            wall_time=self.wall_time + other.wall_time,
+            peak_rss=peak.peak_rss,
+            baseline_rss=peak.baseline_rss,
+            minor_page_faults=self.minor_page_faults + other.minor_page_faults,
+            major_page_faults=self.major_page_faults + other.major_page_faults,
+            phases=phases,
+        )
+
+
+def record_phase(name: str, seconds: float) -> None:
+    phases = _phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def _reset_peak_rss() -> bool:
+    """reset the peak resident memory of this process to the current one (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _memory_status() -> tuple[int, int]:
+    """(resident memory, peak resident memory) of this process in bytes (Linux only)"""
+    rss, peak_rss = 0, 0
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak_rss = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return rss, peak_rss
+
+
+def _page_faults() -> tuple[int, int]:
+    """(minor page faults, major page faults)"""
+    if resource is None:
+        return 0, 0
+    # the page faults of this thread if supported, otherwise of the whole process
+    usage = resource.getrusage(getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF))
+    return usage.ru_minflt, usage.ru_majflt
+
+
+@contextmanager
+def measured_task() -> Iterator[TaskTelemetry]:
+    """the telemetry is filled in when the context exits"""
+    telemetry = TaskTelemetry()
+    phases: dict[str, float] = {}
+    token = _phases.set(phases)
+    task = _ActiveTask()
+    with _active_tasks_lock:
+        for other in _active_tasks:
+            other.concurrent = True
+            task.concurrent = True
+        _active_tasks.append(task)
+        # resetting the peak while another task runs would corrupt its measurement
+        peak_reset = not task.concurrent and _reset_peak_rss()
+        rss_before, _ = _memory_status()
+    minor_before, major_before = _page_faults()
+    start = time.perf_counter()
+    try:
+        yield telemetry
+    finally:
+        telemetry.wall_time = time.perf_counter() - start
+        minor_after, major_after = _page_faults()
+        with _active_tasks_lock:
+            _active_tasks.remove(task)
+            if peak_reset and not task.concurrent:
+                _, peak_rss = _memory_status()
+                telemetry.peak_rss = max(0, peak_rss - rss_before)
+                telemetry.baseline_rss = rss_before
+        telemetry.minor_page_faults = minor_after - minor_before
+        telemetry.major_page_faults = major_after - major_before
+        telemetry.phases = phases
+        _phases.reset(token)
@@ -10,8 +10,13 @@ from qec_lego_bench.hpc.monte_carlo import LogicalErrorResult
 from qec_lego_bench.hpc.monte_carlo import *
 from qec_lego_bench.hpc.submitter import *
 from qec_lego_bench.hpc.plotter import *
-from qec_lego_bench.cli.generate_samples import generate_samples, benchmark_samples
-import tempfile
+from qec_lego_bench.cli.generate_samples import sample_in_memory
+from qec_lego_bench.decoders.decoder_pool import decoder_pool
+from qec_lego_bench.decoders.ldpc_compiled import BpParameterSweep, LdpcCompiledDecoder
+from qec_lego_bench.misc.logical_errors import count_bit_packed_errors
+from qec_lego_bench.misc.telemetry import phase
+from qec_lego_bench.cache import LRUCache, dem_hash
+import stim
 from tqdm import tqdm
 from itertools import product
 import numpy as np
@@ -128,38 +133,98 @@ def default_json_filename(
     return f"{basename}.{slugify(str(code))}.{slugify(str(noise))}.{slugify(str(decoder))}.json"
 
 
+# the compiled decoders of the parameter sweeps, kept warm in the worker process across the tasks
+sweep_compiled_decoder_cache: LRUCache[tuple[str, str], LdpcCompiledDecoder] = LRUCache(
+    maxsize=8
+)
+# the decoders that do not support the parameter sweep, such that they are compiled only once
+# (through the decoder pool) instead of being compiled and discarded in every task
+not_sweepable_decoders: set[str] = set()
+
+
+def sweep_compiled_decoder_of(
+    decoder: str, dem: stim.DetectorErrorModel
+) -> LdpcCompiledDecoder | None:
+    """the compiled `ldpc` decoder whose parameters are swept in place, or None if not supported"""
+    if decoder in not_sweepable_decoders:
+        return None
+    key = (decoder, dem_hash(dem))
+    compiled = sweep_compiled_decoder_cache.get(key)
+    if compiled is not None:
+        return compiled
+    try:
+        compiled = DecoderCli(decoder)().compile_decoder_for_dem(dem=dem)
+    except NotImplementedError:
+        compiled = None
+    if not isinstance(compiled, LdpcCompiledDecoder):
+        not_sweepable_decoders.add(decoder)
+        return None
+    sweep_compiled_decoder_cache.put(key, compiled)
+    return compiled
+
+
 @dataclass
 class BPTunerMonteCarloFunction:
     max_iter_choices: list[int]
     ms_scaling_factor_choices: list[float]
+    # the number of parametrized decoders that decode the shared samples concurrently
+    # (only used when the decoder does not support the parameter sweep)
+    max_workers: int = 1
 
     def __call__(
         self, shots: int, code: str, noise: str, decoder: str, verbose: bool = False
     ) -> tuple[int, MultiDecoderLogicalErrorRates]:
 
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            filename = os.path.join(tmp_dir, "tmp")
-            generate_samples(
-                code=code,
-                filename=filename,
-                noise=noise,
-                shots=shots,
-                decoder="none",
-                no_print=not verbose,
-            )
-
+        # the circuit, DEM and sampler are cached in the worker process as well
+        with sample_in_memory(
+            code=code, noise=noise, shots=shots, decoder="none"
+        ) as samples:
             results: dict[str, LogicalErrorResult] = {}
-            for max_iter, ms_scaling_factor in tqdm(
-                product(self.max_iter_choices, self.ms_scaling_factor_choices),
-                disable=not verbose,
-            ):
-                parametrized_decoder: str = parametrized_decoder_of(
+            compiled = sweep_compiled_decoder_of(decoder, samples.dem)
+            if compiled is not None:
+                # a single decoder sharing the check matrices for all the combinations
+                sweep = BpParameterSweep(
+                    compiled, self.max_iter_choices, self.ms_scaling_factor_choices
+                )
+                with phase("decoding"):
+                    predictions = sweep.decode_shots_bit_packed(
+                        bit_packed_detection_event_data=samples.dets
+                    )
+                for max_iter, ms_scaling_factor in product(
+                    self.max_iter_choices, self.ms_scaling_factor_choices
+                ):
+                    counter = count_bit_packed_errors(
+                        samples.obs,
+                        predictions[(max_iter, ms_scaling_factor)],
+                        samples.circuit.num_observables,
+                    )
+                    parametrized_decoder: str = parametrized_decoder_of(
+                        decoder, max_iter=max_iter, ms_scaling_factor=ms_scaling_factor
+                    )
+                    results[parametrized_decoder] = LogicalErrorResult(
+                        errors=counter.errors
+                    )
+                return shots, MultiDecoderLogicalErrorRates(results=results)
+
+            # keep all the parametrized decoders warm in the worker process across the tasks
+            decoder_pool.reserve(
+                len(self.max_iter_choices) * len(self.ms_scaling_factor_choices)
+            )
+            parametrized_decoders: list[str] = [
+                parametrized_decoder_of(
                     decoder, max_iter=max_iter, ms_scaling_factor=ms_scaling_factor
                 )
-                # print(f"{parametrized_decoder}: ", end="")
-                result = benchmark_samples(
-                    filename=filename, decoder=parametrized_decoder, no_print=True
+                for max_iter, ms_scaling_factor in product(
+                    self.max_iter_choices, self.ms_scaling_factor_choices
                 )
+            ]
+            for parametrized_decoder, result in tqdm(
+                samples.benchmark_decoders(
+                    parametrized_decoders, max_workers=self.max_workers
+                ),
+                total=len(parametrized_decoders),
+                disable=not verbose,
+            ):
                 assert result.shots == shots
                 results[parametrized_decoder] = LogicalErrorResult(errors=result.errors)
 
@@ -10,8 +10,8 @@ from qec_lego_bench.hpc.monte_carlo import LogicalErrorResult
 from qec_lego_bench.hpc.monte_carlo import *
 from qec_lego_bench.hpc.submitter import *
 from qec_lego_bench.hpc.plotter import *
-from qec_lego_bench.cli.generate_samples import generate_samples, benchmark_samples
-import tempfile
+from qec_lego_bench.cli.generate_samples import sample_in_memory
+from qec_lego_bench.decoders.decoder_pool import decoder_pool
 from tqdm import tqdm
 import matplotlib as mpl
 from .common import *
@@ -115,43 +115,44 @@ def default_json_filename(
 @dataclass
 class CompareDecoderMonteCarloFunction:
     decoders: list[str]
+    # the number of decoders that decode the shared samples concurrently
+    max_workers: int = 1
 
     def __call__(
         self, shots: int, code: str, noise: str, verbose: bool = False
     ) -> tuple[int, MultiDecoderLogicalErrorRates]:
 
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            filename = os.path.join(tmp_dir, "tmp")
-
-            # check if any decoder requires decomposing errors, if so, use that decoder
-            representative_decoder: str = "none"
-            for decoder in self.decoders:
-                if decoder == split:
-                    continue
-                decoder_instance = DecoderCli(decoder)
-                if decoder_instance.decompose_errors:
-                    representative_decoder = decoder
-                    break
-
-            generate_samples(
-                code=code,
-                filename=filename,
-                noise=noise,
-                shots=shots,
-                decoder=representative_decoder,
-                no_print=not verbose,
-            )
-
+        # check if any decoder requires decomposing errors, if so, use that decoder
+        representative_decoder: str = "none"
+        for decoder in self.decoders:
+            if decoder == split:
+                continue
+            decoder_instance = DecoderCli(decoder)
+            if decoder_instance.decompose_errors:
+                representative_decoder = decoder
+                break
+
+        # keep all the decoders warm in the worker process across the tasks
+        decoder_pool.reserve(len(self.decoders))
+
+        # sample once in memory and share the arrays among all the decoders
+        with sample_in_memory(
+            code=code,
+            noise=noise,
+            shots=shots,
+            decoder=representative_decoder,
+        ) as samples:
             results: dict[str, LogicalErrorResult] = {}
-            for decoder in tqdm(self.decoders, disable=not verbose):
-                if decoder == split:
-                    continue
-                result = benchmark_samples(
-                    filename=filename,
-                    decoder=decoder,
-                    no_print=True,
+            decoders = [decoder for decoder in self.decoders if decoder != split]
+            for decoder, result in tqdm(
+                samples.benchmark_decoders(
+                    decoders,
+                    max_workers=self.max_workers,
                     remove_initialization_time=True,
-                )
+                ),
+                total=len(decoders),
+                disable=not verbose,
+            ):
                 assert result.shots == shots
                 results[decoder] = LogicalErrorResult(
                     errors=result.errors, elapsed=result.elapsed
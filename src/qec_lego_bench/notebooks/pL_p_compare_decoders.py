@@ -10,6 +10,11 @@ from qec_lego_bench.hpc.submitter import *
 from qec_lego_bench.hpc.plotter import *
 import matplotlib as mpl
 from .common import *
+from qec_lego_bench.hpc.failure_spectrum import (
+    FailureSpectrumResult,
+    failure_spectrum_sweep,
+    representative_decoder_of,
+)
 from functools import cached_property
 import matplotlib.colors as mcolors
 from cycler import cycler
@@ -158,6 +163,10 @@ class PlPCompareDecodersPlotter:
     codes: list[str]
     noises: list[str]
     p_key: str = "p"
+    # the results of `ReweightingMonteCarloFunction` are also reweighted to the p values within
+    # this ratio from the simulated one and plotted as a band around the simulated point
+    reweight_range: float = 2.0
+    reweight_points: int = 9
 
     hdisplay: display.DisplayHandle = field(
         default_factory=lambda: display.display("", display_id=True)
@@ -267,12 +276,17 @@ class PlPCompareDecodersPlotter:
                 err_vec = []
                 for job, p in job_vec:
                     x_vec.append(p)
-                    stats = Stats(
-                        stats=sinter.AnonTaskStats(
-                            shots=job.shots,
-                            errors=job.result.results[decoder].errors,  # type: ignore
-                        ),
-                    )
+                    result = job.result.results[decoder]  # type: ignore
+                    if isinstance(result, FailureSpectrumResult):
+                        # the errors of a failure spectrum are not counted over `job.shots`
+                        stats = result.stats_of(job)
+                    else:
+                        stats = Stats(
+                            stats=sinter.AnonTaskStats(
+                                shots=job.shots,
+                                errors=result.errors,
+                            ),
+                        )
                     y_vec.append(stats.failure_rate_value)
                     err_vec.append(stats.failure_rate_uncertainty)
                 ax.errorbar(
@@ -282,6 +296,30 @@ class PlPCompareDecodersPlotter:
                     color=color["color"],
                     marker=marker["marker"],
                 )
+                for job, p in job_vec:
+                    result = job.result.results[decoder]  # type: ignore
+                    if not isinstance(result, FailureSpectrumResult):
+                        continue
+                    scales = np.geomspace(
+                        1 / self.reweight_range, self.reweight_range, self.reweight_points
+                    )
+                    # the spectrum was sampled from the DEM of the representative decoder
+                    sampled_decoders = list(job.result.results.keys())  # type: ignore
+                    pL_vec = failure_spectrum_sweep(
+                        result,
+                        job["code"],
+                        job["noise"],
+                        scales,
+                        decoder=representative_decoder_of(sampled_decoders),
+                    )
+                    ax.fill_between(
+                        [p * scale for scale in scales],
+                        [max(pL.n - pL.s, 0) for pL in pL_vec],
+                        [pL.n + pL.s for pL in pL_vec],
+                        color=color["color"],
+                        alpha=0.15,
+                        linewidth=0,
+                    )
 
             legend_lines.append(Line2D([0], [0], color=color["color"]))
             label = f"{code}" + (f" ({noise})" if common_noise is None else "")
@@ -0,0 +1,42 @@
+import os
+import numpy as np
+from qec_lego_bench.cache import CACHE_DIR_ENV
+from qec_lego_bench.cli import circuit_cache
+from qec_lego_bench.cli.circuit_cache import (
+    cached_detector_error_model,
+    cached_detector_sampler,
+    cached_noisy_circuit,
+    noisy_circuit_of,
+)
+
+
+def test_circuit_cache():
+    args = ("rsc(d=3,p=0.01)", "depolarize(p=0.01)")
+    circuit = cached_noisy_circuit(*args)
+    assert circuit == noisy_circuit_of(*args)
+    assert cached_noisy_circuit(*args) is circuit
+    dem = cached_detector_error_model(*args, decompose_errors=True)
+    assert cached_detector_error_model(*args, decompose_errors=True) is dem
+    assert cached_detector_error_model(*args) is not dem
+    # the circuit and the DEM are persisted on disk
+    assert len(os.listdir(os.path.join(os.environ[CACHE_DIR_ENV], "circuits"))) == 3
+    circuit_cache.noisy_circuit_cache.clear()
+    circuit_cache.dem_cache.clear()
+    assert cached_noisy_circuit(*args) == circuit
+    assert cached_detector_error_model(*args, decompose_errors=True) == dem
+    # seeded samplers are never shared
+    samples = [
+        cached_detector_sampler(*args, seed=5).sample(100, bit_packed=True)
+        for _ in range(2)
+    ]
+    assert np.array_equal(samples[0], samples[1])
+    assert cached_detector_sampler(*args) is cached_detector_sampler(*args)
+
+
+def test_disk_cache_keyed_by_sources(monkeypatch):
+    key = ("rsc(d=3,p=0.01)", "depolarize(p=0.01)", "NoNoise", "NoNoise")
+    path = circuit_cache._disk_path_of(key, ".stim")
+    assert circuit_cache._disk_path_of(key, ".stim") == path
+    # an edit of the circuit-building sources changes the key even in a development install
+    monkeypatch.setattr(circuit_cache, "_circuit_sources_hash", "edited")
+    assert circuit_cache._disk_path_of(key, ".stim") != path
@@ -0,0 +1,99 @@
+import os
+import tempfile
+from qec_lego_bench.cli.generate_samples import (
+    SampleShardManifest,
+    benchmark_samples,
+    generate_samples,
+    sample_in_memory,
+    shard_shots_of,
+)
+from qec_lego_bench.decoders.decoder_pool import decoder_pool
+
+
+def test_shard_shots():
+    assert shard_shots_of(10, 3) == [4, 3, 3]
+    assert shard_shots_of(2, 4) == [1, 1, 0, 0]
+
+
+def test_sharded_generate_samples_is_deterministic():
+    kwargs = dict(noise="depolarize(p=0.01)", shots=1001, seed=3, workers=3)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        contents = []
+        for name in ["a", "b"]:
+            filename = os.path.join(tmp_dir, name)
+            generate_samples("rsc(d=3,p=0.01)", filename, no_print=True, **kwargs)  # type: ignore
+            contents.append(
+                [open(filename + ext, "rb").read() for ext in [".det.b8", ".obs.b8"]]
+            )
+        assert contents[0] == contents[1]
+        # the manifest lists the same shards that are otherwise concatenated
+        filename = os.path.join(tmp_dir, "m")
+        generate_samples("rsc(d=3,p=0.01)", filename, no_print=True, shard_manifest=True, **kwargs)  # type: ignore
+        with open(filename + ".shards.json") as f:
+            manifest = SampleShardManifest.from_json(f.read())  # type: ignore
+        assert sum(shard.shots for shard in manifest.shards) == 1001
+        det = b"".join(
+            open(os.path.join(tmp_dir, shard.det_filename), "rb").read()
+            for shard in manifest.shards
+        )
+        assert det == contents[0][0]
+
+
+def test_sharded_benchmark_samples_matches_single_process():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "tmp")
+        generate_samples(
+            "rsc(d=3,p=0.01)", filename, shots=1001, seed=4, decoder="fb", no_print=True
+        )
+        single = benchmark_samples(
+            filename, decoder="fb", predict_filename=filename + ".1.b8", no_print=True
+        )
+        sharded = benchmark_samples(
+            filename,
+            decoder="fb",
+            predict_filename=filename + ".3.b8",
+            no_print=True,
+            workers=3,
+        )
+        assert sharded.shots == single.shots == 1001
+        assert sharded.errors == single.errors
+        assert sharded.shard_elapsed is not None and len(sharded.shard_elapsed) == 3
+        with open(filename + ".1.b8", "rb") as f1, open(filename + ".3.b8", "rb") as f3:
+            assert f1.read() == f3.read()
+        empty = benchmark_samples(
+            filename, decoder="fb", max_shots=0, no_print=True, workers=3
+        )
+        assert (empty.shots, empty.errors, empty.shard_elapsed) == (0, 0, [])
+
+
+def test_benchmark_decoders_shares_the_samples():
+    decoders = ["fb", "bposd", "bposd(max_iter=5)"]
+    with sample_in_memory(
+        "rsc(d=3,p=0.02)", shots=2000, decoder="fb", seed=7
+    ) as samples:
+        sequential = dict(samples.benchmark_decoders(decoders))
+        concurrent = dict(samples.benchmark_decoders(decoders, max_workers=3))
+    assert set(concurrent.keys()) == set(decoders)
+    for decoder in decoders:
+        assert concurrent[decoder].shots == 2000
+        assert concurrent[decoder].errors == sequential[decoder].errors
+        assert concurrent[decoder].elapsed >= 0
+
+
+def test_benchmark_decoders_initialization_time(monkeypatch):
+    compiled_decoder_with_time = decoder_pool.compiled_decoder_with_time
+
+    def slow_compile(*args, **kwargs):
+        compiled, _ = compiled_decoder_with_time(*args, **kwargs)
+        return compiled, 100.0
+
+    monkeypatch.setattr(decoder_pool, "compiled_decoder_with_time", slow_compile)
+    decoders = ["fb", "bposd"]
+    with sample_in_memory("rsc(d=3,p=0.02)", shots=100, decoder="fb") as samples:
+        for max_workers in [1, 2]:
+            for decoder, result in samples.benchmark_decoders(decoders, max_workers):
+                assert result.elapsed >= 100
+            for decoder, result in samples.benchmark_decoders(
+                decoders, max_workers, remove_initialization_time=True
+            ):
+                assert result.elapsed < 100
@@ -0,0 +1,78 @@
+from qec_lego_bench.cli.circuit_cache import (
+    cached_detector_error_model,
+    cached_noisy_circuit,
+)
+from qec_lego_bench.cli.logical_error_rate import logical_error_rate
+from qec_lego_bench.cli.sequential_collect import (
+    BatchDecoder,
+    SequentialCollector,
+    sequential_collect,
+)
+
+code = "rsc(d=3,p=0.05)"
+noise = "depolarize(p=0.05)"
+
+
+def test_stop_at_max_errors():
+    stats = sequential_collect(
+        code, noise=noise, decoder="fb", max_shots=10**6, max_errors=50, seed=1
+    )
+    assert stats.errors >= 50
+    # the batches do not overshoot much once the error rate is known
+    assert stats.shots < 10**5
+    # deterministic given the seed
+    again = sequential_collect(
+        code, noise=noise, decoder="fb", max_shots=10**6, max_errors=50, seed=1
+    )
+    assert (again.shots, again.errors) == (stats.shots, stats.errors)
+
+
+def test_stop_at_relative_uncertainty():
+    stats = sequential_collect(
+        code,
+        noise=noise,
+        decoder="fb",
+        max_shots=10**6,
+        max_errors=10**6,
+        target_relative_uncertainty=0.3,
+        seed=2,
+    )
+    assert stats.relative_uncertainty <= 0.3
+    assert stats.shots < 10**6
+
+
+def test_max_shots_and_batch_sizes():
+    collector = SequentialCollector(max_shots=250, max_errors=10)
+    assert collector.next_batch_shots() == 100
+    assert collector.next_batch_shots(in_flight=200) == 50
+    # no noise, no errors
+    stats = sequential_collect(
+        "rsc(d=3,p=0)", decoder="fb", max_shots=1000, max_errors=10
+    )
+    assert (stats.shots, stats.errors) == (1000, 0)
+
+
+def test_multiple_workers():
+    stats = logical_error_rate(
+        code,
+        noise=noise,
+        decoder="fb",
+        max_shots=10**6,
+        max_errors=30,
+        num_workers=2,
+        no_progress=True,
+        no_print=True,
+    )
+    assert stats.errors >= 30
+
+
+def test_batch_decoder_via_files_is_seeded():
+    circuit = cached_noisy_circuit(code, noise)
+    dem = cached_detector_error_model(code, noise, decompose_errors=True)
+    compiled = BatchDecoder(circuit, dem, "fb", seed=3)
+    via_files = BatchDecoder(circuit, dem, "fb", seed=3)
+    via_files.compiled = None  # as a decoder that cannot be compiled
+    for shots in [100, 300]:
+        # the same samples, continuing the random stream of the sampler across the batches
+        expected, result = compiled.run(shots), via_files.run(shots)
+        assert (result.shots, result.errors) == (expected.shots, expected.errors)
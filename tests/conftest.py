@@ -7,4 +7,12 @@
     - https://docs.pytest.org/en/stable/writing_plugins.html
 """
 
-# import pytest
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path_factory, monkeypatch):
+    # keep the on-disk caches of the tests out of the user's cache directory
+    monkeypatch.setenv(
+        "QEC_LEGO_BENCH_CACHE_DIR", str(tmp_path_factory.mktemp("cache"))
+    )
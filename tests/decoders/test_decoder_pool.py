@@ -0,0 +1,107 @@
+import os
+import tempfile
+import numpy as np
+import stim
+from qec_lego_bench.cli.generate_samples import (
+    benchmark_samples,
+    generate_samples,
+    sample_in_memory,
+)
+from qec_lego_bench.cli.decoders import DecoderCli
+from qec_lego_bench.decoders.decoder_pool import (
+    DecoderPool,
+    decoder_pool,
+    writes_output_files,
+)
+
+
+def test_decoder_pool_matches_decode_via_files():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "tmp")
+        generate_samples(
+            "rsc(d=3,p=0.02)",
+            filename,
+            noise="depolarize(p=0.02)",
+            shots=200,
+            seed=1,
+            decoder="fb",
+            no_print=True,
+        )
+        decoder_pool.clear()
+        for decoder in ["bposd(max_iter=5)", "bplsd(max_iter=5)", "fb"]:
+            cold = benchmark_samples(
+                filename,
+                decoder=decoder,
+                predict_filename=filename + ".cold.b8",
+                no_print=True,
+                no_decoder_pool=True,
+            )
+            hits = decoder_pool.hits
+            for _ in range(2):
+                warm = benchmark_samples(
+                    filename,
+                    decoder=decoder,
+                    predict_filename=filename + ".warm.b8",
+                    no_print=True,
+                )
+            assert decoder_pool.hits == hits + 1
+            assert warm.errors == cold.errors
+            assert (
+                np.fromfile(filename + ".cold.b8", dtype=np.uint8)
+                == np.fromfile(filename + ".warm.b8", dtype=np.uint8)
+            ).all()
+
+
+def test_decoder_pool_eviction():
+    pool = DecoderPool(max_decoders=2)
+    decoder = DecoderCli("fb")()
+    for distance in [3, 5, 7]:
+        dem = stim.Circuit.generated(
+            "repetition_code:memory",
+            rounds=2,
+            distance=distance,
+            before_round_data_depolarization=0.01,
+        ).detector_error_model()
+        assert pool.compiled_decoder_for("fb", decoder, dem) is not None
+    assert len(pool) == 2
+    assert pool.misses == 3
+    none = DecoderCli("none")()
+    assert pool.compiled_decoder_for("none", none, dem) is not None
+    pool.reserve(4)
+    pool.reserve(3)
+    assert pool.max_decoders == 4
+
+
+def test_decoder_pool_skips_output_files():
+    pool = DecoderPool()
+    dem = stim.Circuit.generated(
+        "repetition_code:memory",
+        rounds=2,
+        distance=3,
+        before_round_data_depolarization=0.01,
+    ).detector_error_model()
+    decoder = DecoderCli("mwpf")()
+    decoder.trace_filename = "trace.json"
+    assert writes_output_files(decoder)
+    assert pool.compiled_decoder_for("mwpf", decoder, dem) is None
+    # decoded in a single call via files, without being marked as not compilable
+    assert pool.misses == 0 and len(pool.not_compilable) == 0
+    assert not writes_output_files(DecoderCli("mwpf")())
+
+
+def test_in_memory_samples_match_files():
+    samples = sample_in_memory(
+        "rsc(d=3,p=0.02)", noise="depolarize(p=0.02)", shots=300, seed=2, decoder="fb"
+    )
+    decoder = "bposd(max_iter=5)"
+    with samples:
+        in_memory = samples.benchmark(decoder)
+        filename = samples.files()
+        from_files = benchmark_samples(filename, decoder=decoder, no_print=True)
+        # decoders without a compiled decoder fall back to the files
+        decoder_pool.not_compilable.add(decoder)
+        fallback = samples.benchmark(decoder)
+        decoder_pool.clear()
+    assert in_memory.shots == from_files.shots == fallback.shots == 300
+    assert in_memory.errors == from_files.errors == fallback.errors
+    assert not os.path.exists(filename + ".stim")
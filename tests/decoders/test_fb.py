@@ -0,0 +1,84 @@
+import numpy as np
+import stim
+from qec_lego_bench.cache import CACHE_DIR_ENV
+from qec_lego_bench.decoders.fb import (
+    FusionBlossomDecoder,
+    build_fusion_blossom_graph,
+    fusion_blossom_graph_cache,
+    fusion_blossom_graph_of,
+)
+
+
+def noisy_surface_code_circuit() -> stim.Circuit:
+    return stim.Circuit.generated(
+        "surface_code:rotated_memory_x",
+        rounds=3,
+        distance=3,
+        after_clifford_depolarization=0.02,
+        before_measure_flip_probability=0.02,
+    )
+
+
+def test_fb_batch_decode_matches_single_shot_decode():
+    circuit = noisy_surface_code_circuit()
+    dem = circuit.detector_error_model(decompose_errors=True)
+    dets, obs = circuit.compile_detector_sampler(seed=123).sample(
+        200, bit_packed=True, separate_observables=True
+    )
+    compiled = FusionBlossomDecoder().compile_decoder_for_dem(dem=dem)
+    predictions = compiled.decode_shots_bit_packed(bit_packed_detection_event_data=dets)
+    assert predictions.shape == obs.shape
+    assert predictions.dtype == np.uint8
+    for shot in range(len(dets)):
+        single = compiled.decode_shots_bit_packed(
+            bit_packed_detection_event_data=dets[shot : shot + 1]
+        )
+        assert (single[0] == predictions[shot]).all()
+    # the decoder should correct most of the errors
+    errors = np.count_nonzero((predictions != obs).any(axis=1))
+    assert errors < len(dets) / 4
+
+
+def test_fb_decode_via_files_matches_compiled_decoder(tmp_path):
+    circuit = noisy_surface_code_circuit()
+    dem = circuit.detector_error_model(decompose_errors=True)
+    dem_path = tmp_path / "model.dem"
+    dem.to_file(dem_path)
+    dets_path = tmp_path / "dets.b8"
+    sampler = circuit.compile_detector_sampler(seed=456)
+    dets, _ = sampler.sample(100, bit_packed=True, separate_observables=True)
+    dets.tofile(dets_path)
+    decoder = FusionBlossomDecoder(chunk_shots=7)  # not a divisor of the shots
+    predictions_path = tmp_path / "predictions.b8"
+    decoder.decode_via_files(
+        num_shots=len(dets),
+        num_dets=dem.num_detectors,
+        num_obs=dem.num_observables,
+        dem_path=dem_path,
+        dets_b8_in_path=dets_path,
+        obs_predictions_b8_out_path=predictions_path,
+        tmp_dir=tmp_path,
+    )
+    predictions = np.fromfile(predictions_path, dtype=np.uint8).reshape(len(dets), -1)
+    compiled = decoder.compile_decoder_for_dem(dem=dem)
+    expected = compiled.decode_shots_bit_packed(bit_packed_detection_event_data=dets)
+    assert (predictions == expected).all()
+
+
+def test_fb_graph_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_ENV, str(tmp_path))
+    fusion_blossom_graph_cache.clear()
+    dem = noisy_surface_code_circuit().detector_error_model(decompose_errors=True)
+    graph = fusion_blossom_graph_of(dem)
+    assert fusion_blossom_graph_of(dem) is graph  # in-process hit
+    assert len(list((tmp_path / "fusion_blossom").glob("*.npz"))) == 1
+    fusion_blossom_graph_cache.clear()
+    loaded = fusion_blossom_graph_of(dem)  # on-disk hit
+    assert loaded is not graph
+    expected = build_fusion_blossom_graph(dem)
+    assert loaded.num_detectors == expected.num_detectors
+    assert (loaded.edges == expected.edges).all()
+    assert (loaded.weights == expected.weights).all()
+    assert (loaded.fault_masks == expected.fault_masks).all()
+    # a different weight resolution is a different graph
+    assert fusion_blossom_graph_of(dem, max_half_weight=1) is not loaded
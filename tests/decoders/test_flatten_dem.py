@@ -0,0 +1,48 @@
+import numpy as np
+import stim
+from qec_lego_bench.decoders.flatten_dem import flatten_dem
+
+
+def test_flatten_dem_matches_stim_error_order():
+    circuit = stim.Circuit.generated(
+        "surface_code:rotated_memory_z",
+        rounds=10,
+        distance=3,
+        after_clifford_depolarization=0.01,
+        before_measure_flip_probability=0.01,
+    )
+    dem = circuit.detector_error_model(decompose_errors=True)
+    assert any(isinstance(instruction, stim.DemRepeatBlock) for instruction in dem)
+    flattened = flatten_dem(dem, split_components=False)
+    assert flattened.num_errors == dem.num_errors == len(flattened)
+    # replay each error alone and compare the triggered detectors and observables
+    one_hot = np.eye(dem.num_errors, dtype=np.bool_)
+    dets, obs, _ = dem.compile_sampler().sample(
+        dem.num_errors, recorded_errors_to_replay=one_hot
+    )
+    for row in range(len(flattened)):
+        expected = np.zeros(dem.num_detectors, dtype=np.bool_)
+        np.logical_xor.at(expected, flattened.detectors_of(row), True)
+        assert (expected == dets[row]).all()
+        mask = sum(1 << int(k) for k in np.flatnonzero(obs[row]))
+        assert int(flattened.observable_masks[row]) == mask
+
+
+def test_flatten_dem_split_components():
+    dem = stim.DetectorErrorModel(
+        """
+        error(0.1) D0 D1 ^ D2 L0
+        REPEAT 3 {
+            error(0.2) D0
+            SHIFT_DETECTORS 1
+        }
+        detector D3
+        """
+    )
+    flattened = flatten_dem(dem)
+    assert flattened.num_errors == 4
+    assert len(flattened) == 5
+    assert flattened.detector_indptr.tolist() == [0, 2, 3, 4, 5, 6]
+    assert flattened.detector_indices.tolist() == [0, 1, 2, 0, 1, 2]
+    assert flattened.observable_masks.tolist() == [0, 1, 0, 0, 0]
+    assert flattened.error_indices.tolist() == [0, 0, 1, 2, 3]
@@ -0,0 +1,37 @@
+import numpy as np
+from qec_lego_bench.cli.decoders import DecoderCli
+from qec_lego_bench.cli.generate_samples import sample_in_memory
+from qec_lego_bench.decoders.ldpc_compiled import BpParameterSweep, check_matrices_of
+
+
+def test_bp_parameter_sweep_matches_independent_decoders():
+    max_iter_choices = [1, 3, 0]
+    ms_scaling_factor_choices = [0.5, 0.9]
+    with sample_in_memory(
+        "rsc(d=3,p=0.03)", shots=300, decoder="none", seed=11
+    ) as samples:
+        # the check matrices are shared by all the decoders of the DEM
+        assert check_matrices_of(samples.dem) is check_matrices_of(samples.dem)
+        compiled = DecoderCli("bposd")().compile_decoder_for_dem(dem=samples.dem)
+        original_max_iter = compiled.decoder.max_iter
+        sweep = BpParameterSweep(compiled, max_iter_choices, ms_scaling_factor_choices)
+        predictions = sweep.decode_shots_bit_packed(
+            bit_packed_detection_event_data=samples.dets
+        )
+        for max_iter in max_iter_choices:
+            for ms_scaling_factor in ms_scaling_factor_choices:
+                expected = (
+                    DecoderCli(
+                        f"bposd(max_iter={max_iter},ms_scaling_factor={ms_scaling_factor})"
+                    )()
+                    .compile_decoder_for_dem(dem=samples.dem)
+                    .decode_shots_bit_packed(
+                        bit_packed_detection_event_data=samples.dets
+                    )
+                )
+                assert np.array_equal(
+                    predictions[(max_iter, ms_scaling_factor)], expected
+                )
+        # the parameters of the compiled decoder are restored
+        assert compiled.decoder.max_iter == original_max_iter
+        assert compiled.decoder.ms_scaling_factor == 0.625
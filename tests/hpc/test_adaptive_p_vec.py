@@ -0,0 +1,31 @@
+from dotmap import DotMap
+from qec_lego_bench.hpc.monte_carlo import (
+    LogicalErrorResult,
+    MonteCarloJob,
+    MonteCarloJobExecutor,
+)
+from qec_lego_bench.hpc.submitter.adaptive_p_vec_submitter import AdaptivePVec
+
+
+def func(shots: int, p: float, config: DotMap):
+    return shots, LogicalErrorResult(errors=1)
+
+
+def test_i_vec_from_index():
+    ap_vec = AdaptivePVec(p_center=0.01, per10_p_count=5, p_upper=0.03)
+    config = DotMap(d=3)
+    other = DotMap(d=5)
+    # index 3 is beyond `p_upper` and -9 is too far from -3
+    indices = [-9, -3, -1, 0, 2, 3]
+    jobs = [MonteCarloJob(p=ap_vec.p(i), config=config) for i in indices]
+    executor = MonteCarloJobExecutor(func, jobs)
+    executor.add_job(MonteCarloJob(p=ap_vec.p(-2), config=other))
+    assert ap_vec.i_vec(executor, config, searching_for=3) == [-3, -1, 0, 2]
+    assert ap_vec.i_vec(executor, config, searching_for=10) == [-9, -3, -1, 0, 2]
+    # the index is kept up to date by `add_job`
+    executor.add_job(MonteCarloJob(p=ap_vec.p(-6), config=config))
+    assert ap_vec.p_vec(executor, config, searching_for=3) == [
+        ap_vec.p(i) for i in [-9, -6, -3, -1, 0, 2]
+    ]
+    assert ap_vec.jobs(executor, config, searching_for=3)[0] is jobs[0]
+    assert list(executor.jobs_of_p(config=other)) == [ap_vec.p(-2)]
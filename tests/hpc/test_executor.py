@@ -0,0 +1,104 @@
+import os
+import tempfile
+from distributed import Client, LocalCluster
+from qec_lego_bench.hpc.monte_carlo import (
+    LogicalErrorResult,
+    MonteCarloExecutorConfig,
+    MonteCarloJob,
+    MonteCarloJobExecutor,
+    MEMORY_RESOURCE,
+)
+from qec_lego_bench.misc.telemetry import TaskTelemetry
+
+
+def func(shots: int, p: float):
+    return shots, LogicalErrorResult(errors=shots // 10)
+
+
+def submitter(executor: MonteCarloJobExecutor):
+    return [
+        (job, 1000 - job.expecting_shots)
+        for job in executor
+        if job.expecting_shots < 1000
+    ]
+
+
+def test_batched_execute():
+    config = MonteCarloExecutorConfig(
+        min_shots_before_estimation=10,
+        min_multi_thread_duration=0,
+        harvest_batch_size=4,
+        harvest_timeout=0.05,
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir, LocalCluster(
+        processes=False, n_workers=1, threads_per_worker=2, dashboard_address=None
+    ) as cluster, Client(cluster) as client:
+        filename = os.path.join(tmp_dir, "results.json")
+        jobs = [MonteCarloJob(p=p) for p in [0.1, 0.2, 0.3]]
+        executor = MonteCarloJobExecutor(func, jobs, config=config, filename=filename)
+        executor.execute(client=client, submitter=submitter, timeout=60)
+        assert [job.shots for job in executor] == [1000] * 3
+        assert executor.num_jobs > 3
+        # the final flush persists every job
+        reloaded = MonteCarloJobExecutor(
+            func, [MonteCarloJob(p=p) for p in [0.1, 0.2, 0.3]], filename=filename
+        )
+        for job in reloaded:
+            assert job.shots == 1000
+            assert job.result == executor.get_job_assert(p=job["p"]).result
+            telemetry = executor.get_job_assert(p=job["p"]).telemetry
+            assert job.telemetry == telemetry and telemetry.wall_time > 0
+
+
+def test_packed_execute():
+    # every task is short enough to be packed
+    config = MonteCarloExecutorConfig(pack_time=60, max_pack_size=2)
+    with LocalCluster(
+        processes=False, n_workers=1, threads_per_worker=2, dashboard_address=None
+    ) as cluster, Client(cluster) as client:
+        jobs = [MonteCarloJob(p=p) for p in [0.1, 0.2, 0.3, 0.4, 0.5]]
+        executor = MonteCarloJobExecutor(func, jobs, config=config)
+        packed_tasks = []
+
+        def loop_callback(executor: MonteCarloJobExecutor):
+            packed_tasks.extend(executor.packed_info.values())
+
+        executor.execute(
+            client=client,
+            submitter=submitter,
+            timeout=60,
+            loop_callback=loop_callback,
+        )
+        assert [job.shots for job in executor] == [1000] * 5
+        assert all(job.finished_tasks > 1 for job in executor)
+        assert max(len(pack) for pack in packed_tasks) == 2
+
+
+def test_memory_routed_execute():
+    config = MonteCarloExecutorConfig(memory_resource=MEMORY_RESOURCE)
+    with LocalCluster(
+        processes=False,
+        n_workers=1,
+        threads_per_worker=2,
+        dashboard_address=None,
+        resources={MEMORY_RESOURCE: 2**50},
+    ) as cluster, Client(cluster) as client:
+        jobs = [MonteCarloJob(p=p) for p in [0.1, 0.2]]
+        executor = MonteCarloJobExecutor(func, jobs, config=config)
+        executor.execute(client=client, submitter=submitter, timeout=60)
+        assert [job.shots for job in executor] == [1000] * 2
+        assert executor._memory_levels(client) == [2**50]
+
+    gb = 1024**3
+    job = jobs[0]
+    job.telemetry = TaskTelemetry(peak_rss=2 * gb)
+    assert executor._memory_requirement(job, [4 * gb, 16 * gb]) == 4 * gb
+    job.telemetry = TaskTelemetry(peak_rss=3 * gb)
+    assert executor._memory_requirement(job, [4 * gb, 16 * gb]) == 16 * gb
+    assert executor._memory_requirement(job, [1 * gb]) == 1 * gb
+    assert executor._memory_requirement(job, []) is None
+    # the warm caches of the worker count even if the task itself hardly grows the memory
+    job.telemetry = TaskTelemetry(peak_rss=1, baseline_rss=3 * gb)
+    assert executor._memory_requirement(job, [4 * gb, 16 * gb]) == 16 * gb
+    job.telemetry = TaskTelemetry(peak_rss=0, baseline_rss=3 * gb)  # unknown
+    assert executor._memory_requirement(job, [4 * gb, 16 * gb]) is None
@@ -0,0 +1,92 @@
+import numpy as np
+import stim
+from qec_lego_bench.hpc.failure_spectrum import (
+    FailureSpectrumMonteCarloFunction,
+    FailureSpectrumResult,
+    MultiDecoderFailureSpectra,
+    ReweightingMonteCarloFunction,
+    failure_spectrum_sweep,
+    representative_decoder_of,
+)
+from qec_lego_bench.hpc.monte_carlo import MonteCarloJob
+from qec_lego_bench.misc.failure_spectrum import FaultWeightSampler
+
+
+def test_fault_weight_sampler():
+    dem = stim.DetectorErrorModel("""
+        error(0.1) D0 L0
+        error(0.2) D0 D1
+        error(0.05) D1
+        """)
+    sampler = FaultWeightSampler.from_dem(dem)
+    probabilities = sampler.weight_probabilities(3)
+    assert np.isclose(probabilities[0], 0.9 * 0.8 * 0.95)
+    assert np.isclose(probabilities.sum(), 1)
+    # P(S | w) is proportional to the product of the odds in S
+    faults = sampler.sample_faults(2, 20000, np.random.default_rng(0))
+    assert np.all(faults[:, 0] < faults[:, 1])
+    pairs, counts = np.unique(faults, axis=0, return_counts=True)
+    odds = sampler.odds
+    expected = np.array([odds[0] * odds[1], odds[0] * odds[2], odds[1] * odds[2]])
+    assert pairs.tolist() == [[0, 1], [0, 2], [1, 2]]
+    assert np.allclose(counts / 20000, expected / expected.sum(), atol=0.02)
+    dets, obs = sampler.sample(3, 5)
+    assert np.all(dets == 0) and np.all(obs == 1)
+
+
+def test_failure_spectrum():
+    function = FailureSpectrumMonteCarloFunction(weights=[1, 2, 3, 4])
+    shots, result = function(
+        2002, "rsc(d=3,p=0.001)", "none", "fb", rng=np.random.default_rng(0)
+    )
+    assert shots == 2002
+    assert result.shots == {1: 501, 2: 501, 3: 500, 4: 500}
+    # a distance-3 code corrects any single fault
+    assert result.failures[1] == 0
+    merged = result + result
+    assert merged.shots[1] == 1002
+    assert merged.failures[4] == 2 * result.failures[4]
+    assert FailureSpectrumResult.from_dict(merged.to_dict()) == merged
+    # deterministic given the seed
+    again = function(
+        2002, "rsc(d=3,p=0.001)", "none", "fb", rng=np.random.default_rng(0)
+    )[1]
+    assert again.failures == result.failures
+    pL_vec = failure_spectrum_sweep(
+        result, "rsc(d=3,p=0.001)", "none", [1, 0.5], decoder="fb"
+    )
+    # pL ~ p^2 below threshold
+    assert 0 < pL_vec[0].n < 1e-3
+    assert np.isclose(pL_vec[0].n / pL_vec[1].n, 4, rtol=0.2)
+    # the generic consumers see the rebuilt pL at the reference p
+    stats = result.stats_of(MonteCarloJob(code="rsc(d=3,p=0.001)"))
+    assert np.isclose(stats.failure_rate.n, pL_vec[0].n, rtol=0.01)
+    assert np.isclose(stats.failure_rate.s, pL_vec[0].s, rtol=0.05)
+    # the submitter sees the precision of the rebuilt pL, not the failures of the strata
+    assert result.errors < sum(result.failures.values())
+    assert merged.errors > result.errors
+
+
+def test_reweighting():
+    code = "rsc(d=3,p=0.02)"
+    function = ReweightingMonteCarloFunction(decoders=["fb", "bposd"])
+    shots, result = function(4000, code, "none", rng=np.random.default_rng(0))
+    merged = MultiDecoderFailureSpectra.from_dict((result + result).to_dict())
+    assert merged.results["fb"].shots == {
+        weight: 2 * value for weight, value in result.results["fb"].shots.items()
+    }
+    # all the decoders are reweighted with the DEM that the shots were sampled from
+    representative = representative_decoder_of(list(result.results.keys()))
+    assert representative == "fb"
+    for decoder in ["fb", "bposd"]:
+        spectrum = result.results[decoder]
+        # the same shots are decoded by all the decoders
+        assert spectrum.shots == result.results["fb"].shots
+        assert sum(spectrum.shots.values()) == shots
+        pL, pL_lower = failure_spectrum_sweep(
+            spectrum, code, "none", [1, 0.5], decoder=representative
+        )
+        # the reweighted pL at the reference p agrees with the direct estimate
+        direct = sum(spectrum.failures.values()) / shots
+        assert abs(pL.n - direct) < 0.2 * direct
+        assert pL_lower.n < pL.n
@@ -0,0 +1,30 @@
+from pathlib import Path
+from dotmap import DotMap
+from stablehash import stablehash
+from qec_lego_bench.hpc.job_store import JobParameters, job_hash_cache
+
+
+def test_memoized_job_hash():
+    def raw_hash(args: tuple, kwargs: dict) -> str:
+        ordered = tuple((key, kwargs[key]) for key in sorted(kwargs.keys()))
+        return stablehash((args, ordered)).hexdigest()
+
+    job_hash_cache.clear()
+    hits = job_hash_cache.hits
+    config = DotMap(code="rsc(d=3)", decoders=["fb", "none"], nested=DotMap(x=1.0))
+    values = [1, 1.0, True, 0.0, -0.0, (1,), [1], {"x": 1}, DotMap(x=1), config]
+    for _ in range(2):
+        for value in values:
+            kwargs = dict(p=0.01, config=value)
+            assert JobParameters(("a",), kwargs).hash == raw_hash(("a",), kwargs)
+    assert job_hash_cache.hits == hits + len(values)
+    # the cache key follows the content of a mutable config
+    config.nested.x = 2.0
+    kwargs = dict(p=0.01, config=config)
+    assert JobParameters(("a",), kwargs).hash == raw_hash(("a",), kwargs)
+
+    # values that cannot be frozen are hashed without the cache
+    size = len(job_hash_cache)
+    kwargs = dict(config=Path("a"))
+    assert JobParameters((), kwargs).hash == raw_hash((), kwargs)
+    assert len(job_hash_cache) == size
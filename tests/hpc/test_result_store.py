@@ -0,0 +1,156 @@
+import json
+import os
+import tempfile
+import pytest
+from qec_lego_bench.hpc.monte_carlo import (
+    LogicalErrorResult,
+    MonteCarloExecutorConfig,
+    MonteCarloJob,
+    MonteCarloJobExecutor,
+)
+from qec_lego_bench.hpc.job_store import Job, JobStore
+from qec_lego_bench.hpc.result_store import JournalResultStore, SqliteResultStore
+
+
+def func(shots: int, p: float):
+    return shots, LogicalErrorResult(errors=1)
+
+
+def test_journal_replay_and_compaction():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "results.json")
+        jobs = [MonteCarloJob(p=p) for p in [0.1, 0.2, 0.3]]
+        executor = MonteCarloJobExecutor(func, jobs, filename=filename)
+        for step in range(1, 4):
+            job = jobs[0]
+            job.finished_shots = step * 100
+            job.duration = step * 1.5
+            job.result = LogicalErrorResult(errors=step)
+            executor.update_file(filename)
+        # only the changed job is appended after the first update
+        with open(filename + ".journal") as f:
+            assert len(f.readlines()) == 3 + 2
+
+        reloaded = MonteCarloJobExecutor(
+            func, [MonteCarloJob(p=p) for p in [0.1, 0.2, 0.3]], filename=filename
+        )
+        job = reloaded.get_job_assert(p=0.1)
+        assert job.shots == 300 and job.duration == 4.5
+        assert job.result == LogicalErrorResult(errors=3)
+
+        # compaction keeps the same content in the original JSON format
+        store = JournalResultStore(filename)
+        before = store.load()
+        store.compact()
+        assert os.path.getsize(filename + ".journal") == 0
+        with open(filename) as f:
+            assert json.load(f) == before
+        exported = os.path.join(tmp_dir, "export.json")
+        reloaded.export_json(exported)
+        with open(exported) as f:
+            assert json.load(f) == before
+
+
+def test_sqlite_store_round_trip():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "results.db")
+        jobs = [MonteCarloJob(p=p) for p in [0.1, 0.2]]
+        executor = MonteCarloJobExecutor(func, jobs, filename=filename)
+        assert isinstance(executor.store, SqliteResultStore)
+        jobs[1].finished_shots = 100
+        jobs[1].result = LogicalErrorResult(errors=2)
+        executor.update_file(filename)
+
+        reloaded = MonteCarloJobExecutor(
+            func, [MonteCarloJob(p=p) for p in [0.1, 0.2]], filename=filename
+        )
+        job = reloaded.get_job_assert(p=0.2)
+        assert job.shots == 100 and job.result == LogicalErrorResult(errors=2)
+
+        # an update only overwrites the given fields
+        store = SqliteResultStore(filename)
+        store.update({job.hash: {"shots": 200}})
+        assert store.load([job.hash])[job.hash]["shots"] == 200
+        assert store.load([job.hash])[job.hash]["result"]["errors"] == 2
+        assert store.load(["missing"]) == {}
+        store.close()
+
+        job_store = JobStore(
+            lambda p: LogicalErrorResult(errors=int(p * 10)),
+            [Job(p=0.1), Job(p=0.2)],
+            result_type=LogicalErrorResult,
+            filename=os.path.join(tmp_dir, "jobs.sqlite"),
+        )
+        job_store.execute()
+        reloaded_store = JobStore(
+            func,
+            [Job(p=0.1), Job(p=0.2)],
+            result_type=LogicalErrorResult,
+            filename=os.path.join(tmp_dir, "jobs.sqlite"),
+        )
+        assert [job.result.errors for job in reloaded_store] == [1, 2]
+
+
+def test_flush_rate_limit():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "results.json")
+        jobs = [MonteCarloJob(p=p) for p in [0.1, 0.2, 0.3]]
+        config = MonteCarloExecutorConfig(flush_interval=3600, max_dirty_jobs=2)
+        executor = MonteCarloJobExecutor(func, jobs, config=config, filename=filename)
+        for index, job in enumerate(jobs):
+            job.finished_shots = 100
+            job.result = LogicalErrorResult(errors=index)
+            executor.dirty.add(job.hash)
+            # the first dirty job waits for the flush interval
+            assert executor.flush() == (index == 1)
+        assert executor.dirty == {jobs[2].hash}
+        assert executor.flush(force=True)
+        assert not executor.flush(force=True)
+        with open(filename + ".journal") as f:
+            assert len(f.readlines()) == 3
+        reloaded = MonteCarloJobExecutor(
+            func, [MonteCarloJob(p=p) for p in [0.1, 0.2, 0.3]], filename=filename
+        )
+        assert reloaded.get_job_assert(p=0.3).result == LogicalErrorResult(errors=2)
+
+
+def test_job_store_entries_and_hash_conflict():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "jobs.db")
+        job_store = JobStore(
+            func, [Job(p=0.1)], result_type=LogicalErrorResult, filename=filename
+        )
+        assert job_store.store.connection.execute("PRAGMA journal_mode").fetchone() == (
+            "delete",
+        )
+        # the jobs without a result are persisted as well
+        job_store.update_file(filename)
+        job = job_store.get_job_assert(p=0.1)
+        assert job_store.store.load()[job.hash]["result"] is None
+
+        wal_store = JobStore(
+            func,
+            [Job(p=0.2)],
+            result_type=LogicalErrorResult,
+            filename=os.path.join(tmp_dir, "wal.db"),
+            journal_mode="WAL",
+        )
+        assert wal_store.store.connection.execute("PRAGMA journal_mode").fetchone() == (
+            "wal",
+        )
+
+        # an entry of another job under the same hash is never overwritten
+        conflict = Job(p=0.3)
+        job_store.store.update({conflict.hash: {"args": [], "kwargs": {"p": "0.4"}}})
+        job_store.add_job(conflict, load_from_file=False)
+        conflict.result = LogicalErrorResult(errors=1)
+        with pytest.raises(AssertionError, match="Hash conflict"):
+            job_store.update_file(filename)
+
+        executor = MonteCarloJobExecutor(
+            func, [MonteCarloJob(p=0.3)], filename=os.path.join(tmp_dir, "results.db")
+        )
+        executor_job = executor.get_job_assert(p=0.3)
+        executor.store.update({executor_job.hash: {"args": [], "kwargs": {"p": "0.4"}}})
+        with pytest.raises(AssertionError, match="Hash conflict"):
+            executor.update_file(executor.filename)
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import numpy as np
+from qec_lego_bench.misc.compare_01 import compare_01
+from qec_lego_bench.misc.logical_errors import (
+    LogicalErrorCounter,
+    count_b8_file_errors,
+)
+
+
+def test_count_b8_file_errors():
+    rng = np.random.default_rng(1)
+    num_obs, shots = 11, 1000
+    obs = rng.random((shots, num_obs)) < 0.1
+    predicts = rng.random((shots, num_obs)) < 0.1
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        obs_filename = os.path.join(tmp_dir, "obs.b8")
+        predicts_filename = os.path.join(tmp_dir, "predicts.b8")
+        np.packbits(obs, axis=1, bitorder="little").tofile(obs_filename)
+        np.packbits(predicts, axis=1, bitorder="little").tofile(predicts_filename)
+        counter = count_b8_file_errors(
+            obs_filename, predicts_filename, 900, num_obs, chunk_shots=64
+        )
+    expected = LogicalErrorCounter(num_obs=num_obs)
+    expected.add_unpacked(obs[:900], predicts[:900])
+    assert counter.shots == expected.shots == 900
+    assert counter.errors == expected.errors
+    assert counter.observable_errors.tolist() == expected.observable_errors.tolist()
+
+
+def test_compare_01(capsys):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file1 = os.path.join(tmp_dir, "1.01")
+        file2 = os.path.join(tmp_dir, "2.01")
+        with open(file1, "w") as f:
+            f.write("# comment\n0 1\n1 1\n0 0\n")
+        with open(file2, "w") as f:
+            f.write("0 1\n1 0\n\n1 0\n")
+        compare_01(file1, file2)
+    out = capsys.readouterr().out
+    assert "2/3" in out
+    assert "errors per observable: [1, 1]" in out
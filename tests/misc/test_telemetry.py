@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from qec_lego_bench.cli.circuit_cache import noisy_circuit_cache, dem_cache
+from qec_lego_bench.cli.generate_samples import sample_in_memory
+import numpy as np
+from qec_lego_bench.misc.telemetry import (
+    TaskTelemetry,
+    _memory_status,
+    _reset_peak_rss,
+    measured_task,
+    record_phase,
+)
+
+
+def test_measured_task_phases():
+    noisy_circuit_cache.clear()
+    dem_cache.clear()
+    with measured_task() as telemetry:
+        with sample_in_memory(
+            "rsc(d=3,p=0.01)", noise="depolarize(p=0.01)", shots=100, decoder="fb"
+        ) as samples:
+            samples.benchmark("fb")
+    assert set(telemetry.phases.keys()) >= {"circuit", "dem", "sampling", "decoding"}
+    assert sum(telemetry.phases.values()) <= telemetry.wall_time
+    assert telemetry.peak_rss >= 0
+    # phases outside of a measured task are not recorded
+    record_phase("decoding", 1.0)
+    total = telemetry + TaskTelemetry(wall_time=1, phases={"decoding": 1.0})
+    assert total.phases["decoding"] == telemetry.phases["decoding"] + 1.0
+    assert TaskTelemetry.from_dict(total.to_dict()) == total
+
+
+def test_measured_task_peak_rss():
+    # the memory of the process before the task is not counted
+    with measured_task() as telemetry:
+        pass
+    assert telemetry.peak_rss < _memory_status()[0]
+    with measured_task() as telemetry:
+        array = np.ones(2**25, dtype=np.uint8)
+        del array
+    if _reset_peak_rss():
+        assert telemetry.peak_rss >= 2**24
+        assert telemetry.baseline_rss > 0
+        assert telemetry.peak_memory == telemetry.baseline_rss + telemetry.peak_rss
+        # the merged telemetry keeps the task with the largest peak memory
+        small = TaskTelemetry(peak_rss=1, baseline_rss=1)
+        assert (small + telemetry).peak_memory == telemetry.peak_memory
+    else:  # unknown
+        assert telemetry.peak_rss == 0
+
+
+def test_concurrent_tasks_peak_rss_unknown():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        barrier = threading.Barrier(2)
+
+        def task() -> TaskTelemetry:
+            with measured_task() as telemetry:
+                barrier.wait()
+                array = np.ones(2**25, dtype=np.uint8)
+                barrier.wait()
+                del array
+            return telemetry
+
+        telemetries = list(executor.map(lambda _: task(), range(2)))
+    # the peak memory is process-wide and cannot be attributed to either task
+    assert [telemetry.peak_rss for telemetry in telemetries] == [0, 0]
@@ -0,0 +1,42 @@
+import stim
+from qec_lego_bench.decoders.decoder_pool import decoder_pool
+from qec_lego_bench.notebooks import bp_tuner
+from qec_lego_bench.notebooks.bp_tuner import (
+    BPTunerMonteCarloFunction,
+    sweep_compiled_decoder_cache,
+)
+
+
+def test_bp_tuner_reuses_the_compiled_decoder():
+    sweep_compiled_decoder_cache.clear()
+    hits, misses = (
+        sweep_compiled_decoder_cache.hits,
+        sweep_compiled_decoder_cache.misses,
+    )
+    pool_misses = decoder_pool.misses
+    func = BPTunerMonteCarloFunction(
+        max_iter_choices=[5, 10], ms_scaling_factor_choices=[0.5]
+    )
+    for _ in range(2):
+        shots, result = func(100, "rsc(d=3,p=0.01)", "depolarize(p=0.01)", "bposd")
+        assert shots == 100 and len(result.results) == 2
+    # a single decoder is compiled for all the parameter combinations and kept warm
+    assert len(sweep_compiled_decoder_cache) == 1
+    assert sweep_compiled_decoder_cache.misses - misses == 1
+    assert sweep_compiled_decoder_cache.hits - hits == 1
+    assert decoder_pool.misses == pool_misses
+
+
+def test_bp_tuner_compiles_other_decoders_once(monkeypatch):
+    dem = stim.Circuit.generated(
+        "repetition_code:memory",
+        rounds=2,
+        distance=3,
+        before_round_data_depolarization=0.01,
+    ).detector_error_model()
+    bp_tuner.not_sweepable_decoders.discard("fb")
+    assert bp_tuner.sweep_compiled_decoder_of("fb", dem) is None
+    assert "fb" in bp_tuner.not_sweepable_decoders
+    # the later tasks fall back to the decoder pool without compiling the decoder again
+    monkeypatch.setattr(bp_tuner, "DecoderCli", None)
+    assert bp_tuner.sweep_compiled_decoder_of("fb", dem) is None